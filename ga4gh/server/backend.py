@@ -6,10 +6,21 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import array
+import collections
+import json
+import logging
+import re
+import struct
+import sys
+import threading
+import time
+
 import ga4gh.server.datamodel as datamodel
 import ga4gh.server.exceptions as exceptions
 import ga4gh.server.paging as paging
 import ga4gh.server.response_builder as response_builder
+import ga4gh.server.response_cache as response_cache
 
 import ga4gh.schemas.protocol as protocol
 
@@ -23,13 +34,92 @@ class Backend(object):
         self._requestValidation = False
         self._defaultPageSize = 100
         self._maxResponseLength = 2**20  # 1 MiB
+        self._maxBatchGetIds = 1000
         self._dataRepository = dataRepository
+        self._resultCache = paging.ResultCache()
+        self._continuationCache = paging.ContinuationCache()
+        self._readAheadSize = 0
+        self._readAheadSemaphore = threading.BoundedSemaphore(1)
+        self._reloadInterval = 0
+        self._lastReloadCheck = time.time()
+        self._reloadLock = threading.Lock()
+        self._reloadThread = None
+        self._requestState = threading.local()
+        self._responseCache = None
+        self._conversionPool = None
 
     def getDataRepository(self):
         """
-        Get the data repository used by this backend
+        Get the data repository used by this backend, which is the one
+        pinned by beginRequest while a request is running in this thread
+        """
+        dataRepository = getattr(
+            self._requestState, "dataRepository", None)
+        if dataRepository is None:
+            dataRepository = self._dataRepository
+        return dataRepository
+
+    def beginRequest(self):
+        """
+        Pins the current data repository for the request running in this
+        thread, so that a reload cannot swap it out part way through.
+        """
+        self._requestState.dataRepository = self._dataRepository
+
+    def endRequest(self):
+        """
+        Releases the data repository pinned by beginRequest.
+        """
+        self._requestState.dataRepository = None
+
+    def setDataRepositoryReloadInterval(self, reloadInterval):
+        """
+        Sets the number of seconds between checks for changes to the data
+        repository. An interval of zero disables reloading.
+        """
+        self._reloadInterval = reloadInterval
+
+    def checkDataRepository(self):
         """
-        return self._dataRepository
+        Starts a background thread replacing the data repository with a
+        reloaded copy if its stored contents have changed, checking at
+        most once per reload interval. Requests keep using the current
+        repository until the new one is ready.
+        """
+        if self._reloadInterval <= 0:
+            return
+        if time.time() - self._lastReloadCheck < self._reloadInterval:
+            return
+        # Only one thread reloads, and the others carry on meanwhile.
+        if not self._reloadLock.acquire(False):
+            return
+        self._lastReloadCheck = time.time()
+        try:
+            self._reloadThread = threading.Thread(
+                target=self._reloadDataRepository)
+            self._reloadThread.daemon = True
+            self._reloadThread.start()
+        except Exception:
+            self._reloadLock.release()
+            raise
+
+    def _reloadDataRepository(self):
+        """
+        Reloads the data repository if it has changed, and releases the
+        reload lock taken by checkDataRepository.
+        """
+        try:
+            if self._dataRepository.hasChanged():
+                self._dataRepository = self._dataRepository.reload()
+                self._resultCache.clear()
+                self._continuationCache.clear()
+                if self._responseCache is not None:
+                    self._responseCache.clear()
+        except Exception:
+            logging.getLogger(__name__).exception(
+                "Reloading the data repository failed")
+        finally:
+            self._reloadLock.release()
 
     def setRequestValidation(self, requestValidation):
         """
@@ -50,6 +140,95 @@ class Backend(object):
         """
         self._maxResponseLength = maxResponseLength
 
+    def setMaxBatchGetIds(self, maxBatchGetIds):
+        """
+        Sets the maximum number of IDs in a batch get request.
+        """
+        self._maxBatchGetIds = maxBatchGetIds
+
+    def setResultCacheSize(self, resultCacheSize):
+        """
+        Sets the number of search results kept for paging.
+        """
+        self._resultCache.setMaxSize(resultCacheSize)
+
+    def setResultCacheTimeToLive(self, resultCacheTimeToLive):
+        """
+        Sets the number of seconds for which search results are kept
+        for paging.
+        """
+        self._resultCache.setTimeToLive(resultCacheTimeToLive)
+
+    def setContinuationCacheSize(self, continuationCacheSize):
+        """
+        Sets the number of live search iterators kept for resuming at the
+        next page.
+        """
+        self._continuationCache.setMaxSize(continuationCacheSize)
+
+    def setContinuationCacheTimeToLive(self, continuationCacheTimeToLive):
+        """
+        Sets the number of seconds for which live search iterators are
+        kept.
+        """
+        self._continuationCache.setTimeToLive(continuationCacheTimeToLive)
+
+    def setReadAhead(self, readAheadSize, readAheadThreads):
+        """
+        Sets the number of objects which searches read ahead, in a
+        background thread, of the objects added to the response, and the
+        number of such threads which may run at once. Searches run when
+        all the threads are busy read no objects ahead. A size of zero
+        disables reading ahead.
+        """
+        if readAheadSize < 0:
+            raise ValueError("The read ahead size must not be negative")
+        if readAheadThreads < 1:
+            raise ValueError("There must be at least one read ahead thread")
+        self._readAheadSize = readAheadSize
+        self._readAheadSemaphore = threading.BoundedSemaphore(
+            readAheadThreads)
+
+    def setConversionPool(self, conversionPool):
+        """
+        Sets the conversion_pool.ConversionPool used to convert the
+        variants of searches, or None to convert them in this process.
+        """
+        self._conversionPool = conversionPool
+
+    def startConversionPool(self):
+        """
+        Starts the worker processes of the conversion pool, if there is
+        one, in this process. This is called when a server process starts,
+        before it handles any requests.
+        """
+        if self._conversionPool is not None:
+            self._conversionPool.start(self._dataRepository)
+
+    def stopConversionPool(self):
+        """
+        Stops the worker processes of the conversion pool started by this
+        process.
+        """
+        if self._conversionPool is not None:
+            self._conversionPool.close()
+
+    def setResponseCache(self, responseCache):
+        """
+        Sets the response_cache.ResponseCache used to store the responses
+        to search requests, or None to run every search.
+        """
+        self._responseCache = responseCache
+
+    def getResponseCacheStatistics(self):
+        """
+        Returns the statistics of the response cache, or None if there is
+        no response cache.
+        """
+        if self._responseCache is None:
+            return None
+        return self._responseCache.getStatistics()
+
     def startProfile(self):
         """
         Profiling hook. Called at the start of the runSearchRequest method
@@ -131,6 +310,22 @@ class Backend(object):
         return self._protocolObjectGenerator(
             request, len(objectList), lambda index: objectList[index])
 
+    def _getCachedResults(self, container, request, searchMethod):
+        """
+        Returns the ordered list of results of the specified request in
+        the specified container, which is searched for using the specified
+        method only when the results of the same request are not already
+        held for paging. The page token and size are not part of the key.
+        """
+        normalizedRequest = type(request)()
+        normalizedRequest.CopyFrom(request)
+        normalizedRequest.page_token = ""
+        normalizedRequest.page_size = 0
+        key = (
+            container.getId(), type(request).__name__,
+            normalizedRequest.SerializeToString())
+        return self._resultCache.getResults(key, searchMethod)
+
     def _objectListGenerator(self, request, objectList):
         """
         Returns a generator over the objects in the specified list using
@@ -157,9 +352,10 @@ class Backend(object):
         Returns a generator over the (dataset, nextPageToken) pairs
         defined by the specified request
         """
+        dataRepository = self.getDataRepository()
         return self._topLevelObjectGenerator(
-            request, self.getDataRepository().getNumDatasets(),
-            self.getDataRepository().getDatasetByIndex)
+            request, dataRepository.getNumDatasets(),
+            dataRepository.getDatasetByIndex)
 
     def biosamplesGenerator(self, request):
         dataset = self.getDataRepository().getDataset(request.dataset_id)
@@ -365,16 +561,98 @@ class Backend(object):
         """
         compoundId = datamodel.VariantSetCompoundId \
             .parse(request.variant_set_id)
-        dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
+        dataRepository = self.getDataRepository()
+        dataset = dataRepository.getDataset(compoundId.dataset_id)
         variantSet = dataset.getVariantSet(compoundId.variant_set_id)
+        if self._conversionPool is not None:
+            variantSet = self._conversionPool.getVariantSet(
+                dataRepository, variantSet)
         intervalIterator = paging.VariantsIntervalIterator(
             request, variantSet)
         return intervalIterator
 
-    def variantAnnotationsGenerator(self, request):
+    def variantRegionsGenerator(self, request, regions=[]):
+        """
+        Returns a generator over the (variant, nextPageToken) pairs of the
+        variants of the specified request overlapping the specified list
+        of region strings, in genomic order. The reference name, start and
+        end of the request are ignored.
+        """
+        regions = self._parseRegions(regions)
+        compoundId = datamodel.VariantSetCompoundId \
+            .parse(request.variant_set_id)
+        dataRepository = self.getDataRepository()
+        dataset = dataRepository.getDataset(compoundId.dataset_id)
+        variantSet = dataset.getVariantSet(compoundId.variant_set_id)
+        if self._conversionPool is not None:
+            variantSet = self._conversionPool.getVariantSet(
+                dataRepository, variantSet)
+        return paging.VariantRegionsIterator(request, variantSet, regions)
+
+    def _parseRegions(self, regions):
+        """
+        Returns the sorted list of disjoint (referenceName, start, end)
+        regions covering the specified list of region strings, which are
+        either 'referenceName:start-end' or the lines of a BED file. Both
+        use zero-based, half-open coordinates. Overlapping and adjacent
+        regions are merged, and references are sorted with their numbers
+        in numerical order.
+        """
+        parsedRegions = []
+        for region in regions:
+            region = region.rstrip("\r\n")
+            if region.startswith(("#", "track", "browser")):
+                continue
+            fields = region.split("\t")
+            if len(fields) < 3:
+                match = re.match(r"^(.+):(\d+)-(\d+)$", region)
+                fields = match.groups() if match is not None else []
+            try:
+                referenceName, start, end = (
+                    fields[0], int(fields[1]), int(fields[2]))
+            except (IndexError, ValueError):
+                raise exceptions.BadSearchOptionException("regions", region)
+            if start < 0 or end <= start:
+                raise exceptions.BadSearchOptionException("regions", region)
+            parsedRegions.append((referenceName, start, end))
+        if len(parsedRegions) == 0:
+            raise exceptions.BadSearchOptionException("regions", regions)
+
+        def getSortKey(region):
+            nameParts = [
+                int(part) if part.isdigit() else part
+                for part in re.split(r"(\d+)", region[0])]
+            return nameParts, region[1], region[2]
+        mergedRegions = []
+        for referenceName, start, end in sorted(
+                parsedRegions, key=getSortKey):
+            if len(mergedRegions) > 0 and (
+                    mergedRegions[-1][0] == referenceName and
+                    start <= mergedRegions[-1][2]):
+                mergedRegions[-1][2] = max(mergedRegions[-1][2], end)
+            else:
+                mergedRegions.append([referenceName, start, end])
+        return [tuple(mergedRegion) for mergedRegion in mergedRegions]
+
+    def variantSummariesGenerator(self, request):
+        """
+        Returns a generator over the (variantSummary, nextPageToken) pairs
+        defined by the specified SearchVariantsRequest.
+        """
+        compoundId = datamodel.VariantSetCompoundId \
+            .parse(request.variant_set_id)
+        dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
+        variantSet = dataset.getVariantSet(compoundId.variant_set_id)
+        return paging.VariantSummariesIntervalIterator(request, variantSet)
+
+    def variantAnnotationsGenerator(
+            self, request, includeDescendants=False, featureIds=[]):
         """
         Returns a generator over the (variantAnnotaitons, nextPageToken) pairs
-        defined by the specified request.
+        defined by the specified request. If includeDescendants is True,
+        the requested effects also match any of their descendants in the
+        sequence ontology. If featureIds is not empty, only the transcript
+        effects on the transcripts or genes with these IDs are returned.
         """
         compoundId = datamodel.VariantAnnotationSetCompoundId.parse(
             request.variant_annotation_set_id)
@@ -383,13 +661,18 @@ class Backend(object):
         variantAnnotationSet = variantSet.getVariantAnnotationSet(
             request.variant_annotation_set_id)
         iterator = paging.VariantAnnotationsIntervalIterator(
-            request, variantAnnotationSet)
+            request, variantAnnotationSet, includeDescendants, featureIds)
         return iterator
 
-    def featuresGenerator(self, request):
+    def featuresGenerator(
+            self, request, includeDescendants=False, namePrefix=""):
         """
         Returns a generator over the (features, nextPageToken) pairs
-        defined by the (JSON string) request.
+        defined by the (JSON string) request. If includeDescendants is
+        True, the full subtree of descendants of each matched feature
+        is returned along with it. If namePrefix is not empty, only
+        features with a name, gene name or transcript name starting with
+        it (ignoring case) are matched.
         """
         compoundId = None
         parentId = None
@@ -422,7 +705,7 @@ class Backend(object):
             compoundId.dataset_id)
         featureSet = dataset.getFeatureSet(compoundId.feature_set_id)
         iterator = paging.FeaturesIterator(
-            request, featureSet, parentId)
+            request, featureSet, parentId, includeDescendants, namePrefix)
         return iterator
 
     def phenotypesGenerator(self, request):
@@ -430,31 +713,32 @@ class Backend(object):
         Returns a generator over the (phenotypes, nextPageToken) pairs
         defined by the (JSON string) request
         """
-        # TODO make paging work using SPARQL?
         compoundId = datamodel.PhenotypeAssociationSetCompoundId.parse(
             request.phenotype_association_set_id)
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
         phenotypeAssociationSet = dataset.getPhenotypeAssociationSet(
             compoundId.phenotypeAssociationSetId)
-        associations = phenotypeAssociationSet.getAssociations(request)
-        phenotypes = [association.phenotype for association in associations]
-        return self._protocolListGenerator(
-            request, phenotypes)
+        phenotypes = self._getCachedResults(
+            phenotypeAssociationSet, request, lambda: [
+                association.phenotype for association in
+                phenotypeAssociationSet.getAssociations(request)])
+        return self._protocolListGenerator(request, phenotypes)
 
     def genotypesPhenotypesGenerator(self, request):
         """
         Returns a generator over the (phenotypes, nextPageToken) pairs
         defined by the (JSON string) request
         """
-        # TODO make paging work using SPARQL?
         compoundId = datamodel.PhenotypeAssociationSetCompoundId.parse(
             request.phenotype_association_set_id)
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
         phenotypeAssociationSet = dataset.getPhenotypeAssociationSet(
             compoundId.phenotypeAssociationSetId)
         featureSets = dataset.getFeatureSets()
-        annotationList = phenotypeAssociationSet.getAssociations(
-            request, featureSets)
+        annotationList = self._getCachedResults(
+            phenotypeAssociationSet, request,
+            lambda: phenotypeAssociationSet.getAssociations(
+                request, featureSets))
         return self._protocolListGenerator(request, annotationList)
 
     def callSetsGenerator(self, request):
@@ -560,8 +844,50 @@ class Backend(object):
         jsonString = protocol.toJson(protocolElement)
         return jsonString
 
+    def _parseJsonObject(self, requestStr):
+        """
+        Returns the dictionary represented by the specified JSON string,
+        for requests which do not correspond to a protocol class.
+        """
+        try:
+            jsonDict = json.loads(requestStr)
+        except ValueError:
+            raise exceptions.InvalidJsonException(requestStr)
+        if not isinstance(jsonDict, dict):
+            raise exceptions.InvalidJsonException(requestStr)
+        return jsonDict
+
+    def _parseSearchOptions(self, requestStr, searchOptions):
+        """
+        Removes the server-specific search options, which are not part of
+        the protocol, from the specified JSON request string. Returns the
+        remaining request string and a dictionary mapping each option name
+        in searchOptions to its value in the request, or to the default
+        value given in searchOptions if it is not present.
+        """
+        jsonDict = self._parseJsonObject(requestStr)
+        options = {}
+        for name, default in searchOptions.items():
+            value = jsonDict.pop(name, default)
+            if isinstance(default, bool):
+                valid = isinstance(value, bool)
+            elif isinstance(default, basestring):
+                valid = isinstance(value, basestring)
+            elif isinstance(default, list):
+                valid = isinstance(value, list) and all(
+                    isinstance(item, basestring) for item in value)
+            else:
+                valid = (
+                    isinstance(value, (int, long, float)) and
+                    not isinstance(value, bool))
+            if not valid:
+                raise exceptions.BadSearchOptionException(name, value)
+            options[name] = value
+        return json.dumps(jsonDict), options
+
     def runSearchRequest(
-            self, requestStr, requestClass, responseClass, objectGenerator):
+            self, requestStr, requestClass, responseClass, objectGenerator,
+            searchOptions=None):
         """
         Runs the specified request. The request is a string containing
         a JSON representation of an instance of the specified requestClass.
@@ -570,8 +896,17 @@ class Backend(object):
         using the specified object generator, which must return
         (object, nextPageToken) pairs, and be able to resume iteration from
         any point using the nextPageToken attribute of the request object.
+
+        The request may also contain the server-specific options named in
+        the searchOptions dictionary, which maps option names to default
+        values; these are passed to the object generator as keyword
+        arguments.
         """
         self.startProfile()
+        options = {}
+        if searchOptions is not None:
+            requestStr, options = self._parseSearchOptions(
+                requestStr, searchOptions)
         try:
             request = protocol.fromJson(requestStr, requestClass)
         except protocol.json_format.ParseError:
@@ -581,17 +916,137 @@ class Backend(object):
             request.page_size = self._defaultPageSize
         if request.page_size < 0:
             raise exceptions.BadPageSizeException(request.page_size)
+        cacheKey = self._getResponseCacheKey(
+            request, objectGenerator, options)
+        responseString = None
+        if cacheKey is not None:
+            responseString = self._responseCache.get(cacheKey)
+        if responseString is None:
+            responseString = self._runSearch(
+                request, responseClass, objectGenerator, options)
+            if cacheKey is not None:
+                self._responseCache.set(cacheKey, responseString)
+        self.endProfile()
+        return responseString
+
+    def _runSearch(self, request, responseClass, objectGenerator, options):
+        """
+        Returns the serialized response to the specified search. If the
+        iterator of a previous page which returned the requested page
+        token is in the continuation cache, it is resumed; otherwise the
+        object generator starts iterating from the page token. Interval
+        iterators which have more objects are kept in the continuation
+        cache, along with the use counts of the files they read, as they
+        can only be resumed if no other iterator has moved the position
+        of those files. Objects may be read ahead in a background thread
+        while the response is built.
+        """
+        continuationKey = None
+        usedFiles = {}
+        iterator = None
+        if self._continuationCache.isEnabled():
+            continuationKey = self._getContinuationKey(
+                request, objectGenerator, options)
+            if request.page_token:
+                continuation = self._continuationCache.take(
+                    continuationKey(request.page_token))
+                if continuation is not None and self._areFilesUnused(
+                        continuation[1]):
+                    iterator, usedFiles = continuation
+            useCounts = datamodel.fileHandleCache.getUseCounts()
+        resumable = iterator is not None
+        if iterator is None:
+            iterator = objectGenerator(request, **options)
+            resumable = isinstance(iterator, paging.IntervalIterator)
+        readAheadIterator = self._startReadAhead(iterator, request.page_size)
+        if readAheadIterator is not None:
+            iterator = readAheadIterator
         responseBuilder = response_builder.SearchResponseBuilder(
             responseClass, request.page_size, self._maxResponseLength)
         nextPageToken = None
-        for obj, nextPageToken in objectGenerator(request):
-            responseBuilder.addValue(obj)
-            if responseBuilder.isFull():
-                break
+        try:
+            for obj, nextPageToken in iterator:
+                responseBuilder.addValue(obj)
+                if responseBuilder.isFull():
+                    break
+        finally:
+            if readAheadIterator is not None:
+                readAheadIterator.stop()
+                self._readAheadSemaphore.release()
         responseBuilder.setNextPageToken(nextPageToken)
-        responseString = responseBuilder.getSerializedResponse()
-        self.endProfile()
-        return responseString
+        if (continuationKey is not None and nextPageToken is not None and
+                resumable and self._areFilesUnused(usedFiles)):
+            # The files whose use counts changed during this search are
+            # taken to be those read by the iterator.
+            for dataFile, useCount in (
+                    datamodel.fileHandleCache.getUseCounts().items()):
+                if useCounts.get(dataFile) != useCount:
+                    usedFiles[dataFile] = useCount
+            self._continuationCache.put(
+                continuationKey(nextPageToken), (iterator, usedFiles))
+        return responseBuilder.getSerializedResponse()
+
+    def _startReadAhead(self, iterator, pageSize):
+        """
+        Returns a started paging.ReadAheadIterator over the specified
+        iterator, which reads at most a page ahead, or None if reading
+        ahead is disabled or all the read ahead threads are busy. The
+        caller must stop the iterator and release the semaphore.
+        """
+        if self._readAheadSize == 0:
+            return None
+        if not self._readAheadSemaphore.acquire(False):
+            return None
+        if not isinstance(iterator, paging.ReadAheadIterator):
+            iterator = paging.ReadAheadIterator(
+                iterator, min(self._readAheadSize, pageSize))
+        iterator.start()
+        return iterator
+
+    def _getContinuationKey(self, request, objectGenerator, options):
+        """
+        Returns a function which returns the continuation cache key of
+        the specified search at the specified page token. The page size
+        is not part of the key, so that it can change between pages.
+        """
+        keyRequest = type(request)()
+        keyRequest.CopyFrom(request)
+        keyRequest.page_size = 0
+        optionsString = json.dumps(options, sort_keys=True)
+
+        def getKey(pageToken):
+            keyRequest.page_token = pageToken
+            return (
+                objectGenerator.__name__, keyRequest.SerializeToString(),
+                optionsString)
+        return getKey
+
+    def _areFilesUnused(self, useCounts):
+        """
+        Returns True if none of the files in the specified dictionary of
+        use counts has been used or closed since they were counted.
+        """
+        currentUseCounts = datamodel.fileHandleCache.getUseCounts()
+        return all(
+            currentUseCounts.get(dataFile) == useCount
+            for dataFile, useCount in useCounts.items())
+
+    def _getResponseCacheKey(self, request, objectGenerator, options):
+        """
+        Returns the key under which the response to the specified search
+        is cached, or None if it cannot be cached. The request is
+        serialized after parsing, so that equivalent JSON requests have
+        the same key.
+        """
+        if self._responseCache is None:
+            return None
+        version = self.getDataRepository().getVersion()
+        if version is None:
+            return None
+        return response_cache.makeKey(
+            objectGenerator.__name__, request.SerializeToString(),
+            json.dumps(options, sort_keys=True),
+            str(self._maxResponseLength), version)
 
     def runListReferenceBases(self, requestJson):
         """
@@ -692,6 +1147,196 @@ class Backend(object):
         jsonString = protocol.toJson(gaFeature)
         return jsonString
 
+    def runBatchGetFeatures(self, requestStr):
+        """
+        Returns a SearchFeaturesResponse holding the features whose IDs are
+        listed in the specified JSON request, as for _runBatchGetRequest.
+        Each feature set is queried once.
+        """
+        def getFeatureSet(compoundId):
+            dataset = self.getDataRepository().getDataset(
+                compoundId.dataset_id)
+            return dataset.getFeatureSet(compoundId.feature_set_id)
+        return self._runBatchGetRequest(
+            requestStr, datamodel.FeatureCompoundId, "feature_set_id",
+            getFeatureSet,
+            lambda featureSet, compoundIds: featureSet.getFeaturesByIds(
+                compoundIds),
+            protocol.SearchFeaturesResponse)
+
+    def runBatchGetVariants(self, requestStr):
+        """
+        Returns a SearchVariantsResponse holding the variants whose IDs are
+        listed in the specified JSON request, as for _runBatchGetRequest.
+        Variants close to each other are read with a single fetch.
+        """
+        def getVariantSet(compoundId):
+            dataset = self.getDataRepository().getDataset(
+                compoundId.dataset_id)
+            return dataset.getVariantSet(compoundId.variant_set_id)
+        return self._runBatchGetRequest(
+            requestStr, datamodel.VariantCompoundId, "variant_set_id",
+            getVariantSet,
+            lambda variantSet, compoundIds: variantSet.getVariantsByIds(
+                compoundIds),
+            protocol.SearchVariantsResponse)
+
+    def runBatchGetCallSets(self, requestStr):
+        """
+        Returns a SearchCallSetsResponse holding the call sets whose IDs
+        are listed in the specified JSON request, as for
+        _runBatchGetRequest.
+        """
+        def getVariantSet(compoundId):
+            dataset = self.getDataRepository().getDataset(
+                compoundId.dataset_id)
+            return dataset.getVariantSet(compoundId.variant_set_id)
+
+        def getCallSets(variantSet, compoundIds):
+            callSets = []
+            for compoundId in compoundIds:
+                try:
+                    callSets.append(variantSet.getCallSet(
+                        str(compoundId)).toProtocolElement())
+                except exceptions.CallSetNotFoundException:
+                    callSets.append(None)
+            return callSets
+        return self._runBatchGetRequest(
+            requestStr, datamodel.CallSetCompoundId, "variant_set_id",
+            getVariantSet, getCallSets, protocol.SearchCallSetsResponse)
+
+    def _runBatchGetRequest(
+            self, requestStr, compoundIdClass, containerIdName,
+            getContainer, getObjects, responseClass):
+        """
+        Returns a JSON response of the specified class listing the objects
+        whose IDs are in the specified batch get request, in the order
+        requested. The IDs are parsed by the specified compound ID class
+        and grouped by the container ID attribute with the specified name.
+        The container of each group is returned by getContainer(compoundId)
+        and getObjects(container, compoundIds) returns the list of its
+        objects with the specified IDs, with None for those which do not
+        exist. IDs which cannot be returned are listed in 'errors', which
+        is only present if there are any, along with their index in the
+        request and the error code and message of the exception for them.
+        """
+        ids = self._parseBatchGetIds(requestStr)
+        if len(ids) > self._maxBatchGetIds:
+            raise exceptions.BatchGetTooLargeException(self._maxBatchGetIds)
+        objects = [None] * len(ids)
+        errors = {}
+        compoundIds = [None] * len(ids)
+        indexesByContainer = collections.OrderedDict()
+        for index, id_ in enumerate(ids):
+            try:
+                compoundIds[index] = compoundIdClass.parse(id_)
+            except exceptions.BaseServerException as exception:
+                errors[index] = exception
+                continue
+            containerId = getattr(compoundIds[index], containerIdName)
+            indexesByContainer.setdefault(containerId, []).append(index)
+        for indexes in indexesByContainer.values():
+            try:
+                container = getContainer(compoundIds[indexes[0]])
+                containerObjects = getObjects(
+                    container, [compoundIds[index] for index in indexes])
+            except exceptions.BaseServerException as exception:
+                for index in indexes:
+                    errors[index] = exception
+                continue
+            for index, obj in zip(indexes, containerObjects):
+                if obj is None:
+                    errors[index] = exceptions.ObjectWithIdNotFoundException(
+                        ids[index])
+                objects[index] = obj
+        response = responseClass()
+        valueList = getattr(
+            response, protocol.getValueListName(responseClass))
+        valueList.extend(obj for obj in objects if obj is not None)
+        responseString = protocol.toJson(response)
+        if len(errors) == 0:
+            return responseString
+        jsonDict = json.loads(responseString)
+        jsonDict["errors"] = [
+            {"index": index, "id": ids[index],
+             "errorCode": errors[index].getErrorCode(),
+             "message": errors[index].getMessage()}
+            for index in sorted(errors)]
+        return json.dumps(jsonDict)
+
+    def _parseBatchGetIds(self, requestStr):
+        """
+        Returns the list of IDs in the specified JSON batch get request,
+        which must be an object with a single list of strings, 'ids'.
+        """
+        jsonDict = self._parseJsonObject(requestStr)
+        if set(jsonDict) != {'ids'}:
+            raise exceptions.BadBatchGetRequestException()
+        ids = jsonDict['ids']
+        if not isinstance(ids, list) or not all(
+                isinstance(id_, basestring) for id_ in ids):
+            raise exceptions.BadBatchGetRequestException()
+        return ids
+
+    def runGetExpressionMatrix(self, requestStr, binary=False):
+        """
+        Returns the (rnaQuantifications x features) expression matrix of
+        the rnaQuantificationSetId in the specified JSON request. The
+        request may also list featureIds to restrict the columns to, and
+        a threshold which at least one value in each column must exceed.
+        The matrix is returned as a JSON string with null for missing
+        values or, if binary is True, as bytes in the layout described
+        in the rna_quantification module.
+        """
+        request = self._parseJsonObject(requestStr)
+        rnaQuantificationSetId = request.get('rnaQuantificationSetId')
+        featureIds = request.get('featureIds', [])
+        threshold = request.get('threshold')
+        valid = (
+            isinstance(rnaQuantificationSetId, basestring) and
+            isinstance(featureIds, list) and
+            all(isinstance(id_, basestring) for id_ in featureIds) and (
+                threshold is None or (
+                    isinstance(threshold, (int, long, float)) and
+                    not isinstance(threshold, bool))))
+        if not valid:
+            raise exceptions.BadExpressionMatrixRequestException()
+        compoundId = datamodel.RnaQuantificationSetCompoundId.parse(
+            rnaQuantificationSetId)
+        dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
+        rnaQuantSet = dataset.getRnaQuantificationSet(
+            compoundId.rna_quantification_set_id)
+        matrix = rnaQuantSet.getExpressionMatrix()
+        columnIndexes = matrix.selectColumns(featureIds, threshold)
+        rnaQuants = rnaQuantSet.getRnaQuantifications()
+        rows = []
+        for rnaQuant in rnaQuants:
+            rowIndex = matrix.getRowIndex(rnaQuant.getLocalId())
+            if rowIndex is None:
+                rows.append(array.array(
+                    b"f", [float("nan")]) * len(columnIndexes))
+            else:
+                rows.append(matrix.getRow(rowIndex, columnIndexes))
+        header = {
+            "rnaQuantificationIds": [
+                rnaQuant.getId() for rnaQuant in rnaQuants],
+            "featureIds": [
+                matrix.getFeatureIds()[index] for index in columnIndexes],
+            "names": [matrix.getNames()[index] for index in columnIndexes]}
+        if binary:
+            headerBytes = json.dumps(header).encode("utf-8")
+            if sys.byteorder != "little":
+                for row in rows:
+                    row.byteswap()
+            return b"".join(
+                [struct.pack(b"<I", len(headerBytes)), headerBytes] +
+                [row.tostring() for row in rows])
+        # NaN is the only value which is not equal to itself
+        header["values"] = [
+            [value if value == value else None for value in row]
+            for row in rows]
+        return json.dumps(header)
+
     def runGetReadGroupSet(self, id_):
         """
         Returns a readGroupSet with the given id_
@@ -879,14 +1524,62 @@ class Backend(object):
             protocol.SearchVariantsResponse,
             self.variantsGenerator)
 
+    def runSearchVariantsInRegions(self, request):
+        """
+        Runs the specified SearchVariantsRequest over the list of regions
+        in its 'regions' option, returning a SearchVariantsResponse.
+        """
+        return self.runSearchRequest(
+            request, protocol.SearchVariantsRequest,
+            protocol.SearchVariantsResponse,
+            self.variantRegionsGenerator,
+            searchOptions={'regions': []})
+
+    def runSearchVariantSummaries(self, requestStr):
+        """
+        Runs the specified SearchVariantsRequest, returning a JSON object
+        with the page of allele and genotype summaries of the variants in
+        'variantSummaries', and 'nextPageToken'. The summaries are over
+        the calls of the requested call sets, or of all call sets if none
+        are requested.
+        """
+        self.startProfile()
+        try:
+            request = protocol.fromJson(
+                requestStr, protocol.SearchVariantsRequest)
+        except protocol.json_format.ParseError:
+            raise exceptions.InvalidJsonException(requestStr)
+        if not request.page_size:
+            request.page_size = self._defaultPageSize
+        if request.page_size < 0:
+            raise exceptions.BadPageSizeException(request.page_size)
+        summaries = []
+        nextPageToken = None
+        for summary, nextPageToken in self.variantSummariesGenerator(
+                request):
+            summaries.append(summary)
+            if len(summaries) >= request.page_size:
+                break
+        self.endProfile()
+        return json.dumps({
+            "variantSummaries": summaries,
+            "nextPageToken": nextPageToken or ""})
+
     def runSearchVariantAnnotations(self, request):
         """
         Runs the specified SearchVariantAnnotationsRequest.
+
+        In addition to the protocol fields, the request may set the
+        boolean option includeDescendants to match the effects which are
+        is_a descendants of the requested effects as well as the effects
+        themselves, and the list of strings featureIds to match only the
+        transcript effects on the transcripts or genes with these IDs.
         """
         return self.runSearchRequest(
             request, protocol.SearchVariantAnnotationsRequest,
             protocol.SearchVariantAnnotationsResponse,
-            self.variantAnnotationsGenerator)
+            self.variantAnnotationsGenerator,
+            searchOptions={'includeDescendants': False, 'featureIds': []})
 
     def runSearchCallSets(self, request):
         """
@@ -921,13 +1614,19 @@ class Backend(object):
         Returns a SearchFeaturesResponse for the specified
         SearchFeaturesRequest object.
 
+        In addition to the protocol fields, the request may set the
+        boolean option includeDescendants to also return the full subtree
+        of descendants of each matched feature, and the string option
+        namePrefix to match features by case-insensitive name prefix.
+
         :param request: JSON string representing searchFeaturesRequest
         :return: JSON string representing searchFeatureResponse
         """
         return self.runSearchRequest(
             request, protocol.SearchFeaturesRequest,
             protocol.SearchFeaturesResponse,
-            self.featuresGenerator)
+            self.featuresGenerator,
+            searchOptions={'includeDescendants': False, 'namePrefix': ""})
 
     def runSearchGenotypePhenotypes(self, request):
         return self.runSearchRequest(
@@ -135,6 +135,15 @@ class RepoManager(object):
         self._openRepo()
         self._repo.verify()
 
+    def buildSnapshot(self):
+        """
+        Writes a snapshot of the loaded repository, from which servers
+        start quickly until the repo is next changed.
+        """
+        self._openRepo()
+        if not self._repo.isSnapshotCurrent():
+            self._repo.writeSnapshot()
+
     def addOntology(self):
         """
         Adds a new Ontology to this repo.
@@ -148,6 +157,7 @@ class RepoManager(object):
         ontology = ontologies.Ontology(name)
         ontology.populateFromFile(filePath)
         self._updateRepo(self._repo.insertOntology, ontology)
+        ontology.writeCache()
 
     def addDataset(self):
         """
@@ -304,6 +314,8 @@ class RepoManager(object):
             for annotationSet in annotationSets:
                 self._repo.insertVariantAnnotationSet(annotationSet)
         self._updateRepo(updateRepo)
+        for annotationSet in annotationSets:
+            annotationSet.writeIndexes()
 
     def addPhenotypeAssociationSet(self):
         """
@@ -322,6 +334,7 @@ class RepoManager(object):
         self._updateRepo(
             self._repo.insertPhenotypeAssociationSet,
             phenotypeAssociationSet)
+        phenotypeAssociationSet.writeSnapshot()
 
     def removePhenotypeAssociationSet(self):
         """
@@ -488,7 +501,7 @@ class RepoManager(object):
 
     def addRnaQuantification(self):
         """
-        Adds an rnaQuantification into this repo
+        Adds one or more rnaQuantifications into this repo
         """
         self._openRepo()
         dataset = self._repo.getDatasetByName(self._args.datasetName)
@@ -496,22 +509,32 @@ class RepoManager(object):
         if self._args.biosampleName:
             biosample = dataset.getBiosampleByName(self._args.biosampleName)
             biosampleId = biosample.getId()
+        quantificationFilePaths = self._args.quantificationFilePaths
         if self._args.name is None:
-            name = getNameFromPath(self._args.quantificationFilePath)
+            names = [
+                getNameFromPath(quantificationFilePath)
+                for quantificationFilePath in quantificationFilePaths]
+        elif len(quantificationFilePaths) == 1:
+            names = [self._args.name]
         else:
-            name = self._args.name
+            raise exceptions.RepoManagerException(
+                "Cannot specify a name for more than one quantification")
+        if len(set(names)) != len(names):
+            raise exceptions.RepoManagerException(
+                "Quantification names must be unique")
         # TODO: programs not fully supported by GA4GH yet
         programs = ""
         featureType = "gene"
         if self._args.transcript:
             featureType = "transcript"
-        rnaseq2ga.rnaseq2ga(
-            self._args.quantificationFilePath, self._args.filePath, name,
+        rnaseq2ga.batchRnaseq2ga(
+            zip(names, quantificationFilePaths), self._args.filePath,
             self._args.format, dataset=dataset, featureType=featureType,
             description=self._args.description, programs=programs,
             featureSetNames=self._args.featureSetNames,
             readGroupSetNames=self._args.readGroupSetName,
-            biosampleId=biosampleId)
+            biosampleId=biosampleId, workers=self._args.workers)
+        rna_quantification.writeExpressionMatrix(self._args.filePath)
 
     def initRnaQuantificationSet(self):
         """
@@ -520,6 +543,19 @@ class RepoManager(object):
         store = rnaseq2ga.RnaSqliteStore(self._args.filePath)
         store.createTables()
 
+    def indexRnaQuantificationSet(self):
+        """
+        Adds the expression level search indexes and the expression
+        matrix to an existing RNA quantification set
+        """
+        if not os.path.exists(self._args.filePath):
+            raise exceptions.RepoManagerException(
+                "Cannot find RNA quantification set '{}'".format(
+                    self._args.filePath))
+        store = rnaseq2ga.RnaSqliteStore(self._args.filePath)
+        store.createIndexes()
+        rna_quantification.writeExpressionMatrix(self._args.filePath)
+
     def addRnaQuantificationSet(self):
         """
         Adds an rnaQuantificationSet into this repo
@@ -706,8 +742,9 @@ class RepoManager(object):
             help="the name of the RNA Quantification Set")
 
     @classmethod
-    def addQuantificationFilePathArgument(cls, subparser, helpText):
-        subparser.add_argument("quantificationFilePath", help=helpText)
+    def addQuantificationFilePathsArgument(cls, subparser, helpText):
+        subparser.add_argument(
+            "quantificationFilePaths", nargs="+", help=helpText)
 
     @classmethod
     def addRnaFormatArgument(cls, subparser):
@@ -744,6 +781,12 @@ class RepoManager(object):
         listParser.set_defaults(runner="list")
         cls.addRepoArgument(listParser)
 
+        buildSnapshotParser = common_cli.addSubparser(
+            subparsers, "build-snapshot",
+            "Write a snapshot of the repo from which servers start quickly")
+        buildSnapshotParser.set_defaults(runner="buildSnapshot")
+        cls.addRepoArgument(buildSnapshotParser)
+
         addDatasetParser = common_cli.addSubparser(
             subparsers, "add-dataset", "Add a dataset to the data repo")
         addDatasetParser.set_defaults(runner="addDataset")
@@ -967,8 +1010,9 @@ class RepoManager(object):
         cls.addFilePathArgument(
             addRnaQuantificationParser,
             "The path to the RNA SQLite database to create or modify")
-        cls.addQuantificationFilePathArgument(
-            addRnaQuantificationParser, "The path to the expression file.")
+        cls.addQuantificationFilePathsArgument(
+            addRnaQuantificationParser,
+            "The paths to one or more expression files.")
         cls.addRnaFormatArgument(addRnaQuantificationParser)
         cls.addRepoArgument(addRnaQuantificationParser)
         cls.addDatasetNameArgument(addRnaQuantificationParser)
@@ -981,6 +1025,9 @@ class RepoManager(object):
         cls.addNameOption(addRnaQuantificationParser, "rna quantification")
         cls.addDescriptionOption(addRnaQuantificationParser, objectType)
         cls.addRnaFeatureTypeOption(addRnaQuantificationParser)
+        addRnaQuantificationParser.add_argument(
+            "-w", "--workers", default=1, type=int,
+            help="The number of processes used to parse expression files")
         cls.addAttributesArgument(addRnaQuantificationParser)
 
         objectType = "RnaQuantificationSet"
@@ -994,6 +1041,17 @@ class RepoManager(object):
             initRnaQuantificationSetParser,
             "The path to the resulting Quantification Set")
 
+        indexRnaQuantificationSetParser = common_cli.addSubparser(
+            subparsers, "index-rnaquantificationset",
+            "Adds the expression level search indexes and the expression "
+            "matrix to an existing RNA quantification set")
+        indexRnaQuantificationSetParser.set_defaults(
+            runner="indexRnaQuantificationSet")
+        cls.addRepoArgument(indexRnaQuantificationSetParser)
+        cls.addFilePathArgument(
+            indexRnaQuantificationSetParser,
+            "The path to the RNA SQLite database to index")
+
         addRnaQuantificationSetParser = common_cli.addSubparser(
             subparsers, "add-rnaquantificationset",
             "Add an RNA quantification set to the data repo")
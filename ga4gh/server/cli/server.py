@@ -9,6 +9,7 @@ import requests
 
 import ga4gh.server.cli as cli
 import ga4gh.server.frontend as frontend
+import ga4gh.server.prefork as prefork
 
 import ga4gh.common.cli as common_cli
 
@@ -32,6 +33,24 @@ def addServerOptions(parser):
     parser.add_argument(
         "--dont-use-reloader", default=False, action="store_true",
         help="Don't use the flask reloader")
+    parser.add_argument(
+        "--workers", "-w", default=0, type=int,
+        help=(
+            "The number of worker processes to fork; if zero, the "
+            "single-process development server is used"))
+    parser.add_argument(
+        "--threads", default=1, type=int,
+        help="The number of requests each worker handles at a time")
+    parser.add_argument(
+        "--max-requests", default=0, type=int,
+        help=(
+            "The number of requests after which a worker is replaced; "
+            "if zero, workers are never replaced"))
+    parser.add_argument(
+        "--graceful-timeout", default=30, type=int,
+        help=(
+            "The number of seconds workers are given to finish their "
+            "requests when they are stopped or restarted"))
     cli.addVersionArgument(parser)
     cli.addDisableUrllibWarningsArgument(parser)
 
@@ -48,11 +67,26 @@ def server_main(args=None):
     if parsedArgs.disable_urllib_warnings:
         requests.packages.urllib3.disable_warnings()
     frontend.configure(
-        parsedArgs.config_file, parsedArgs.config, parsedArgs.port)
+        parsedArgs.config_file, parsedArgs.config, parsedArgs.port,
+        startConversionPool=parsedArgs.workers == 0)
     sslContext = None
     if parsedArgs.tls or ("OIDC_PROVIDER" in frontend.app.config):
         sslContext = "adhoc"
-    frontend.app.run(
-        host=parsedArgs.host, port=parsedArgs.port,
-        use_reloader=not parsedArgs.dont_use_reloader,
-        ssl_context=sslContext)
+    if parsedArgs.workers > 0:
+        # The repository has been loaded by configure, so the workers
+        # share it with the master, but each worker starts its own
+        # conversion pool.
+        server = prefork.PreforkServer(
+            frontend.app, host=parsedArgs.host, port=parsedArgs.port,
+            workers=parsedArgs.workers, threads=parsedArgs.threads,
+            maxRequests=parsedArgs.max_requests,
+            gracefulTimeout=parsedArgs.graceful_timeout,
+            sslContext=sslContext,
+            workerStart=frontend.app.backend.startConversionPool,
+            workerStop=frontend.app.backend.stopConversionPool)
+        server.serveForever()
+    else:
+        frontend.app.run(
+            host=parsedArgs.host, port=parsedArgs.port,
+            use_reloader=not parsedArgs.dont_use_reloader,
+            ssl_context=sslContext)
@@ -0,0 +1,256 @@
+"""
+A pool of worker processes which convert the variants of searches in
+parallel, so that a search is not limited to the one core which the
+server process can use at a time.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+
+import ga4gh.server.datamodel as datamodel
+import ga4gh.server.response_builder as response_builder
+
+import ga4gh.schemas.protocol as protocol
+
+
+# The data repository of a worker process.
+_dataRepository = None
+
+
+def _initialiseWorker(dataRepository):
+    global _dataRepository
+    # The pool stops its workers with SIGTERM, which the server process
+    # may handle itself.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # The repository is reloaded so that the worker has its own database
+    # connection, and the inherited file handles are dropped for the same
+    # reason.
+    _dataRepository = dataRepository.reload()
+    datamodel.fileHandleCache.clear()
+
+
+def _convertVariants(
+        version, variantSetId, referenceName, startPosition, endPosition,
+        callSetIds, minStart, maxStart):
+    """
+    Returns the list of the (JSON dictionary, serialised length, start)
+    tuples of the variants of the specified variant set which start in
+    the specified range, or None if they cannot be converted by the
+    worker, in which case the server converts them.
+    """
+    global _dataRepository
+    try:
+        if _dataRepository.getVersion() != version:
+            _dataRepository = _dataRepository.reload()
+            if _dataRepository.getVersion() != version:
+                return None
+        compoundId = datamodel.VariantSetCompoundId.parse(variantSetId)
+        dataset = _dataRepository.getDataset(compoundId.dataset_id)
+        variantSet = dataset.getVariantSet(compoundId.variant_set_id)
+        return [
+            (protocol.json_format.MessageToDict(variant, False),
+             variant.ByteSize(), variant.start)
+            for variant in variantSet.getVariantsStartingIn(
+                referenceName, startPosition, endPosition, callSetIds,
+                minStart, maxStart)]
+    except Exception:
+        # Errors are raised by the server when it converts the variants
+        # itself, as not all exceptions can be returned by the pool.
+        return None
+
+
+class ConversionPool(object):
+    """
+    A pool of the specified number of processes converting the variants
+    of searches. The region of a search is split into subranges at the
+    BGZF block boundaries of its tabix indexed files, at least minBytes
+    apart. The server converts the first subrange while the pool converts
+    up to parallelism of the following ones, as far as the dictionaries
+    from which their JSON is made, and the variants are returned in
+    order. Subranges which the pool has not converted within timeout
+    seconds are converted by the server. Searches over lists of regions
+    are converted in the same way, a region at a time. The processes are
+    started by the start method in each server process using the pool,
+    and until then its variants are converted by the server.
+    """
+    def __init__(self, processes, parallelism=4, minBytes=2**16, timeout=60):
+        if processes < 1:
+            raise ValueError("The pool must have at least one process")
+        if parallelism < 1:
+            raise ValueError("The parallelism must be at least one")
+        self._processes = processes
+        self._parallelism = parallelism
+        self._minBytes = minBytes
+        self._timeout = timeout
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self, dataRepository):
+        """
+        Starts the worker processes of this process with the specified
+        data repository. As they are forked, this must be called when the
+        process starts, before it runs any other threads.
+        """
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = multiprocessing.Pool(
+                    self._processes, _initialiseWorker, (dataRepository,))
+                self._pid = os.getpid()
+
+    def _getPool(self):
+        """
+        Returns the multiprocessing pool started by this process, or None
+        if it has not started one.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                return None
+            return self._pool
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.terminate()
+                self._pool.join()
+            self._pool = None
+
+    def getVariantSet(self, dataRepository, variantSet):
+        """
+        Returns a view of the specified variant set of the specified data
+        repository whose getVariants method converts the variants in this
+        pool, or the variant set itself if the repository has no version
+        by which the workers can find it or the pool has not been started
+        in this process.
+        """
+        if dataRepository.getVersion() is None or self._getPool() is None:
+            return variantSet
+        return ParallelVariantSet(self, dataRepository, variantSet)
+
+    def getVariants(
+            self, dataRepository, variantSet, referenceName,
+            startPosition, endPosition, callSetIds):
+        """
+        Returns an iterator over the variants of the specified variant set
+        of the specified data repository, in the same order as its
+        getVariants method. Variants converted by the pool are returned as
+        ConvertedVariant objects.
+        """
+        boundaries = variantSet.getBlockBoundaries(
+            referenceName, startPosition, endPosition, self._minBytes)
+        if len(boundaries) == 0:
+            return variantSet.getVariants(
+                referenceName, startPosition, endPosition, callSetIds)
+        # Each subrange holds the variants starting in it. The first also
+        # holds those which start before the region but overlap it.
+        starts = [startPosition] + boundaries
+        ends = boundaries + [endPosition]
+        subranges = [
+            (referenceName, start, end, start if index > 0 else None, end)
+            for index, (start, end) in enumerate(zip(starts, ends))]
+        return itertools.chain.from_iterable(self._generateSubranges(
+            dataRepository, variantSet, subranges, list(callSetIds)))
+
+    def getVariantsInRanges(
+            self, dataRepository, variantSet, ranges, callSetIds):
+        """
+        Returns an iterator over the iterators over the variants in each
+        of the specified (referenceName, startPosition, endPosition,
+        minStart) ranges of the specified variant set, as for its
+        getVariantsInRanges method. The ranges are converted by the pool.
+        """
+        return self._generateSubranges(
+            dataRepository, variantSet,
+            [range_ + (None,) for range_ in ranges], list(callSetIds))
+
+    def _generateSubranges(
+            self, dataRepository, variantSet, subranges, callSetIds):
+        # Subranges are (referenceName, startPosition, endPosition,
+        # minStart, maxStart) tuples. The server converts the first while
+        # the pool converts the following ones.
+        subranges = collections.deque(subranges)
+        if len(subranges) == 0:
+            return
+        pool = self._getPool()
+        version = dataRepository.getVersion()
+        variantSetId = variantSet.getId()
+        pending = collections.deque()
+
+        def submit():
+            while len(pending) < self._parallelism and (
+                    len(subranges) > 0):
+                subrange = subranges.popleft()
+                arguments = (
+                    (version, variantSetId) + subrange[:3] +
+                    (callSetIds,) + subrange[3:])
+                pending.append((subrange, pool.apply_async(
+                    _convertVariants, arguments)))
+
+        def convert(subrange):
+            return variantSet.getVariantsStartingIn(
+                subrange[0], subrange[1], subrange[2], callSetIds,
+                subrange[3], subrange[4])
+        if pool is None:
+            # The pool was closed after the search started.
+            for subrange in subranges:
+                yield convert(subrange)
+            return
+        firstSubrange = subranges.popleft()
+        submit()
+        yield convert(firstSubrange)
+        while len(pending) > 0:
+            subrange, result = pending.popleft()
+            try:
+                convertedVariants = result.get(self._timeout)
+            except multiprocessing.TimeoutError:
+                convertedVariants = None
+            submit()
+            if convertedVariants is None:
+                yield convert(subrange)
+            else:
+                yield [
+                    ConvertedVariant(jsonDict, byteSize, start)
+                    for jsonDict, byteSize, start in convertedVariants]
+
+
+class ConvertedVariant(response_builder.ConvertedValue):
+    """
+    A variant converted by a worker process, with the start position used
+    by the paging iterators.
+    """
+    def __init__(self, jsonDict, byteSize, start):
+        super(ConvertedVariant, self).__init__(jsonDict, byteSize)
+        self.start = start
+
+
+class ParallelVariantSet(object):
+    """
+    A view of a variant set, for the paging iterators, whose variants are
+    converted by a ConversionPool.
+    """
+    def __init__(self, conversionPool, dataRepository, variantSet):
+        self._conversionPool = conversionPool
+        self._dataRepository = dataRepository
+        self._variantSet = variantSet
+
+    def getVariants(
+            self, referenceName, startPosition, endPosition,
+            callSetIds=[]):
+        return self._conversionPool.getVariants(
+            self._dataRepository, self._variantSet, referenceName,
+            startPosition, endPosition, callSetIds)
+
+    def getVariantsInRanges(self, ranges, callSetIds):
+        return self._conversionPool.getVariantsInRanges(
+            self._dataRepository, self._variantSet, ranges, callSetIds)
@@ -29,6 +29,7 @@ class PysamFileHandleCache(object):
     def __init__(self):
         self._cache = collections.deque()
         self._memoTable = dict()
+        self._useCounts = collections.Counter()
         # Initialize the value even if it will be set up by the config
         self._maxCacheSize = 50
 
@@ -63,14 +64,34 @@ class PysamFileHandleCache(object):
         """
         (dataFile, handle) = self._cache.pop()
         handle.close()
+        self._useCounts[dataFile] += 1
         return dataFile
 
+    def clear(self):
+        """
+        Removes all the file handles from the cache, so that the files
+        are opened again when they are next used. This is used in forked
+        processes, whose inherited handles share their file positions with
+        the parent process.
+        """
+        self._cache.clear()
+        self._memoTable.clear()
+
     def getCachedFiles(self):
         """
         Returns all file names stored in the cache.
         """
         return self._memoTable.keys()
 
+    def getUseCounts(self):
+        """
+        Returns a dictionary mapping file names to the number of times
+        their handles have been returned or closed. An iterator over a
+        file can only be resumed safely if this has not changed since it
+        was last advanced, as the file position is shared by the handle.
+        """
+        return dict(self._useCounts)
+
     def getFileHandle(self, dataFile, openMethod):
         """
         Returns handle associated to the filename. If the file is
@@ -78,6 +99,7 @@ class PysamFileHandleCache(object):
         its handle. Otherwise, open the file using openMethod, store
         it in the cache and return the corresponding handle.
         """
+        self._useCounts[dataFile] += 1
         if dataFile in self._memoTable:
             handle = self._memoTable[dataFile]
             self._update(dataFile, handle)
@@ -0,0 +1,181 @@
+"""
+Sidecar indexes of the effects and features in annotated VCF files.
+
+Searching an annotation set for an effect or a feature otherwise means
+decoding every record of the VCF in the search region. An index is a
+SQLite database written next to each VCF file, mapping the effect names
+and feature IDs (transcripts and genes) in its ANN or CSQ annotations to
+the positions of the records holding them, so that searches can seek
+straight to the matching records.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sqlite3
+
+
+INDEX_SUFFIX = ".annotations.db"
+INDEX_VERSION = 1
+
+# the kinds of names held in the term table
+EFFECT_TERM = 0
+FEATURE_TERM = 1
+
+
+def getIndexPath(dataUrl):
+    """
+    Returns the path of the index of the specified VCF file.
+    """
+    return dataUrl + INDEX_SUFFIX
+
+
+def _getSourceFile(dataUrl):
+    """
+    Returns the (size, mtime) pair identifying the current version of the
+    specified VCF file.
+    """
+    stat = os.stat(dataUrl)
+    return stat.st_size, stat.st_mtime
+
+
+def isIndexCurrent(dataUrl):
+    """
+    Returns True if there is an index of the current version of the
+    specified VCF file.
+    """
+    indexPath = getIndexPath(dataUrl)
+    if not os.path.exists(indexPath):
+        return False
+    try:
+        dbConn = sqlite3.connect(indexPath)
+        try:
+            metadata = dict(dbConn.execute(
+                "SELECT key, value FROM metadata").fetchall())
+        finally:
+            dbConn.close()
+    except sqlite3.Error:
+        return False
+    if metadata.get("version") != str(INDEX_VERSION):
+        return False
+    try:
+        size, mtime = _getSourceFile(dataUrl)
+    except OSError:
+        return False
+    return (
+        metadata.get("size") == str(size) and
+        metadata.get("mtime") == repr(mtime))
+
+
+def writeIndex(dataUrl, records):
+    """
+    Writes the index of the specified VCF file from the specified iterable
+    of (referenceName, start, end, effectNames, featureIds) tuples, one
+    for each of its records. The index replaces any previous one
+    atomically, so that servers which have the old index open are not
+    disturbed.
+    """
+    indexPath = getIndexPath(dataUrl)
+    tempPath = indexPath + ".tmp"
+    if os.path.exists(tempPath):
+        os.unlink(tempPath)
+    size, mtime = _getSourceFile(dataUrl)
+    dbConn = sqlite3.connect(tempPath)
+    try:
+        dbConn.execute(
+            "CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT)")
+        dbConn.execute(
+            "CREATE TABLE record (id INTEGER PRIMARY KEY, "
+            "referenceName TEXT, start INTEGER, end INTEGER)")
+        dbConn.execute(
+            "CREATE TABLE term (kind INTEGER, name TEXT, record INTEGER)")
+        dbConn.executemany(
+            "INSERT INTO metadata VALUES (?, ?)", [
+                ("version", str(INDEX_VERSION)),
+                ("size", str(size)),
+                ("mtime", repr(mtime))])
+        terms = []
+        for recordId, (referenceName, start, end, effectNames,
+                       featureIds) in enumerate(records):
+            dbConn.execute(
+                "INSERT INTO record VALUES (?, ?, ?, ?)",
+                (recordId, referenceName, start, end))
+            terms.extend(
+                (EFFECT_TERM, name, recordId) for name in effectNames)
+            terms.extend(
+                (FEATURE_TERM, name, recordId) for name in featureIds)
+        dbConn.executemany("INSERT INTO term VALUES (?, ?, ?)", terms)
+        # Indexes are built after the bulk insert, which is much faster
+        # than maintaining them row by row.
+        dbConn.execute(
+            "CREATE UNIQUE INDEX term_key ON term (kind, name, record)")
+        dbConn.commit()
+    finally:
+        dbConn.close()
+    os.rename(tempPath, indexPath)
+
+
+class AnnotationIndex(object):
+    """
+    A read-only index of the effects and features in a VCF file.
+    """
+    def __init__(self, dataUrl):
+        self._indexPath = getIndexPath(dataUrl)
+        self._dbConn = None
+        self._pid = None
+
+    def _execute(self, sql, args=()):
+        # Connections are not shared with forked child processes.
+        if self._dbConn is None or self._pid != os.getpid():
+            self._dbConn = sqlite3.connect(
+                self._indexPath, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._dbConn.execute(sql, args)
+
+    def __getstate__(self):
+        # Connections cannot be pickled, and are reopened when needed.
+        state = dict(self.__dict__)
+        state["_dbConn"] = None
+        state["_pid"] = None
+        return state
+
+    def _getRecords(self, kind, names, referenceName, start, end):
+        """
+        Returns a dictionary mapping the IDs of the records overlapping
+        the specified region which hold any of the specified names to
+        their start positions.
+        """
+        records = {}
+        for name in names:
+            records.update(self._execute(
+                "SELECT record.id, record.start FROM term "
+                "JOIN record ON term.record = record.id "
+                "WHERE term.kind = ? AND term.name = ? "
+                "AND record.referenceName = ? "
+                "AND record.start < ? AND record.end > ?",
+                (kind, name, referenceName, end, start)).fetchall())
+        return records
+
+    def getPositions(
+            self, referenceName, start, end, effectNames=None,
+            featureIds=None):
+        """
+        Returns the sorted list of the distinct start positions of the
+        records overlapping the specified region which hold any of the
+        specified effect names, if not None, and any of the specified
+        feature IDs, if not None.
+        """
+        records = None
+        for kind, names in [
+                (EFFECT_TERM, effectNames), (FEATURE_TERM, featureIds)]:
+            if names is not None:
+                matches = self._getRecords(
+                    kind, names, referenceName, start, end)
+                if records is not None:
+                    matches = dict(
+                        (recordId, position)
+                        for recordId, position in matches.items()
+                        if recordId in records)
+                records = matches
+        return sorted(set(records.values()))
@@ -0,0 +1,267 @@
+"""
+Compiled snapshots of the RDF graphs behind phenotype association sets.
+
+Parsing the Turtle files of a knowledge base such as CGD or Monarch takes
+minutes, and leaves a copy of the whole graph in the memory of every server
+process. A snapshot is a SQLite database written into the data directory
+which holds the same triples with each term stored once. SnapshotStore
+lets rdflib query it in place, so opening a snapshot is immediate and its
+pages are shared between processes through the OS page cache.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import glob
+import os
+import sqlite3
+
+import rdflib
+import rdflib.store
+
+
+SNAPSHOT_FILENAME = "g2p_snapshot.db"
+SNAPSHOT_VERSION = 1
+
+# the kinds of terms held in the term table
+URI_TERM = 0
+BLANK_TERM = 1
+LITERAL_TERM = 2
+
+
+def getSnapshotPath(dataDir):
+    """
+    Returns the path of the snapshot of the data files in the specified
+    directory.
+    """
+    return os.path.join(dataDir, SNAPSHOT_FILENAME)
+
+
+def _getSourceFiles(dataDir, patterns):
+    """
+    Returns a sorted list of (filename, size, mtime) tuples for the data
+    files in the specified directory matching the specified patterns.
+    """
+    sourceFiles = []
+    for pattern in patterns:
+        for path in glob.glob(os.path.join(dataDir, pattern)):
+            stat = os.stat(path)
+            sourceFiles.append(
+                (os.path.basename(path), stat.st_size, stat.st_mtime))
+    return sorted(sourceFiles)
+
+
+def _getTermKey(node):
+    """
+    Returns the (value, kind, datatype, language) tuple identifying the
+    specified rdflib node in the term table, or None if it is not a
+    term which can be stored.
+    """
+    if isinstance(node, rdflib.URIRef):
+        return (unicode(node), URI_TERM, "", "")
+    elif isinstance(node, rdflib.BNode):
+        return (unicode(node), BLANK_TERM, "", "")
+    elif isinstance(node, rdflib.Literal):
+        datatype = ""
+        if node.datatype is not None:
+            datatype = unicode(node.datatype)
+        return (unicode(node), LITERAL_TERM, datatype, node.language or "")
+    return None
+
+
+def isSnapshotCurrent(dataDir, patterns):
+    """
+    Returns True if the specified directory holds a snapshot of the
+    current versions of its data files matching the specified patterns.
+    """
+    snapshotPath = getSnapshotPath(dataDir)
+    if not os.path.exists(snapshotPath):
+        return False
+    try:
+        dbConn = sqlite3.connect(snapshotPath)
+        try:
+            version = dbConn.execute(
+                "SELECT value FROM metadata WHERE key = 'version'").fetchone()
+            sourceFiles = dbConn.execute(
+                "SELECT filename, size, mtime FROM source "
+                "ORDER BY filename").fetchall()
+        finally:
+            dbConn.close()
+    except sqlite3.Error:
+        return False
+    if version is None or version[0] != str(SNAPSHOT_VERSION):
+        return False
+    return [tuple(row) for row in sourceFiles] == _getSourceFiles(
+        dataDir, patterns)
+
+
+def writeSnapshot(graph, dataDir, patterns):
+    """
+    Writes a snapshot of the specified graph, parsed from the data files
+    in the specified directory matching the specified patterns. The
+    snapshot replaces any previous one atomically, so that servers
+    which have the old snapshot open are not disturbed.
+    """
+    snapshotPath = getSnapshotPath(dataDir)
+    tempPath = snapshotPath + ".tmp"
+    if os.path.exists(tempPath):
+        os.unlink(tempPath)
+    termIds = {}
+    triples = []
+    for triple in graph.triples((None, None, None)):
+        ids = []
+        for node in triple:
+            key = _getTermKey(node)
+            if key not in termIds:
+                termIds[key] = len(termIds) + 1
+            ids.append(termIds[key])
+        triples.append(tuple(ids))
+    dbConn = sqlite3.connect(tempPath)
+    try:
+        dbConn.execute(
+            "CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT)")
+        dbConn.execute(
+            "CREATE TABLE source ("
+            "filename TEXT PRIMARY KEY, size INTEGER, mtime REAL)")
+        dbConn.execute(
+            "CREATE TABLE namespace (prefix TEXT PRIMARY KEY, uri TEXT)")
+        dbConn.execute(
+            "CREATE TABLE term (id INTEGER PRIMARY KEY, value TEXT, "
+            "kind INTEGER, datatype TEXT, language TEXT)")
+        dbConn.execute(
+            "CREATE TABLE triple (subject INTEGER, predicate INTEGER, "
+            "object INTEGER, PRIMARY KEY (subject, predicate, object))")
+        dbConn.execute(
+            "INSERT INTO metadata VALUES ('version', ?)",
+            (str(SNAPSHOT_VERSION),))
+        dbConn.executemany(
+            "INSERT INTO source VALUES (?, ?, ?)",
+            _getSourceFiles(dataDir, patterns))
+        dbConn.executemany(
+            "INSERT INTO namespace VALUES (?, ?)",
+            ((prefix, unicode(uri)) for prefix, uri in graph.namespaces()))
+        dbConn.executemany(
+            "INSERT INTO term VALUES (?, ?, ?, ?, ?)",
+            ((termId,) + key for key, termId in termIds.items()))
+        dbConn.executemany(
+            "INSERT OR IGNORE INTO triple VALUES (?, ?, ?)", triples)
+        # Indexes are built after the bulk insert, which is much faster
+        # than maintaining them row by row.
+        dbConn.execute(
+            "CREATE UNIQUE INDEX term_key "
+            "ON term (value, kind, datatype, language)")
+        dbConn.execute(
+            "CREATE INDEX triple_predicate_object "
+            "ON triple (predicate, object)")
+        dbConn.execute(
+            "CREATE INDEX triple_object_subject ON triple (object, subject)")
+        dbConn.commit()
+    finally:
+        dbConn.close()
+    os.rename(tempPath, snapshotPath)
+
+
+def openSnapshotGraph(dataDir):
+    """
+    Returns an rdflib Graph reading the snapshot in the specified
+    directory.
+    """
+    return rdflib.Graph(store=SnapshotStore(getSnapshotPath(dataDir)))
+
+
+class SnapshotStore(rdflib.store.Store):
+    """
+    A read-only rdflib store over a snapshot database. Terms are turned
+    into rdflib nodes once and then shared by every triple using them.
+    """
+    def __init__(self, snapshotPath):
+        super(SnapshotStore, self).__init__()
+        self._snapshotPath = snapshotPath
+        self._dbConn = None
+        self._pid = None
+        self._termIds = {}
+        self._nodes = {}
+        self._namespaces = {}
+        self._prefixes = {}
+        for prefix, uri in self._execute(
+                "SELECT prefix, uri FROM namespace ORDER BY rowid"):
+            self.bind(prefix, rdflib.URIRef(uri))
+
+    def _execute(self, sql, args=()):
+        # Connections are not shared with forked child processes.
+        if self._dbConn is None or self._pid != os.getpid():
+            self._dbConn = sqlite3.connect(
+                self._snapshotPath, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._dbConn.execute(sql, args)
+
+    def __getstate__(self):
+        # Connections cannot be pickled, and are reopened when needed.
+        state = dict(self.__dict__)
+        state["_dbConn"] = None
+        state["_pid"] = None
+        return state
+
+    def _getTermId(self, node):
+        key = _getTermKey(node)
+        if key is None:
+            return None
+        if key not in self._termIds:
+            row = self._execute(
+                "SELECT id FROM term WHERE value = ? AND kind = ? "
+                "AND datatype = ? AND language = ?", key).fetchone()
+            self._termIds[key] = None if row is None else row[0]
+        return self._termIds[key]
+
+    def _getNode(self, termId):
+        if termId not in self._nodes:
+            value, kind, datatype, language = self._execute(
+                "SELECT value, kind, datatype, language FROM term "
+                "WHERE id = ?", (termId,)).fetchone()
+            if kind == URI_TERM:
+                node = rdflib.URIRef(value)
+            elif kind == BLANK_TERM:
+                node = rdflib.BNode(value)
+            else:
+                node = rdflib.Literal(
+                    value, lang=language or None,
+                    datatype=rdflib.URIRef(datatype) if datatype else None)
+            self._nodes[termId] = node
+        return self._nodes[termId]
+
+    def triples(self, triplePattern, context=None):
+        clauses = []
+        args = []
+        for column, node in zip(
+                ("subject", "predicate", "object"), triplePattern):
+            if node is not None:
+                termId = self._getTermId(node)
+                if termId is None:
+                    return
+                clauses.append("{} = ?".format(column))
+                args.append(termId)
+        sql = "SELECT subject, predicate, object FROM triple"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        # Triples come back in the order they were compiled in, so that
+        # results do not depend on which index SQLite chooses.
+        sql += " ORDER BY rowid"
+        for row in self._execute(sql, args).fetchall():
+            yield tuple(self._getNode(termId) for termId in row), iter(())
+
+    def __len__(self, context=None):
+        return self._execute("SELECT COUNT(*) FROM triple").fetchone()[0]
+
+    def bind(self, prefix, namespace):
+        self._prefixes[namespace] = prefix
+        self._namespaces[prefix] = namespace
+
+    def namespace(self, prefix):
+        return self._namespaces.get(prefix)
+
+    def prefix(self, namespace):
+        return self._prefixes.get(namespace)
+
+    def namespaces(self):
+        for prefix, namespace in self._namespaces.items():
+            yield prefix, namespace
@@ -7,9 +7,12 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import collections
+import re
+
 import rdflib
 
 import ga4gh.server.datamodel as datamodel
+import ga4gh.server.datamodel.g2p_snapshot as g2p_snapshot
 import ga4gh.server.exceptions as exceptions
 
 import ga4gh.schemas.protocol as protocol
@@ -19,6 +22,11 @@ TYPE = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#type'
 LABEL = 'http://www.w3.org/2000/01/rdf-schema#label'
 HAS_QUALITY = 'http://purl.obolibrary.org/obo/BFO_0000159'
 
+# the terms and labels associations are indexed by
+INDEX_KEYS = [
+    'feature', 'feature_label', 'phenotype', 'phenotype_label',
+    'phenotype_quality', 'environment_label', 'evidence_type']
+
 
 class AbstractPhenotypeAssociationSet(datamodel.DatamodelObject):
     compoundIdClass = datamodel.PhenotypeAssociationSetCompoundId
@@ -84,6 +92,28 @@ class SimulatedPhenotypeAssociationSet(AbstractPhenotypeAssociationSet):
 
 
 class G2PUtility(object):
+    dataFilePatterns = ['*.ttl']
+
+    def _loadGraph(self, dataDir):
+        """
+        Loads the graph of the data files in the specified directory,
+        from its compiled snapshot if that is up to date.
+        """
+        if g2p_snapshot.isSnapshotCurrent(dataDir, self.dataFilePatterns):
+            self._rdfGraph = g2p_snapshot.openSnapshotGraph(dataDir)
+        else:
+            self._rdfGraph = rdflib.ConjunctiveGraph()
+            self._scanDataFiles(dataDir, self.dataFilePatterns)
+
+    def writeSnapshot(self):
+        """
+        Compiles the graph into a snapshot in its data directory, which
+        is loaded instead of the data files from then on.
+        """
+        if not g2p_snapshot.isSnapshotCurrent(
+                self._dataUrl, self.dataFilePatterns):
+            g2p_snapshot.writeSnapshot(
+                self._rdfGraph, self._dataUrl, self.dataFilePatterns)
 
     def _featureTypeLabel(self, featureType):
         """
@@ -160,118 +190,6 @@ class G2PUtility(object):
             associationDetail['id'] = uriRef
         return associationDetail
 
-    def _formatExternalIdentifiers(self, element, element_type):
-        """
-        Formats several external identifiers for query
-        """
-        elementClause = None
-        elements = []
-        if not issubclass(element.__class__, dict):
-            element = protocol.toJsonDict(element)
-        if element['externalIdentifiers']:
-            for _id in element['externalIdentifiers']:
-                elements.append(self._formatExternalIdentifier(
-                    _id, element_type))
-            elementClause = "({})".format(" || ".join(elements))
-        return elementClause
-
-    def _formatExternalIdentifier(self, element, element_type):
-        """
-        Formats a single external identifier for query
-        """
-        if "http" not in element['database']:
-            term = "{}:{}".format(element['database'], element['identifier'])
-            namespaceTerm = self._toNamespaceURL(term)
-        else:
-            namespaceTerm = "{}{}".format(
-                element['database'], element['identifier'])
-        comparison = '?{} = <{}> '.format(element_type, namespaceTerm)
-        return comparison
-
-    def _formatOntologyTerm(self, element, element_type):
-        """
-        Formats the ontology terms for query
-        """
-        elementClause = None
-        if isinstance(element, dict) and element.get('terms'):
-            elements = []
-            for _term in element['terms']:
-                if _term.get('id'):
-                    elements.append('?{} = <{}> '.format(
-                        element_type, _term['id']))
-                else:
-                    elements.append('?{} = <{}> '.format(
-                        element_type, self._toNamespaceURL(_term['term'])))
-            elementClause = "({})".format(" || ".join(elements))
-        return elementClause
-
-    def _formatOntologyTermObject(self, terms, element_type):
-        """
-        Formats the ontology term object for query
-        """
-        elementClause = None
-        if not isinstance(terms, collections.Iterable):
-            terms = [terms]
-        elements = []
-        for term in terms:
-            if term.term_id:
-                elements.append('?{} = <{}> '.format(
-                    element_type, term.term_id))
-            else:
-                elements.append('?{} = <{}> '.format(
-                    element_type, self._toNamespaceURL(term.term)))
-        elementClause = "({})".format(" || ".join(elements))
-        return elementClause
-
-    def _formatFeatureClause(self, feature):
-        """
-        Format a feature for lookup by gene_symbol
-        """
-        return 'regex(?feature_label, "{}")'.format(feature.gene_symbol)
-
-    def _formatId(self, element, element_type):
-        """
-        Formats an identifiers for query
-        """
-        return '?{} = <{}> '.format(
-            element_type, element)
-
-    def _formatIds(self, element, element_type):
-        """
-        Formats a set of identifiers for query
-        """
-        elementClause = None
-        if isinstance(element, collections.Iterable):
-            elements = []
-            for _id in element:
-                elements.append('?{} = <{}> '.format(
-                    element_type, _id))
-            elementClause = "({})".format(" || ".join(elements))
-        return elementClause
-
-    def _formatEvidence(self, elements):
-        """
-        Formats elements passed into parts of a query for filtering
-        """
-        elementClause = None
-        filters = []
-        for evidence in elements:
-            if evidence.description:
-                elementClause = 'regex(?{}, "{}")'.format(
-                    'environment_label', evidence.description)
-            if (hasattr(evidence, 'externalIdentifiers') and
-                    evidence.externalIdentifiers):
-                # TODO will this pick up > 1 externalIdentifiers ?
-                for externalIdentifier in evidence['externalIdentifiers']:
-                    exid_clause = self._formatExternalIdentifier(
-                        externalIdentifier, 'environment')
-                    # cleanup parens from _formatExternalIdentifier method
-                    elementClause = exid_clause[1:-1]
-            if elementClause:
-                filters.append(elementClause)
-        elementClause = "({})".format(" || ".join(filters))
-        return elementClause
-
     def _baseQuery(self):
         """
         Returns a string with the base of the RDF query structure
@@ -456,12 +374,12 @@ class RdfPhenotypeAssociationSet(G2PUtility, AbstractPhenotypeAssociationSet):
         super(RdfPhenotypeAssociationSet, self).__init__(
             parentContainer, localId)
 
-        # initialize graph
-        self._rdfGraph = rdflib.ConjunctiveGraph()
         # save the path
         self._dataUrl = dataDir
-
-        self._scanDataFiles(dataDir, ['*.ttl'])
+        # initialize graph
+        self._loadGraph(dataDir)
+        self._associationIndex = None
+        self._associationRecords = {}
 
         # extract version
         cgdTTL = rdflib.URIRef("http://data.monarchinitiative.org/ttl/cgd.ttl")
@@ -475,163 +393,209 @@ class RdfPhenotypeAssociationSet(G2PUtility, AbstractPhenotypeAssociationSet):
             self, request=None, featureSets=[]):
         """
         This query is the main search mechanism.
-        It queries the graph for annotations that match the
-        AND of [feature,environment,phenotype].
+        It returns the associations that match the AND of the
+        [feature,environment,phenotype] restrictions in the request,
+        by intersecting the sets of associations found in the indexes.
+        The returned protocol objects are shared between requests, and
+        must not be modified.
         """
         if len(featureSets) == 0:
             featureSets = self.getParentContainer().getFeatureSets()
-        # query to do search
-        query = self._formatFilterQuery(request, featureSets)
-        associations = self._rdfGraph.query(query)
-        # associations is now a dict with rdflib terms with variable and
-        # URIrefs or literals
-
-        # given get the details for the feature,phenotype and environment
-        associations_details = self._detailTuples(
-            self._extractAssociationsDetails(
-                associations))
-
-        # association_details is now a list of {subject,predicate,object}
-        # for each of the association detail
-        # http://nmrml.org/cv/v1.0.rc1/doc/doc/objectproperties/BFO0000159___-324347567.html
-        # label "has quality at all times" (en)
-        associationList = []
-        for assoc in associations.bindings:
+        index = self._getAssociationIndex()
+        positions = None
+        for matches in self._getAssociationMatches(request, featureSets):
+            if positions is None:
+                positions = matches
+            else:
+                positions = positions & matches
+        if positions is None:
+            positions = range(len(index["associations"]))
+        records = self._getAssociationRecords(featureSets)
+        return [records[position] for position in sorted(positions)]
+
+    def _getAssociationIndex(self):
+        """
+        Returns the associations in this set, with hash indexes from the
+        terms and labels searches filter on to the sets of positions of the
+        associations having them. The index is built on first use.
+        """
+        if self._associationIndex is None:
+            self._associationIndex = self._buildAssociationIndex()
+        return self._associationIndex
+
+    def _buildAssociationIndex(self):
+        query = self._baseQuery().replace("#%FILTER%", "")
+        results = self._rdfGraph.query(query)
+        detailsMap = {}
+
+        def getDetails(uriRef):
+            if uriRef not in detailsMap:
+                detailsMap[uriRef] = self._getDetails(
+                    uriRef, self._detailTuples([rdflib.URIRef(uriRef)]))
+            return detailsMap[uriRef]
+
+        def getObjects(uriRef, predicate):
+            return [
+                obj.toPython() for obj in self._rdfGraph.objects(
+                    rdflib.URIRef(uriRef), rdflib.URIRef(predicate))]
+
+        associations = []
+        for assoc in results.bindings:
             if '?feature' in assoc:
                 association = self._bindingsToDict(assoc)
-                association['feature'] = self._getDetails(
-                    association['feature'],
-                    associations_details)
-                association['environment'] = self._getDetails(
-                    association['environment'],
-                    associations_details)
-                association['phenotype'] = self._getDetails(
-                    association['phenotype'],
-                    associations_details)
-                association['evidence'] = association['phenotype'][HAS_QUALITY]
                 association['id'] = association['association']
-                associationList.append(association)
-
-                # our association list is now a list of dicts with the
-                # elements of an association: environment, evidence,
-                # feature, phenotype and sources, each with their
-                # references (labels or URIrefs)
-
-        # create GA4GH objects
-        associations = [
-            self._toGA4GH(assoc, featureSets) for
-            assoc in associationList]
-        return associations
-
-    def _formatFilterQuery(self, request=None, featureSets=[]):
-        """
-        Generate a formatted sparql query with appropriate filters
-        """
-        query = self._baseQuery()
-        filters = []
-        if issubclass(request.__class__,
-                      protocol.SearchGenotypePhenotypeRequest):
-            filters += self._filterSearchGenotypePhenotypeRequest(
-                request, featureSets)
-
-        if issubclass(request.__class__, protocol.SearchPhenotypesRequest):
-            filters += self._filterSearchPhenotypesRequest(request)
-
-        # apply filters
-        filter = "FILTER ({})".format(' && '.join(filters))
-        if len(filters) == 0:
-            filter = ""
-        query = query.replace("#%FILTER%", filter)
-        return query
-
-    def _filterSearchGenotypePhenotypeRequest(self, request, featureSets):
-        filters = []
-        if request.feature_ids:
-            featureFilters = []
-            for featureId in request.feature_ids:
-                for featureSet in featureSets:
-                    try:
-                        compoundId = datamodel.FeatureCompoundId. \
-                                                parse(featureId)
-                        # we have a compoundId, so use it to lookup
-                        # import ipdb; ipdb.set_trace()
-                        if compoundId.feature_set == self.getLocalId():
-                            featureFilters.append(
-                                self._formatId(
-                                    compoundId.featureId, 'feature'))
+                associations.append(association)
+        associations.sort(key=lambda association: association['id'])
+        index = {"associations": associations}
+        for key in INDEX_KEYS:
+            index[key] = collections.defaultdict(set)
+        for position, association in enumerate(associations):
+            feature = association['feature']
+            phenotype = association['phenotype']
+            environment = association['environment']
+            terms = {
+                'feature': [feature],
+                'feature_label': getObjects(feature, LABEL),
+                'phenotype': [phenotype],
+                'phenotype_label': getObjects(phenotype, LABEL),
+                'phenotype_quality': getObjects(phenotype, HAS_QUALITY),
+                'environment_label': getObjects(environment, LABEL),
+                'evidence_type': [association['evidence_type']],
+            }
+            for key, values in terms.items():
+                for value in values:
+                    index[key][value].add(position)
+            association['feature'] = getDetails(feature)
+            association['environment'] = getDetails(environment)
+            association['phenotype'] = getDetails(phenotype)
+            association['evidence'] = association['phenotype'][HAS_QUALITY]
+        return index
+
+    def _getAssociationRecords(self, featureSets):
+        """
+        Returns the list of protocol associations in the order of the
+        index, with feature IDs resolved against the specified feature
+        sets. The records are cached for each list of feature sets.
+        """
+        key = tuple(featureSet.getId() for featureSet in featureSets)
+        if key not in self._associationRecords:
+            self._associationRecords[key] = [
+                self._toGA4GH(association, featureSets)
+                for association in self._getAssociationIndex()[
+                    "associations"]]
+        return self._associationRecords[key]
+
+    def _matchTerms(self, key, terms):
+        """
+        Returns the set of positions of the associations having any of the
+        specified terms in the specified index.
+        """
+        index = self._getAssociationIndex()[key]
+        positions = set()
+        for term in terms:
+            positions.update(index.get(term, ()))
+        return positions
+
+    def _matchRegex(self, key, pattern):
+        """
+        Returns the set of positions of the associations having a value
+        in the specified index which the specified regex matches.
+        """
+        try:
+            regex = re.compile(pattern)
+        except re.error:
+            raise exceptions.BadFeatureSetSearchRequestRegularExpression()
+        return self._matchTerms(key, [
+            value for value in self._getAssociationIndex()[key]
+            if regex.search(value)])
+
+    def _getAssociationMatches(self, request, featureSets):
+        """
+        Returns a list of the sets of positions of the associations
+        matching each restriction in the specified request.
+        """
+        matches = []
+        if isinstance(request, protocol.SearchGenotypePhenotypeRequest):
+            if request.feature_ids:
+                matches.append(self._matchFeatureIds(
+                    request.feature_ids, featureSets))
+            if request.evidence:
+                evidenceMatches = self._matchEvidence(request.evidence)
+                if evidenceMatches is not None:
+                    matches.append(evidenceMatches)
+            if request.phenotype_ids:
+                matches.append(self._matchTerms(
+                    'phenotype', request.phenotype_ids))
+        if isinstance(request, protocol.SearchPhenotypesRequest):
+            if request.id:
+                matches.append(self._matchTerms('phenotype', [request.id]))
+            if request.description:
+                matches.append(self._matchRegex(
+                    'phenotype_label', request.description))
+            # TODO: OntologyTerm has no id, so type and age_of_onset are
+            # never used as restrictions
+            if hasattr(request.type, 'id') and request.type.id:
+                matches.append(self._matchTerms(
+                    'phenotype', self._getOntologyTermUrls([request.type])))
+            if len(request.qualifiers) > 0:
+                matches.append(self._matchTerms(
+                    'phenotype_quality',
+                    self._getOntologyTermUrls(request.qualifiers)))
+            if hasattr(request.age_of_onset, 'id') and \
+                    request.age_of_onset.id:
+                matches.append(self._matchTerms(
+                    'phenotype_quality',
+                    self._getOntologyTermUrls([request.age_of_onset])))
+        return matches
+
+    def _getOntologyTermUrls(self, terms):
+        return [
+            term.term_id if term.term_id else self._toNamespaceURL(term.term)
+            for term in terms]
+
+    def _matchFeatureIds(self, featureIds, featureSets):
+        """
+        Returns the set of positions of the associations with the specified
+        features, either from this set or matched by gene symbol from
+        features in other feature sets.
+        """
+        positions = set()
+        for featureId in featureIds:
+            for featureSet in featureSets:
+                try:
+                    compoundId = datamodel.FeatureCompoundId.parse(featureId)
+                    if compoundId.feature_set == self.getLocalId():
+                        positions.update(self._matchTerms(
+                            'feature', [compoundId.featureId]))
+                        break
+                    else:
+                        feature = featureSet.getFeature(compoundId)
+                        if feature:
+                            positions.update(self._matchRegex(
+                                'feature_label', feature.gene_symbol))
                             break
-                        else:
-                            feature = featureSet.getFeature(compoundId)
-                            if feature:
-                                featureFilters.append(
-                                    self._formatFeatureClause(feature))
-                                break
-                    except Exception:
-                        featureFilters.append(
-                            self._formatId("NO-FIND", 'feature'))
-            if len(featureFilters) > 0:
-                filters.append("({})".format(" || ".join(featureFilters)))
-
-        if request.evidence:
-            evidenceClause = self._formatEvidence(request.evidence)
-            if evidenceClause:
-                filters.append(evidenceClause)
-
-        if request.phenotype_ids:
-            phenotypeClause = self._formatIds(
-                request.phenotype_ids, 'phenotype')
-            filters.append(phenotypeClause)
-
-        return filters
-
-    def _filterSearchGenotypesRequest(self, request):
-        """
-        Filters the request for genotype search requests
-        """
-        filters = []
-        if request.id:
-            filters.append("?feature = <{}>".format(request.id))
-
-        if request.reference_name:
-            filters.append(
-                'regex(?feature_label, "{}")'.format(request.reference_name))
-
-        featureClause = self._formatExternalIdentifiers(request, 'external_id')
-        if featureClause:
-            filters.append(featureClause)
-        # OntologyTerms
-        featureOntologytermsClause = self._formatOntologyTerm(
-            request, 'feature')
-        if featureOntologytermsClause:
-            filters.append(featureOntologytermsClause)
-        return filters
-
-    def _filterSearchPhenotypesRequest(self, request):
-        """
-        Filters request for phenotype search requests
-        """
-        filters = []
-        if request.id:
-            filters.append("?phenotype = <{}>".format(request.id))
-
-        if request.description:
-            filters.append(
-                'regex(?phenotype_label, "{}")'.format(request.description))
-        # OntologyTerms
-        # TODO: refactor this repetitive code
-        if hasattr(request.type, 'id') and request.type.id:
-            ontolgytermsClause = self._formatOntologyTermObject(
-                request.type, 'phenotype')
-            if ontolgytermsClause:
-                filters.append(ontolgytermsClause)
-        if len(request.qualifiers) > 0:
-            ontolgytermsClause = self._formatOntologyTermObject(
-                request.qualifiers, 'phenotype_quality')
-            if ontolgytermsClause:
-                filters.append(ontolgytermsClause)
-        if hasattr(request.age_of_onset, 'id') and request.age_of_onset.id:
-            ontolgytermsClause = self._formatOntologyTermObject(
-                request.age_of_onset, 'phenotype_quality')
-            if ontolgytermsClause:
-                filters.append(ontolgytermsClause)
-        return filters
+                except Exception:
+                    pass
+        return positions
+
+    def _matchEvidence(self, evidenceQueries):
+        """
+        Returns the set of positions of the associations matching any of
+        the specified evidence queries, where the description is matched
+        against the environment labels and the evidence type against the
+        evidence term IDs, or None if no query restricts either.
+        """
+        positions = None
+        for evidenceQuery in evidenceQueries:
+            matches = []
+            if evidenceQuery.description:
+                matches.append(self._matchRegex(
+                    'environment_label', evidenceQuery.description))
+            if evidenceQuery.evidenceType.term_id:
+                matches.append(self._matchTerms(
+                    'evidence_type', [evidenceQuery.evidenceType.term_id]))
+            if matches:
+                if positions is None:
+                    positions = set()
+                positions.update(set.intersection(*matches))
+        return positions
@@ -31,6 +31,54 @@ ASSOCIATION = "http://purl.org/oban/association"
 HAS_SUBJECT = "http://purl.org/oban/association_has_subject"
 
 
+def _buildNestedList(begins, ends):
+    """
+    Returns a nested containment list of the intervals with the specified
+    inclusive begins and ends, which must be sorted by begin. Each list is
+    a (begins, ends, indexes, sublists) tuple of the intervals it holds,
+    sorted by begin, none of which contains another, so that their ends
+    are sorted too. The sublist of an interval holds the intervals
+    contained in it.
+    """
+    def newList():
+        return ([], [], [], [])
+    topList = newList()
+    # The intervals which may contain the next one, innermost last
+    containers = [(float('inf'), topList)]
+    order = sorted(range(len(begins)), key=lambda i: (begins[i], -ends[i]))
+    for index in order:
+        while containers[-1][0] < ends[index]:
+            containers.pop()
+        nestedList = containers[-1][1]
+        sublist = newList()
+        nestedList[0].append(begins[index])
+        nestedList[1].append(ends[index])
+        nestedList[2].append(index)
+        nestedList[3].append(sublist)
+        containers.append((ends[index], sublist))
+    return topList
+
+
+def _searchNestedList(topList, start, end):
+    """
+    Returns the indexes of the intervals in the specified nested
+    containment list which overlap the inclusive region from start to
+    end, where an end of None is unbounded, in no particular order.
+    """
+    indexes = []
+    lists = [topList]
+    while len(lists) > 0:
+        begins, ends, listIndexes, sublists = lists.pop()
+        # Only the sublists of overlapping intervals can overlap.
+        i = bisect.bisect_left(ends, start)
+        while i < len(begins) and (end is None or begins[i] <= end):
+            indexes.append(listIndexes[i])
+            if len(sublists[i][0]) > 0:
+                lists.append(sublists[i])
+            i += 1
+    return indexes
+
+
 class PhenotypeAssociationFeatureSet(
         g2p.G2PUtility, sequence_annotations.Gff3DbFeatureSet):
     """
@@ -63,11 +111,10 @@ class PhenotypeAssociationFeatureSet(
         If path is set, this backend will load itself
         """
         self._dbFilePath = dataUrl
-        # initialize graph
-        self._rdfGraph = rdflib.ConjunctiveGraph()
         # save the path
         self._dataUrl = dataUrl
-        self._scanDataFiles(self._dataUrl, ['*.ttl'])
+        # initialize graph
+        self._loadGraph(self._dataUrl)
 
         # extract version
         cgdTTL = rdflib.URIRef("http://data.monarchinitiative.org/ttl/cgd.ttl")
@@ -90,6 +137,15 @@ class PhenotypeAssociationFeatureSet(
         feature.id = str(compoundId)
         return feature
 
+    # mimic featureset
+    def getFeaturesByIds(self, compoundIds):
+        """
+        find features and return ga4gh representations in the order of
+        the compoundIds, use compoundId as featureId
+        """
+        return sequence_annotations.AbstractFeatureSet.getFeaturesByIds(
+            self, compoundIds)
+
     def _getFeatureById(self, featureId):
         """
         find a feature and return ga4gh representation, use 'native' id as
@@ -140,26 +196,37 @@ class PhenotypeAssociationFeatureSet(
     def getFeatures(self, referenceName=None, start=None, end=None,
                     startIndex=None, maxResults=None,
                     featureTypes=None, parentId=None,
-                    name=None, geneSymbol=None, numFeatures=10):
-
-        # query to do search
-        query = self._filterSearchFeaturesRequest(
-            referenceName, geneSymbol, name, start, end)
-        featuresResults = self._rdfGraph.query(query)
-        featureIds = set()
-        try:
-            for row in featuresResults.bindings:
-                featureIds.add(row['feature'].toPython())
-        except re.error:
-            raise exceptions.BadFeatureSetSearchRequestRegularExpression()
+                    name=None, geneSymbol=None, numFeatures=10,
+                    includeDescendants=False, namePrefix=None):
+
+        featureIds = None
+        if referenceName:
+            featureIds = self._findLocations(referenceName, start, end)
+        if name or geneSymbol or namePrefix or featureIds is None:
+            query = self._filterSearchFeaturesRequest(
+                geneSymbol, name, namePrefix)
+            featuresResults = self._rdfGraph.query(query)
+            matchingIds = set()
+            try:
+                for row in featuresResults.bindings:
+                    matchingIds.add(row['feature'].toPython())
+            except re.error:
+                raise exceptions.BadFeatureSetSearchRequestRegularExpression()
+            if featureIds is None:
+                featureIds = sorted(matchingIds)
+            else:
+                featureIds = [
+                    featureId for featureId in featureIds
+                    if featureId in matchingIds]
 
         if startIndex:
             startPosition = int(startIndex)
         else:
             startPosition = 0
-        for i, featureId in enumerate(featureIds):
-            if i < startPosition:
-                continue
+        endPosition = None
+        if maxResults:
+            endPosition = startPosition + maxResults
+        for featureId in featureIds[startPosition:endPosition]:
             feature = self._getFeatureById(featureId)
             # _getFeatureById returns native id, cast to compound
             feature.id = self.getCompoundIdForFeatureId(feature.id)
@@ -181,22 +248,25 @@ class PhenotypeAssociationFeatureSet(
         ORDER BY ?feature
         """
 
-    def _filterSearchFeaturesRequest(self, reference_name, gene_symbol, name,
-                                     start, end):
+    def _filterSearchFeaturesRequest(self, gene_symbol, name,
+                                     name_prefix=None):
         """
         formulate a sparql query string based on parameters
         """
-        filters = []
         query = self._baseQuery()
         filters = []
-        location = self._findLocation(reference_name, start, end)
-        if location:
-            filters.append("?feature = <{}>".format(location))
         if gene_symbol:
-            filters.append('regex(?feature_label, "{}")')
+            filters.append(
+                'regex(?feature_label, "{}")'.format(gene_symbol))
         if name:
             filters.append(
                 'regex(?feature_label, "{}")'.format(name))
+        if name_prefix:
+            # plain string comparison, so the prefix needs no regex escaping
+            literal = name_prefix.lower().replace(
+                '\\', '\\\\').replace('"', '\\"')
+            filters.append(
+                'STRSTARTS(LCASE(?feature_label), "{}")'.format(literal))
         # apply filters
         filter = "FILTER ({})".format(' && '.join(filters))
         if len(filters) == 0:
@@ -204,22 +274,36 @@ class PhenotypeAssociationFeatureSet(
         query = query.replace("#%FILTER%", filter)
         return query
 
-    def _findLocation(self, reference_name, start, end):
+    def _findLocations(self, reference_name, start, end):
         """
-        return a location key form the locationMap
+        Returns the IDs of the features on the specified chromosome
+        overlapping the specified region, in order of position. FALDO
+        positions are inclusive, so a region with equal start and end
+        finds the features at that position. The features are found in a
+        nested containment list, so that only overlapping features are
+        visited however long the others are.
         """
-        try:
-            # TODO - sequence_annotations does not have build?
-            return self._locationMap['hg19'][reference_name][start][end]
-        except:
-            return None
+        # TODO - sequence_annotations does not have build?
+        index = self._locationIndex.get('hg19', {}).get(reference_name)
+        if index is None:
+            return []
+        featureIds, nestedList = index
+        if start is None:
+            start = 0
+        return [
+            featureIds[i]
+            for i in sorted(_searchNestedList(nestedList, start, end))]
 
     def _initializeLocationCache(self):
         """
         CGD uses Faldo ontology for locations, it's a bit complicated.
         This function sets up an in memory cache of all locations, which
         can be queried via:
-        locationMap[build][chromosome][begin][end] = location["_id"]
+        locationMap[featureId] = {build, chromosome, begin, end}
+        and an index of the features on each chromosome, sorted by
+        position, with a nested containment list of their locations which
+        is searched for overlaps by _findLocations:
+        locationIndex[build][chromosome] = (ids, nestedList)
         """
         # cache of locations
         self._locationMap = {}
@@ -297,19 +381,23 @@ class PhenotypeAssociationFeatureSet(
                         chromosome = faldoReference[LABEL].split(' ')[0]
                         begin = faldoBegins[idx][FALDO_POSITION]
                         end = faldoEnds[idx][FALDO_POSITION]
-                        if build not in locationMap:
-                            locationMap[build] = {}
-                        if chromosome not in locationMap[build]:
-                            locationMap[build][chromosome] = {}
-                        if begin not in locationMap[build][chromosome]:
-                            locationMap[build][chromosome][begin] = {}
-                        if end not in locationMap[build][chromosome][begin]:
-                            locationMap[build][chromosome][begin][end] = {}
-                        locationMap[build][chromosome][begin][end] = \
-                            location["_id"]
                         locationMap[location["_id"]] = {
                             "build": build,
                             "chromosome": chromosome,
                             "begin": begin,
                             "end": end,
                         }
+
+        positions = {}
+        for featureId, location in locationMap.items():
+            positions.setdefault(location["build"], {}).setdefault(
+                location["chromosome"], []).append(
+                (location["begin"], location["end"], featureId))
+        self._locationIndex = {}
+        for build, chromosomes in positions.items():
+            self._locationIndex[build] = {}
+            for chromosome, features in chromosomes.items():
+                features.sort()
+                begins, ends, featureIds = zip(*features)
+                self._locationIndex[build][chromosome] = (
+                    featureIds, _buildNestedList(begins, ends))
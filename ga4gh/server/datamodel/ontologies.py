@@ -6,7 +6,9 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import collections
-import os.path
+import cPickle
+import hashlib
+import os
 
 import ga4gh.server.exceptions as exceptions
 import ga4gh.server.datamodel.obo_parser as obo_parser
@@ -16,6 +18,21 @@ import ga4gh.schemas.protocol as protocol
 
 SEQUENCE_ONTOLOGY_PREFIX = "SO"
 
+# Suffix and format version of the compiled cache of an OBO file.
+ONTOLOGY_CACHE_SUFFIX = ".cache"
+ONTOLOGY_CACHE_VERSION = 2
+
+
+def _getChecksum(path):
+    """
+    Returns the SHA1 hex digest of the contents of the specified file.
+    """
+    checksum = hashlib.sha1()
+    with open(path, "rb") as dataFile:
+        for block in iter(lambda: dataFile.read(2**20), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
 
 class OboReader(obo_parser.OBOReader):
     """
@@ -33,7 +50,9 @@ class Ontology(object):
     """
     A bidectional map between ontology names and IDs (e.g. in Sequence
     Ontology we would have "SO:0001583 <-> missense_variant") derived
-    from an OBO file.
+    from an OBO file. Parsing a large OBO file is slow, so the map is
+    written to a compiled cache next to the file when the ontology is
+    added to a repo, and read back from there while the file is unchanged.
     """
     def __init__(self, name):
         self._id = None
@@ -44,10 +63,63 @@ class Ontology(object):
         self._dataUrl = None
         # There can be duplicate names, so we need to store a list of IDs.
         self._nameIdMap = collections.defaultdict(list)
+        # The is_a parents of each term, and the primary ID of each
+        # alternative ID.
+        self._parentIdMap = {}
+        self._alternativeIdMap = {}
+        self._termBits = None
+        self._ancestorMasks = None
+        # OntologyTerm protocol objects, built once for each name.
+        self._gaTerms = {}
 
-    def _readFile(self):
+    def _load(self):
         if not os.path.exists(self._dataUrl):
             raise exceptions.FileOpenFailedException(self._dataUrl)
+        if not self._readCache():
+            self._readFile()
+
+    def getCachePath(self):
+        """
+        Returns the path of the compiled cache of this ontology's OBO file.
+        """
+        return self._dataUrl + ONTOLOGY_CACHE_SUFFIX
+
+    def _readCache(self):
+        """
+        Reads this ontology from its compiled cache, if there is one for
+        the current contents of the OBO file. Returns True if the cache
+        was read.
+        """
+        try:
+            with open(self.getCachePath(), "rb") as cacheFile:
+                version, checksum, state = cPickle.load(cacheFile)
+        except Exception:
+            return False
+        if version != ONTOLOGY_CACHE_VERSION or \
+                checksum != _getChecksum(self._dataUrl):
+            return False
+        (nameIdMap, self._parentIdMap, self._alternativeIdMap,
+            self._ontologyPrefix, self._sourceVersion) = state
+        self._nameIdMap = collections.defaultdict(list, nameIdMap)
+        return True
+
+    def writeCache(self):
+        """
+        Writes the compiled cache of this ontology's OBO file. The cache
+        replaces any previous one atomically.
+        """
+        cachePath = self.getCachePath()
+        tempPath = cachePath + ".tmp"
+        state = (
+            dict(self._nameIdMap), self._parentIdMap, self._alternativeIdMap,
+            self._ontologyPrefix, self._sourceVersion)
+        with open(tempPath, "wb") as cacheFile:
+            cPickle.dump(
+                (ONTOLOGY_CACHE_VERSION, _getChecksum(self._dataUrl), state),
+                cacheFile, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tempPath, cachePath)
+
+    def _readFile(self):
         reader = OboReader(obo_file=self._dataUrl)
         ids = set()
         for record in reader:
@@ -56,6 +128,9 @@ class Ontology(object):
                     self._dataUrl, "Duplicate ID {}".format(record.id))
             ids.add(record.id)
             self._nameIdMap[record.name].append(record.id)
+            self._parentIdMap[record.id] = record._parents
+            for altId in record.alt_ids:
+                self._alternativeIdMap[altId] = record.id
         self._sourceVersion = reader.format_version
         if len(ids) == 0:
             raise exceptions.OntologyFileFormatException(
@@ -71,7 +146,7 @@ class Ontology(object):
         specified file.
         """
         self._dataUrl = dataUrl
-        self._readFile()
+        self._load()
 
     def populateFromRow(self, ontologyRecord):
         """
@@ -79,7 +154,7 @@ class Ontology(object):
         """
         self._id = ontologyRecord.id
         self._dataUrl = ontologyRecord.dataurl
-        self._readFile()
+        self._load()
         # TODO sanity check the stored values against what we have just read.
 
     def getId(self):
@@ -116,25 +191,115 @@ class Ontology(object):
         Returns the list of ontology IDs scorresponding to the specified term
         name. If the term name is not found, return the empty list.
         """
-        return self._nameIdMap[termName]
+        return self._nameIdMap.get(termName, [])
+
+    def _getPrimaryId(self, termId):
+        return self._alternativeIdMap.get(termId, termId)
+
+    def _getAncestorMasks(self):
+        """
+        Returns a map from each term ID to a bitset of the term and all
+        of its is_a ancestors, where each term has the bit numbered by its
+        position in the sorted list of term IDs. The transitive closure
+        is computed on first use.
+        """
+        if self._ancestorMasks is None:
+            termIds = sorted(self._parentIdMap)
+            bits = dict(
+                (termId, 1 << index) for index, termId in enumerate(termIds))
+            masks = {}
+            for termId in termIds:
+                # Iterative post-order depth first search, as the hierarchy
+                # can be deeper than the recursion limit allows. A term's
+                # mask is made once the masks of all its parents are done.
+                stack = [(termId, False)]
+                expanding = set()
+                while stack:
+                    currentId, expanded = stack.pop()
+                    if currentId in masks:
+                        continue
+                    parentIds = [
+                        self._getPrimaryId(parentId) for parentId in
+                        self._parentIdMap[currentId]]
+                    if not expanded:
+                        stack.append((currentId, True))
+                        expanding.add(currentId)
+                        # Parents still being expanded would be cycles.
+                        stack.extend(
+                            (parentId, False) for parentId in parentIds
+                            if parentId in bits and parentId not in masks and
+                            parentId not in expanding)
+                        continue
+                    expanding.discard(currentId)
+                    mask = bits[currentId]
+                    for parentId in parentIds:
+                        mask |= masks.get(parentId, 0)
+                    masks[currentId] = mask
+            self._termBits = bits
+            self._ancestorMasks = masks
+        return self._ancestorMasks
+
+    def getTermMask(self, termIds):
+        """
+        Returns the bitset of the specified term IDs. IDs which are not in
+        this ontology are ignored.
+        """
+        self._getAncestorMasks()
+        mask = 0
+        for termId in termIds:
+            mask |= self._termBits.get(self._getPrimaryId(termId), 0)
+        return mask
+
+    def getAncestorMask(self, termId):
+        """
+        Returns the bitset of the specified term and all of its is_a
+        ancestors, so that a term is a descendant of the terms in a mask
+        from getTermMask when the two bitsets intersect.
+        """
+        return self._getAncestorMasks().get(self._getPrimaryId(termId), 0)
+
+    def getTermNames(self, termIds, includeDescendants=False):
+        """
+        Returns the set of term names which getGaTermByName maps to one of
+        the specified term IDs or, if includeDescendants is True, to one of
+        them or their is_a descendants.
+        """
+        termIds = set(termIds)
+        mask = self.getTermMask(termIds)
+        names = set()
+        for name, nameTermIds in self._nameIdMap.items():
+            if len(nameTermIds) == 0:
+                continue
+            termId = nameTermIds[0]
+            if includeDescendants:
+                matches = self.getAncestorMask(termId) & mask != 0
+            else:
+                matches = termId in termIds
+            if matches:
+                names.add(name)
+        return names
 
     def getGaTermByName(self, name):
         """
-        Returns a GA4GH OntologyTerm object by name.
+        Returns a GA4GH OntologyTerm object by name. The object is shared
+        by all callers, who must copy it rather than modify it.
 
         :param name: name of the ontology term, ex. "gene".
         :return: GA4GH OntologyTerm object.
         """
-        # TODO what is the correct value when we have no mapping??
-        termIds = self.getTermIds(name)
-        if len(termIds) == 0:
-            termId = ""
-            # TODO add logging for missed term translation.
-        else:
-            # TODO what is the correct behaviour here when we have multiple
-            # IDs matching a given name?
-            termId = termIds[0]
-        term = protocol.OntologyTerm()
-        term.term = name
-        term.term_id = termId
+        term = self._gaTerms.get(name)
+        if term is None:
+            # TODO what is the correct value when we have no mapping??
+            termIds = self.getTermIds(name)
+            if len(termIds) == 0:
+                termId = ""
+                # TODO add logging for missed term translation.
+            else:
+                # TODO what is the correct behaviour here when we have
+                # multiple IDs matching a given name?
+                termId = termIds[0]
+            term = protocol.OntologyTerm()
+            term.term = name
+            term.term_id = termId
+            self._gaTerms[name] = term
         return term
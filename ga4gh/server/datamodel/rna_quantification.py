@@ -6,6 +6,13 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import array
+import json
+import mmap
+import os
+import struct
+import sys
+
 import ga4gh.server.datamodel as datamodel
 import ga4gh.server.exceptions as exceptions
 import ga4gh.server.sqlite_backend as sqlite_backend
@@ -27,6 +34,208 @@ import ga4gh.schemas.protocol as protocol
 """
 
 
+"""
+    Each RNA quantification set DB can have an expression matrix column store
+    alongside it, in a file with the same name plus EXPRESSION_MATRIX_SUFFIX.
+    It holds the expression value of every feature in every quantification,
+    so that comparisons across quantifications read contiguous float32
+    values instead of materializing ExpressionLevel objects. The file is:
+
+    MATRIX_MAGIC
+    uint32 header length (little-endian)
+    JSON header: {"rnaQuantificationIds": [...], "featureIds": [...],
+                  "names": [...]}
+    padding to a multiple of 4 bytes
+    float32 values (little-endian), one row per quantification and one
+    column per feature, with NaN where a feature has no expression level.
+
+    The binary output of the expression matrix endpoint uses the same
+    layout without the magic string and padding.
+"""
+EXPRESSION_MATRIX_SUFFIX = ".matrix"
+MATRIX_MAGIC = b"GA4GHEXM"
+
+
+def _toLittleEndianBytes(values):
+    """
+    Returns the bytes of the specified float32 array in little-endian order.
+    """
+    if sys.byteorder != "little":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tostring()
+
+
+class ExpressionMatrix(object):
+    """
+    A (quantifications x features) matrix of expression values, held in
+    a buffer of little-endian float32 values which may be memory-mapped.
+    Features are identified by their expression level name, which is
+    unique within a quantification, and also carry their feature ID.
+    """
+    def __init__(
+            self, rnaQuantificationIds, featureIds, names, buffer_,
+            offset=0):
+        self._rnaQuantificationIds = rnaQuantificationIds
+        self._featureIds = featureIds
+        self._names = names
+        self._buffer = buffer_
+        self._offset = offset
+        self._rowIndexes = dict(
+            (id_, index) for index, id_ in enumerate(rnaQuantificationIds))
+        self._numColumns = len(names)
+
+    @classmethod
+    def fromValues(cls, expressionValues):
+        """
+        Builds the matrix from the specified iterable of
+        (rnaQuantificationId, name, featureId, expression) tuples.
+        """
+        rnaQuantificationIds = []
+        rowIndexes = {}
+        featureIds = []
+        names = []
+        columnIndexes = {}
+        cells = []
+        for rnaQuantificationId, name, featureId, expression in \
+                expressionValues:
+            if rnaQuantificationId not in rowIndexes:
+                rowIndexes[rnaQuantificationId] = len(rnaQuantificationIds)
+                rnaQuantificationIds.append(rnaQuantificationId)
+            if name not in columnIndexes:
+                columnIndexes[name] = len(names)
+                names.append(name)
+                featureIds.append(featureId)
+            cells.append((
+                rowIndexes[rnaQuantificationId], columnIndexes[name],
+                expression))
+        values = array.array(
+            b"f", [float("nan")]) * (len(rnaQuantificationIds) * len(names))
+        for row, column, expression in cells:
+            values[row * len(names) + column] = expression
+        return cls(
+            rnaQuantificationIds, featureIds, names,
+            _toLittleEndianBytes(values))
+
+    @classmethod
+    def fromDb(cls, dataSource):
+        """
+        Builds the matrix from the Expression table of the specified open
+        SqliteRnaBackend.
+        """
+        return cls.fromValues(dataSource.getExpressionValues())
+
+    @classmethod
+    def fromFile(cls, filePath):
+        """
+        Memory-maps the column store in the specified file.
+        """
+        with open(filePath, "rb") as matrixFile:
+            buffer_ = mmap.mmap(
+                matrixFile.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer_[:len(MATRIX_MAGIC)] != MATRIX_MAGIC:
+            raise exceptions.FileOpenFailedException(filePath)
+        headerStart = len(MATRIX_MAGIC) + 4
+        headerLength, = struct.unpack_from(
+            b"<I", buffer_, len(MATRIX_MAGIC))
+        header = json.loads(buffer_[headerStart:headerStart + headerLength])
+        offset = headerStart + headerLength
+        offset += -offset % 4
+        return cls(
+            header["rnaQuantificationIds"], header["featureIds"],
+            header["names"], buffer_, offset)
+
+    def _getHeaderBytes(self):
+        return json.dumps({
+            "rnaQuantificationIds": self._rnaQuantificationIds,
+            "featureIds": self._featureIds,
+            "names": self._names}).encode("utf-8")
+
+    def _getValueBytes(self):
+        end = self._offset + 4 * len(self._rnaQuantificationIds) * \
+            self._numColumns
+        return self._buffer[self._offset:end]
+
+    def write(self, filePath):
+        """
+        Writes this matrix as a column store to the specified file.
+        """
+        header = self._getHeaderBytes()
+        offset = len(MATRIX_MAGIC) + 4 + len(header)
+        with open(filePath, "wb") as matrixFile:
+            matrixFile.write(MATRIX_MAGIC)
+            matrixFile.write(struct.pack(b"<I", len(header)))
+            matrixFile.write(header)
+            matrixFile.write(b"\0" * (-offset % 4))
+            matrixFile.write(self._getValueBytes())
+
+    def getRnaQuantificationIds(self):
+        return self._rnaQuantificationIds
+
+    def getFeatureIds(self):
+        return self._featureIds
+
+    def getNames(self):
+        return self._names
+
+    def getRowIndex(self, rnaQuantificationId):
+        """
+        Returns the row of the specified quantification, or None if it
+        has no expression levels.
+        """
+        return self._rowIndexes.get(rnaQuantificationId)
+
+    def getRow(self, rowIndex, columnIndexes=None):
+        """
+        Returns the float32 array of values in the specified row, restricted
+        to the specified columns if given.
+        """
+        start = self._offset + 4 * rowIndex * self._numColumns
+        if columnIndexes is None:
+            row = array.array(
+                b"f", self._buffer[start:start + 4 * self._numColumns])
+            if sys.byteorder != "little":
+                row.byteswap()
+            return row
+        return array.array(b"f", [
+            struct.unpack_from(b"<f", self._buffer, start + 4 * column)[0]
+            for column in columnIndexes])
+
+    def selectColumns(self, featureIds=None, threshold=None):
+        """
+        Returns the indexes of the columns for the specified feature IDs,
+        or of all columns if none are given, keeping only those with a
+        value above threshold in at least one row if threshold is given.
+        """
+        if featureIds:
+            featureIds = set(featureIds)
+            columnIndexes = [
+                index for index, featureId in enumerate(self._featureIds)
+                if featureId in featureIds]
+        else:
+            columnIndexes = range(self._numColumns)
+        if threshold is not None:
+            keep = set()
+            for rowIndex in range(len(self._rnaQuantificationIds)):
+                row = self.getRow(rowIndex)
+                keep.update(
+                    index for index in columnIndexes
+                    if row[index] > threshold)
+            columnIndexes = [
+                index for index in columnIndexes if index in keep]
+        return columnIndexes
+
+
+def writeExpressionMatrix(dbFilePath):
+    """
+    Builds the expression matrix column store alongside the RNA
+    quantification set DB with the specified path.
+    """
+    with SqliteRnaBackend(dbFilePath) as dataSource:
+        matrix = ExpressionMatrix.fromDb(dataSource)
+    matrix.write(dbFilePath + EXPRESSION_MATRIX_SUFFIX)
+
+
 class AbstractExpressionLevel(datamodel.DatamodelObject):
     """
     An abstract base class of a expression level
@@ -62,14 +271,25 @@ class AbstractExpressionLevel(datamodel.DatamodelObject):
         self.serializeAttributes(protocolElement)
         return protocolElement
 
+    def getName(self):
+        return self._name
+
+    def getFeatureId(self):
+        return self._featureId
+
+    def getExpression(self):
+        return self._expression
+
 
 class SqliteExpressionLevel(AbstractExpressionLevel):
     """
     Class representing a single ExpressionLevel in the GA4GH data model.
     """
     def __init__(self, parentContainer, record):
+        # Expression IDs are integer rowids, or UUID strings in DBs
+        # created by earlier versions.
         super(SqliteExpressionLevel, self).__init__(
-            parentContainer, record["id"])
+            parentContainer, str(record["id"]))
         self._expression = record["expression"]
         self._featureId = record["feature_id"]
         # sqlite stores booleans as int (False = 0, True = 1)
@@ -81,9 +301,6 @@ class SqliteExpressionLevel(AbstractExpressionLevel):
         self._confIntervalLow = record["conf_low"]
         self._confIntervalHigh = record["conf_hi"]
 
-    def getName(self):
-        return self._name
-
 
 class AbstractRnaQuantificationSet(datamodel.DatamodelObject):
     """
@@ -123,6 +340,20 @@ class AbstractRnaQuantificationSet(datamodel.DatamodelObject):
         return [self._rnaQuantificationIdMap[id_] for
                 id_ in self._rnaQuantificationIds]
 
+    def getExpressionMatrix(self):
+        """
+        Returns the ExpressionMatrix of the expression levels of all the
+        rna quantifications in this set, with rows keyed by their local IDs.
+        """
+        def expressionValues():
+            for rnaQuant in self.getRnaQuantifications():
+                for expressionLevel in rnaQuant.getExpressionLevels():
+                    yield (
+                        rnaQuant.getLocalId(), expressionLevel.getName(),
+                        expressionLevel.getFeatureId(),
+                        expressionLevel.getExpression())
+        return ExpressionMatrix.fromValues(expressionValues())
+
     def getReferenceSet(self):
         """
         Returns the reference set associated with this RnaQuantificationSet.
@@ -165,6 +396,8 @@ class SqliteRnaQuantificationSet(AbstractRnaQuantificationSet):
             parentContainer, name)
         self._dbFilePath = None
         self._db = None
+        self._expressionMatrix = None
+        self._expressionMatrixDbMtime = None
 
     def getDataUrl(self):
         """
@@ -192,6 +425,26 @@ class SqliteRnaQuantificationSet(AbstractRnaQuantificationSet):
         self._db = SqliteRnaBackend(self._dbFilePath)
         self.addRnaQuants()
 
+    def getExpressionMatrix(self):
+        """
+        Returns the ExpressionMatrix of this set, memory-mapped from the
+        column store if it is up to date with the DB, and otherwise built
+        from the DB. The matrix is cached until the DB is modified.
+        """
+        dbMtime = os.path.getmtime(self._dbFilePath)
+        if (self._expressionMatrix is None or
+                self._expressionMatrixDbMtime != dbMtime):
+            matrixPath = self._dbFilePath + EXPRESSION_MATRIX_SUFFIX
+            if (os.path.exists(matrixPath) and
+                    os.path.getmtime(matrixPath) >= dbMtime):
+                matrix = ExpressionMatrix.fromFile(matrixPath)
+            else:
+                with self._db as dataSource:
+                    matrix = ExpressionMatrix.fromDb(dataSource)
+            self._expressionMatrix = matrix
+            self._expressionMatrixDbMtime = dbMtime
+        return self._expressionMatrix
+
     def addRnaQuants(self):
         with self._db as dataSource:
             rnaQuantsReturned = dataSource.searchRnaQuantificationsInDb()
@@ -414,6 +667,17 @@ class SqliteRnaBackend(sqlite_backend.SqliteBackedDataSource):
         query = self._dbconn.execute(sql, sql_args)
         return sqlite_backend.iterativeFetch(query)
 
+    def getExpressionValues(self):
+        """
+        :return an iterator over (rna_quantification_id, name, feature_id,
+            expression) tuples for every row of the Expression table.
+        """
+        sql = ("SELECT rna_quantification_id, name, feature_id, expression "
+               "FROM Expression")
+        query = self._dbconn.execute(sql)
+        for row in query:
+            yield tuple(row)
+
     def getExpressionLevelById(self, expressionId):
         """
         :param expressionId: the ExpressionLevel ID
@@ -8,6 +8,7 @@ from __future__ import unicode_literals
 
 import json
 import random
+import re
 
 import ga4gh.server.datamodel as datamodel
 import ga4gh.server.sqlite_backend as sqlite_backend
@@ -58,6 +59,17 @@ _featureColumns = [
     ('transcript_name', 'TEXT'),  # as found in GFF3 attributes
     ('attributes', 'TEXT')]  # JSON encoding of attributes dict
 
+# The FEATURE_NAME table holds the lower-cased name, gene_name and
+# transcript_name of every feature, indexed for case-insensitive prefix
+# searches. It is built when the feature DB is generated; DBs without it
+# fall back to scanning the FEATURE table.
+_nameIndexTable = 'FEATURE_NAME'
+_nameIndexColumns = ['name', 'gene_name', 'transcript_name']
+
+# SQLite builds may limit the number of host parameters in a statement
+# to 999, so large IN clauses are issued in batches of this size.
+_maxSqlVariables = 500
+
 
 class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
     """
@@ -75,6 +87,65 @@ class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
         super(Gff3DbBackend, self).__init__(dbFile)
         self.featureColumnNames = [f[0] for f in _featureColumns]
         self.featureColumnTypes = [f[1] for f in _featureColumns]
+        self._hasNameIndex = None
+
+    def hasNameIndex(self):
+        """
+        Returns True if this DB holds the name prefix search table.
+        """
+        if self._hasNameIndex is None:
+            sql = (
+                "SELECT name FROM sqlite_master "
+                "WHERE type = 'table' AND name = ?")
+            query = self._dbconn.execute(sql, (_nameIndexTable,))
+            self._hasNameIndex = query.fetchone() is not None
+        return self._hasNameIndex
+
+    def createNameIndex(self):
+        """
+        Builds the table of lower-cased feature names, gene names and
+        transcript names used for case-insensitive prefix searches.
+        """
+        self._dbconn.execute(
+            "CREATE TABLE {} (term TEXT NOT NULL, "
+            "feature_id INTEGER NOT NULL)".format(_nameIndexTable))
+        query = self._dbconn.execute(
+            "SELECT id, {} FROM FEATURE".format(
+                ", ".join(_nameIndexColumns)))
+        terms = set()
+        for row in query.fetchall():
+            featureId = row[0]
+            for index in range(1, len(row)):
+                if row[index]:
+                    terms.add((row[index].lower(), featureId))
+        self._dbconn.executemany(
+            "INSERT INTO {} VALUES (?, ?)".format(_nameIndexTable), terms)
+        self._dbconn.execute(
+            "CREATE INDEX idx_feature_name ON {}(term)".format(
+                _nameIndexTable))
+        self._dbconn.commit()
+        self._hasNameIndex = True
+
+    def _namePrefixQuery(self, namePrefix):
+        """
+        Returns a tuple of an SQL condition matching the features with a
+        name, gene name or transcript name starting with the specified
+        prefix, ignoring case, and the list of SQL arguments.
+        """
+        if self.hasNameIndex():
+            # All terms starting with the prefix sort between the prefix
+            # and the prefix with its last character incremented.
+            lower = namePrefix.lower()
+            upper = lower[:-1] + unichr(ord(lower[-1]) + 1)
+            sql = (
+                "AND id IN (SELECT feature_id FROM {} "
+                "WHERE term >= ? AND term < ?) ".format(_nameIndexTable))
+            return sql, (lower, upper)
+        pattern = re.sub(r"([\\%_])", r"\\\1", namePrefix) + "%"
+        sql = "AND ({}) ".format(" OR ".join(
+            "{} LIKE ? ESCAPE '\\'".format(column)
+            for column in _nameIndexColumns))
+        return sql, (pattern,) * len(_nameIndexColumns)
 
     def featuresQuery(self, **kwargs):
         """
@@ -91,6 +162,11 @@ class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
         if 'geneSymbol' in kwargs and kwargs['geneSymbol']:
             sql += "AND gene_name = ? "
             sql_args += (kwargs.get('geneSymbol'),)
+        if kwargs.get('namePrefix'):
+            prefixSql, prefixArgs = self._namePrefixQuery(
+                kwargs['namePrefix'])
+            sql += prefixSql
+            sql_args += prefixArgs
         if 'start' in kwargs and kwargs['start'] is not None:
             sql += "AND end > ? "
             sql_args += (kwargs.get('start'),)
@@ -98,7 +174,7 @@ class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
             sql += "AND start < ? "
             sql_args += (kwargs.get('end'),)
         if 'referenceName' in kwargs and kwargs['referenceName']:
-            sql += "AND reference_name = ?"
+            sql += "AND reference_name = ? "
             sql_args += (kwargs.get('referenceName'),)
         if 'parentId' in kwargs and kwargs['parentId']:
             sql += "AND parent_id = ? "
@@ -109,7 +185,17 @@ class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
             sql += ", ".join(["?", ] * len(kwargs.get('featureTypes')))
             sql += ") "
             sql_args += tuple(kwargs.get('featureTypes'))
-        sql_rows += sql
+        if kwargs.get('includeDescendants'):
+            # The filters select the roots of the subtrees; every
+            # descendant of a root is returned regardless of the filters.
+            sql_rows = (
+                "WITH RECURSIVE subtree(id) AS ("
+                "SELECT id FROM FEATURE WHERE id > 1 " + sql +
+                "UNION SELECT FEATURE.id FROM FEATURE "
+                "JOIN subtree ON FEATURE.parent_id = subtree.id) "
+                "SELECT * FROM FEATURE WHERE id IN subtree ")
+        else:
+            sql_rows += sql
         sql_rows += " ORDER BY reference_name, start, end ASC "
         return sql_rows, sql_args
 
@@ -117,7 +203,8 @@ class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
             self, startIndex=0, maxResults=None,
             referenceName=None, start=None, end=None,
             parentId=None, featureTypes=None,
-            name=None, geneSymbol=None):
+            name=None, geneSymbol=None, includeDescendants=False,
+            namePrefix=None):
         """
         Perform a full features query in database.
 
@@ -129,6 +216,10 @@ class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
         :param parentId: string restrict search by id of parent node.
         :param name: match features by name
         :param geneSymbol: match features by gene symbol
+        :param includeDescendants: also return every descendant of the
+            matched features
+        :param namePrefix: match features whose name, gene name or
+            transcript name starts with this prefix, ignoring case
         :return an array of dictionaries, representing the returned data.
         """
         # TODO: Refactor out common bits of this and the above count query.
@@ -136,7 +227,8 @@ class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
             startIndex=startIndex, maxResults=maxResults,
             referenceName=referenceName, start=start, end=end,
             parentId=parentId, featureTypes=featureTypes,
-            name=name, geneSymbol=geneSymbol)
+            name=name, geneSymbol=geneSymbol,
+            includeDescendants=includeDescendants, namePrefix=namePrefix)
         sql += sqlite_backend.limitsSql(startIndex, maxResults)
         query = self._dbconn.execute(sql, sql_args)
         return sqlite_backend.sqliteRowsToDicts(query.fetchall())
@@ -156,6 +248,24 @@ class Gff3DbBackend(sqlite_backend.SqliteBackedDataSource):
             return None
         return sqlite_backend.sqliteRowToDict(ret)
 
+    def getFeaturesByIds(self, featureIds):
+        """
+        Fetch the features with the specified IDs.
+
+        :param featureIds: list of feature IDs as stored in the DB
+        :return: dictionary mapping each feature ID found to the dictionary
+            representing that feature.
+        """
+        features = {}
+        for i in range(0, len(featureIds), _maxSqlVariables):
+            batch = featureIds[i:i + _maxSqlVariables]
+            sql = "SELECT * FROM FEATURE WHERE id IN ({})".format(
+                ", ".join(["?", ] * len(batch)))
+            query = self._dbconn.execute(sql, tuple(batch))
+            for feature in sqlite_backend.sqliteRowsToDicts(query.fetchall()):
+                features[feature['id']] = feature
+        return features
+
 
 class AbstractFeatureSet(datamodel.DatamodelObject):
     """
@@ -215,6 +325,23 @@ class AbstractFeatureSet(datamodel.DatamodelObject):
             compoundId = ""
         return str(compoundId)
 
+    def getFeaturesByIds(self, compoundIds):
+        """
+        Returns the protocol.Feature objects corresponding to the specified
+        list of compoundIds, in the same order.
+
+        :param compoundIds: list of datamodel.FeatureCompoundId objects
+        :return: list of Feature objects, with None for each of the
+            compoundIds which does not correspond to a feature.
+        """
+        features = []
+        for compoundId in compoundIds:
+            try:
+                features.append(self.getFeature(compoundId))
+            except exceptions.ObjectNotFoundException:
+                features.append(None)
+        return features
+
 
 class SimulatedFeatureSet(AbstractFeatureSet):
     """
@@ -274,7 +401,8 @@ class SimulatedFeatureSet(AbstractFeatureSet):
     def getFeatures(self, referenceName=None, start=None, end=None,
                     startIndex=None, maxResults=None,
                     featureTypes=None, parentId=None,
-                    name=None, geneSymbol=None, numFeatures=10):
+                    name=None, geneSymbol=None, numFeatures=10,
+                    includeDescendants=False, namePrefix=None):
         """
         Returns a set number of simulated features.
 
@@ -289,6 +417,9 @@ class SimulatedFeatureSet(AbstractFeatureSet):
         :param geneSymbol: the symbol for the gene the features are on
         :param numFeatures: number of features to generate in the return.
             10 is a reasonable (if arbitrary) default.
+        :param includeDescendants: ignored, as simulated features have
+            no children
+        :param namePrefix: ignored, as simulated features have no names
         :return: Yields feature list
         """
         randomNumberGenerator = random.Random()
@@ -373,6 +504,34 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
             gaFeature = self._gaFeatureForFeatureDbRecord(featureReturned)
             return gaFeature
 
+    def getFeaturesByIds(self, compoundIds):
+        """
+        Returns the protocol.Feature objects corresponding to the specified
+        list of compoundIds, in the same order, using a single query.
+
+        :param compoundIds: list of datamodel.FeatureCompoundId objects
+        :return: list of Feature objects, with None for each of the
+            compoundIds which does not correspond to a feature.
+        """
+        featureIds = []
+        for compoundId in compoundIds:
+            try:
+                featureIds.append(long(compoundId.featureId))
+            except ValueError:
+                featureIds.append(None)
+        with self._db as dataSource:
+            featuresReturned = dataSource.getFeaturesByIds(list(
+                set(featureId for featureId in featureIds
+                    if featureId is not None)))
+        gaFeatures = []
+        for featureId in featureIds:
+            if featureId not in featuresReturned:
+                gaFeatures.append(None)
+            else:
+                gaFeatures.append(self._gaFeatureForFeatureDbRecord(
+                    featuresReturned[featureId]))
+        return gaFeatures
+
     def _gaFeatureForFeatureDbRecord(self, feature):
         """
         :param feature: The DB Row representing a feature
@@ -412,7 +571,8 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
     def getFeatures(self, referenceName=None, start=None, end=None,
                     startIndex=None, maxResults=None,
                     featureTypes=None, parentId=None,
-                    name=None, geneSymbol=None):
+                    name=None, geneSymbol=None, includeDescendants=False,
+                    namePrefix=None):
         """
         method passed to runSearchRequest to fulfill the request
         :param str referenceName: name of reference (ex: "chr1")
@@ -424,6 +584,10 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
         :param parentId: none or featureID of parent
         :param name: the name of the feature
         :param geneSymbol: the symbol for the gene the features are on
+        :param includeDescendants: also yield the full subtree of
+            descendants of each matched feature
+        :param namePrefix: match features whose name, gene name or
+            transcript name starts with this prefix, ignoring case
         :return: yields a protocol.Feature at a time
         """
         with self._db as dataSource:
@@ -432,7 +596,9 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
                 referenceName=referenceName,
                 start=start, end=end,
                 parentId=parentId, featureTypes=featureTypes,
-                name=name, geneSymbol=geneSymbol)
+                name=name, geneSymbol=geneSymbol,
+                includeDescendants=includeDescendants,
+                namePrefix=namePrefix)
             for feature in features:
                 gaFeature = self._gaFeatureForFeatureDbRecord(feature)
                 yield gaFeature
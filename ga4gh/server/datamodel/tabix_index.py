@@ -0,0 +1,92 @@
+"""
+Reads the linear indexes of tabix index files, which give the offsets in
+the BGZF compressed data file of the records overlapping each 16 kbp
+window of each reference.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import gzip
+import os
+import struct
+import threading
+
+
+TABIX_MAGIC = b"TBI\x01"
+
+# The size of the windows of the linear index, in bases.
+WINDOW_SIZE = 2**14
+
+
+class TabixIndex(object):
+    """
+    The linear indexes of the references in a tabix index file. Files
+    which are not tabix indexes, such as CSI indexes, have no linear
+    indexes.
+    """
+    def __init__(self, indexPath):
+        self._linearIndexes = {}
+        with gzip.open(indexPath, "rb") as indexFile:
+            data = indexFile.read()
+        if data[:4] != TABIX_MAGIC:
+            return
+        numReferences = struct.unpack_from(b"<i", data, 4)[0]
+        namesLength = struct.unpack_from(b"<i", data, 32)[0]
+        offset = 36 + namesLength
+        names = data[36:offset].split(b"\0")[:numReferences]
+        for name in names:
+            numBins = struct.unpack_from(b"<i", data, offset)[0]
+            offset += 4
+            for _ in range(numBins):
+                numChunks = struct.unpack_from(b"<i", data, offset + 4)[0]
+                offset += 8 + 16 * numChunks
+            numWindows = struct.unpack_from(b"<i", data, offset)[0]
+            offset += 4
+            self._linearIndexes[name.decode("utf-8")] = struct.unpack_from(
+                b"<" + str(numWindows).encode() + b"Q", data, offset)
+            offset += 8 * numWindows
+
+    def getBlockBoundaries(self, referenceName, start, end, minBytes=0):
+        """
+        Returns the sorted list of the window starts strictly between
+        start and end, which may be None, at which the records of the
+        specified reference begin in a BGZF block at least minBytes of
+        compressed data after that of the previous window returned, or
+        of the start.
+        """
+        offsets = self._linearIndexes.get(referenceName)
+        if offsets is None or start // WINDOW_SIZE >= len(offsets):
+            return []
+        numWindows = len(offsets)
+        if end is not None:
+            numWindows = min(numWindows, (end - 1) // WINDOW_SIZE + 1)
+        # The upper 48 bits of a virtual offset are the offset of the
+        # BGZF block in the compressed file.
+        previousBlock = offsets[start // WINDOW_SIZE] >> 16
+        boundaries = []
+        for window in range(start // WINDOW_SIZE + 1, numWindows):
+            block = offsets[window] >> 16
+            if block - previousBlock >= max(minBytes, 1):
+                boundaries.append(window * WINDOW_SIZE)
+                previousBlock = block
+        return boundaries
+
+
+_indexCache = {}
+_indexCacheLock = threading.Lock()
+
+
+def getTabixIndex(indexPath):
+    """
+    Returns the TabixIndex read from the specified file, which is kept
+    until the file is modified.
+    """
+    modificationTime = os.path.getmtime(indexPath)
+    with _indexCacheLock:
+        entry = _indexCache.get(indexPath)
+    if entry is None or entry[0] != modificationTime:
+        entry = modificationTime, TabixIndex(indexPath)
+        with _indexCacheLock:
+            _indexCache[indexPath] = entry
+    return entry[1]
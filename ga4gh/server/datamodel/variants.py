@@ -6,6 +6,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import collections
 import datetime
 import glob
 import hashlib
@@ -18,6 +19,8 @@ import pysam
 
 import ga4gh.server.exceptions as exceptions
 import ga4gh.server.datamodel as datamodel
+import ga4gh.server.datamodel.annotation_index as annotation_index
+import ga4gh.server.datamodel.tabix_index as tabix_index
 
 import ga4gh.schemas.pb as pb
 import ga4gh.schemas.ga4gh.common_pb2 as common_pb2
@@ -28,6 +31,110 @@ ANNOTATIONS_VEP_V82 = "VEP_v82"
 ANNOTATIONS_VEP_V77 = "VEP_v77"
 ANNOTATIONS_SNPEFF = "SNPEff"
 
+# The fields of the ANN or CSQ annotations written by each annotator, used
+# when the VCF header does not describe them.
+DEFAULT_ANNOTATION_FORMATS = {
+    ANNOTATIONS_SNPEFF: (
+        "Allele|Annotation|Annotation_Impact|Gene_Name|Gene_ID|Feature_Type|"
+        "Feature_ID|Transcript_BioType|Rank|HGVS.c|HGVS.p|"
+        "cDNA.pos / cDNA.length|CDS.pos / CDS.length|AA.pos / AA.length|"
+        "Distance|ERRORS / WARNINGS / INFO"),
+    ANNOTATIONS_VEP_V82: (
+        "Allele|Consequence|IMPACT|SYMBOL|Gene|Feature_type|Feature|BIOTYPE|"
+        "EXON|INTRON|HGVSc|HGVSp|cDNA_position|CDS_position|Protein_position|"
+        "Amino_acids|Codons|Existing_variation|DISTANCE|STRAND|SYMBOL_SOURCE|"
+        "HGNC_ID|HGVS_OFFSET"),
+    ANNOTATIONS_VEP_V77: (
+        "Allele|Gene|Feature|Feature_type|Consequence|cDNA_position|"
+        "CDS_position|Protein_position|Amino_acids|Codons|Existing_variation|"
+        "DISTANCE|STRAND|SIFT|PolyPhen|MOTIF_NAME|MOTIF_POS|HIGH_INF_POS|"
+        "MOTIF_SCORE_CHANGE"),
+}
+
+# The names the annotators give the annotation fields we use.
+ANNOTATION_FIELD_NAMES = {
+    "alt": ["Allele"],
+    "effects": ["Consequence", "Annotation"],
+    "featureId": ["Feature", "Feature_ID"],
+    "geneId": ["Gene", "Gene_ID"],
+    "hgvsC": ["HGVSc", "HGVS.c"],
+    "hgvsP": ["HGVSp", "HGVS.p"],
+    "cdnaPos": ["cDNA_position", "cDNA.pos / cDNA.length"],
+    "protPos": ["Protein_position", "AA.pos / AA.length"],
+}
+
+HGVS_C_PATTERN = re.compile(r".*c.(\d+)(\D+)>(\D+)")
+HGVS_P_PATTERN = re.compile(r".*p.(\D+)(\d+)(\D+)", flags=re.UNICODE)
+
+# The number of parsed HGVS strings kept by each annotation set.
+HGVS_MEMO_SIZE = 2**16
+
+
+def parseAnnotationFormat(description):
+    """
+    Returns the list of field names in the specified description of an
+    ANN or CSQ INFO field, such as "Consequence annotations from Ensembl
+    VEP. Format: Allele|Consequence|...", or None if it lists no fields.
+    """
+    if "Format:" in description:
+        fields = description.split("Format:", 1)[1]
+    elif ":" in description:
+        fields = description.split(":", 1)[1]
+    else:
+        return None
+    fieldNames = [
+        fieldName.strip() for fieldName in fields.strip(" '\"").split("|")]
+    if len(fieldNames) < 2:
+        return None
+    return fieldNames
+
+
+def summariseGenotypes(variant, genotypes):
+    """
+    Returns a dictionary summarising the specified iterable of genotypes of
+    the specified GA variant, each a sequence of allele indexes in which
+    None or a negative index is a missing allele. Called alleles count
+    towards the allele number and counts even in partly missing genotypes,
+    which are only counted as missing. Genotypes are counted regardless of
+    phase, keyed by their sorted allele indexes joined with '/'.
+    """
+    numAlternates = len(variant.alternate_bases)
+    alleleCounts = [0] * (numAlternates + 1)
+    genotypeCounts = {}
+    callCount = 0
+    missingCount = 0
+    for genotype in genotypes:
+        callCount += 1
+        missing = False
+        for allele in genotype:
+            if allele is None or allele < 0:
+                missing = True
+            elif allele <= numAlternates:
+                alleleCounts[allele] += 1
+        if missing or len(genotype) == 0:
+            missingCount += 1
+        else:
+            key = "/".join(str(allele) for allele in sorted(genotype))
+            genotypeCounts[key] = genotypeCounts.get(key, 0) + 1
+    alleleNumber = sum(alleleCounts)
+    alleleFrequencies = [
+        count / alleleNumber if alleleNumber > 0 else None
+        for count in alleleCounts[1:]]
+    return {
+        "variantId": variant.id,
+        "referenceName": variant.reference_name,
+        "start": variant.start,
+        "end": variant.end,
+        "referenceBases": variant.reference_bases,
+        "alternateBases": list(variant.alternate_bases),
+        "callCount": callCount,
+        "missingCount": missingCount,
+        "alleleNumber": alleleNumber,
+        "alleleCounts": alleleCounts[1:],
+        "alleleFrequencies": alleleFrequencies,
+        "genotypeCounts": genotypeCounts,
+    }
+
 
 def isUnspecified(str):
     """
@@ -260,6 +367,88 @@ class AbstractVariantSet(datamodel.DatamodelObject):
         """
         raise NotImplementedError()
 
+    def getBlockBoundaries(
+            self, referenceName, startPosition, endPosition, minBytes=0):
+        """
+        Returns the sorted list of positions between startPosition and
+        endPosition at which the variants of the specified reference can
+        be read from separate blocks of the data files, at least minBytes
+        apart. The list is empty if the data cannot be split.
+        """
+        return []
+
+    def getVariantsStartingIn(
+            self, referenceName, startPosition, endPosition, callSetIds,
+            minStart, maxStart):
+        """
+        Returns an iterator over the specified variants which start at or
+        after minStart and before maxStart, either of which may be None.
+        """
+        for variant in self.getVariants(
+                referenceName, startPosition, endPosition, callSetIds):
+            if minStart is not None and variant.start < minStart:
+                continue
+            if maxStart is not None and variant.start >= maxStart:
+                break
+            yield variant
+
+    def getVariantsByIds(self, compoundIds):
+        """
+        Returns the list of the variants with the specified
+        VariantCompoundIds, in the same order, with None for each of them
+        which does not correspond to a variant.
+        """
+        variants = []
+        for compoundId in compoundIds:
+            try:
+                variants.append(self.getVariant(compoundId))
+            except (exceptions.ObjectNotFoundException, ValueError):
+                variants.append(None)
+        return variants
+
+    def getVariantsInRanges(self, ranges, callSetIds):
+        """
+        Returns an iterator over the iterators over the variants in each
+        of the specified (referenceName, startPosition, endPosition,
+        minStart) ranges which start at or after minStart, if it is not
+        None.
+        """
+        for referenceName, startPosition, endPosition, minStart in ranges:
+            yield self.getVariantsStartingIn(
+                referenceName, startPosition, endPosition, callSetIds,
+                minStart, None)
+
+    def _getCheckedCallSetIds(self, callSetIds):
+        """
+        Returns the specified list of call set IDs, or all the call set
+        IDs of this variant set if it is None, raising an exception if
+        any of them are not in this variant set.
+        """
+        if callSetIds is None:
+            return self._callSetIds
+        for callSetId in callSetIds:
+            if callSetId not in self._callSetIdMap:
+                raise exceptions.CallSetNotInVariantSetException(
+                    callSetId, self.getId())
+        return callSetIds
+
+    def getVariantSummaries(
+            self, referenceName, startPosition, endPosition,
+            callSetIds=None):
+        """
+        Returns an iterator over the allele and genotype summaries, as
+        described in summariseGenotypes, of the variants in the specified
+        region over the calls of the specified call sets, or of all call
+        sets if callSetIds is None.
+        """
+        callSetIds = self._getCheckedCallSetIds(callSetIds)
+        callSetIdSet = set(callSetIds)
+        for variant in self.getVariants(
+                referenceName, startPosition, endPosition, callSetIds):
+            yield summariseGenotypes(variant, [
+                call.genotype for call in variant.calls
+                if call.call_set_id in callSetIdSet])
+
     def _createGaVariant(self):
         """
         Convenience method to set the common fields in a GA Variant
@@ -709,6 +898,52 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
                 raise exceptions.ObjectNotFoundException()
         raise exceptions.ObjectNotFoundException(compoundId)
 
+    def getVariantsByIds(self, compoundIds):
+        """
+        Returns the list of the variants with the specified
+        VariantCompoundIds, as for the abstract variant set. The IDs are
+        grouped by reference, and those starting within a window of the
+        tabix linear index of each other are read with a single fetch.
+        Records are only converted if their hash matches one of the IDs.
+        """
+        variants = [None] * len(compoundIds)
+        indexesByStart = collections.defaultdict(dict)
+        for index, compoundId in enumerate(compoundIds):
+            try:
+                start = int(compoundId.start)
+            except ValueError:
+                continue
+            indexesByStart[compoundId.reference_name].setdefault(
+                start, []).append(index)
+        for referenceName, indexes in indexesByStart.items():
+            starts = sorted(indexes)
+            clusterStart = starts[0]
+            for position, start in enumerate(starts):
+                if (position + 1 < len(starts) and
+                        starts[position + 1] - start <
+                        tabix_index.WINDOW_SIZE):
+                    continue
+                for record in self.getPysamVariants(
+                        referenceName, clusterStart, start + 1):
+                    if record.start not in indexes:
+                        continue
+                    hashVariant = self._createGaVariant()
+                    hashVariant.reference_bases = record.ref
+                    if record.alts is not None:
+                        hashVariant.alternate_bases.extend(list(record.alts))
+                    md5 = self.hashVariant(hashVariant)
+                    matches = [
+                        index for index in indexes[record.start]
+                        if compoundIds[index].md5 == md5]
+                    if len(matches) > 0:
+                        variant = self.convertVariant(
+                            record, self._callSetIds)
+                        for index in matches:
+                            variants[index] = variant
+                if position + 1 < len(starts):
+                    clusterStart = starts[position + 1]
+        return variants
+
     def getPysamVariants(self, referenceName, startPosition, endPosition):
         """
         Returns an iterator over the pysam VCF records corresponding to the
@@ -724,23 +959,85 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
             for record in cursor:
                 yield record
 
+    def getPysamVariantsAt(self, referenceName, positions):
+        """
+        Returns an iterator over the pysam VCF records starting at the
+        specified sorted list of positions on the specified reference.
+        """
+        if referenceName in self._chromFileMap:
+            varFile = self.getFileHandle(self._chromFileMap[referenceName])
+            for position in positions:
+                referenceName, startPosition, endPosition = \
+                    self.sanitizeVariantFileFetch(
+                        referenceName, position, position + 1)
+                for record in varFile.fetch(
+                        referenceName, startPosition, endPosition):
+                    if record.start == position:
+                        yield record
+
+    def getVariantSummaries(
+            self, referenceName, startPosition, endPosition,
+            callSetIds=None):
+        """
+        Returns an iterator over the allele and genotype summaries of the
+        variants in the specified region, as for the abstract variant set.
+        The genotypes are read straight from the pysam records, without
+        converting the calls.
+        """
+        sampleNames = [
+            str(self.getCallSet(callSetId).getSampleName())
+            for callSetId in self._getCheckedCallSetIds(callSetIds)]
+        for record in self.getPysamVariants(
+                referenceName, startPosition, endPosition):
+            variant = self._createGaVariant()
+            variant.reference_name = record.contig
+            variant.start = record.start
+            variant.end = record.stop
+            variant.reference_bases = record.ref
+            if record.alts is not None:
+                variant.alternate_bases.extend(list(record.alts))
+            variant.id = self.getVariantId(variant)
+            samples = record.samples
+            yield summariseGenotypes(variant, [
+                samples[sampleName].allele_indices
+                for sampleName in sampleNames])
+
     def getVariants(self, referenceName, startPosition, endPosition,
                     callSetIds=[]):
         """
         Returns an iterator over the specified variants. The parameters
         correspond to the attributes of a GASearchVariantsRequest object.
         """
-        if callSetIds is None:
-            callSetIds = self._callSetIds
-        else:
-            for callSetId in callSetIds:
-                if callSetId not in self._callSetIds:
-                    raise exceptions.CallSetNotInVariantSetException(
-                        callSetId, self.getId())
+        callSetIds = self._getCheckedCallSetIds(callSetIds)
+        for record in self.getPysamVariants(
+                referenceName, startPosition, endPosition):
+            yield self.convertVariant(record, callSetIds)
+
+    def getVariantsStartingIn(
+            self, referenceName, startPosition, endPosition, callSetIds,
+            minStart, maxStart):
+        """
+        Returns an iterator over the specified variants which start in the
+        specified range, as for the abstract variant set. Records outside
+        this range are skipped before they are converted.
+        """
+        callSetIds = self._getCheckedCallSetIds(callSetIds)
         for record in self.getPysamVariants(
                 referenceName, startPosition, endPosition):
+            if minStart is not None and record.start < minStart:
+                continue
+            if maxStart is not None and record.start >= maxStart:
+                break
             yield self.convertVariant(record, callSetIds)
 
+    def getBlockBoundaries(
+            self, referenceName, startPosition, endPosition, minBytes=0):
+        if referenceName not in self._chromFileMap:
+            return []
+        _, indexFile = self._chromFileMap[referenceName]
+        return tabix_index.getTabixIndex(indexFile).getBlockBoundaries(
+            referenceName, startPosition, endPosition, minBytes)
+
     def getMetadataId(self, metadata):
         """
         Returns the id of a metadata
@@ -822,6 +1119,14 @@ class AbstractVariantAnnotationSet(datamodel.DatamodelObject):
         """
         self._ontology = ontology
 
+    def _hasEffectNamed(self, transcriptEffect, effectNames):
+        """
+        Returns True if the specified transcript effect has an effect
+        whose term name is in the specified set.
+        """
+        return any(
+            effect.term in effectNames for effect in transcriptEffect.effects)
+
     def getCreationTime(self):
         """
         Returns the creation time for this VariantAnnotationSet
@@ -899,26 +1204,36 @@ class AbstractVariantAnnotationSet(datamodel.DatamodelObject):
                 effs, gaTranscriptEffect.hgvs_annotation)
             ).hexdigest()
 
-    def hashVariantAnnotation(cls, gaVariant, gaVariantAnnotation):
+    def hashVariantAnnotation(
+            cls, gaVariant, gaVariantAnnotation, transcriptEffectIds=None):
         """
-        Produces an MD5 hash of the gaVariant and gaVariantAnnotation objects
+        Produces an MD5 hash of the gaVariant and gaVariantAnnotation objects.
+        If the annotation holds only some of the transcript effects it was
+        derived from, the IDs of all of them must be specified.
         """
-        treffs = [treff.id for treff in gaVariantAnnotation.transcript_effects]
+        treffs = transcriptEffectIds
+        if treffs is None:
+            treffs = [
+                treff.id for treff in gaVariantAnnotation.transcript_effects]
         return hashlib.md5(
             "{}\t{}\t{}\t".format(
                 gaVariant.reference_bases, tuple(gaVariant.alternate_bases),
                 treffs)
             ).hexdigest()
 
-    def getVariantAnnotationId(self, gaVariant, gaAnnotation):
+    def getVariantAnnotationId(
+            self, gaVariant, gaAnnotation, transcriptEffectIds=None):
         """
         Produces a stringified compoundId representing a variant
         annotation.
         :param gaVariant:   protocol.Variant
         :param gaAnnotation: protocol.VariantAnnotation
+        :param transcriptEffectIds: IDs of all the transcript effects the
+            annotation was derived from, if it does not hold all of them
         :return:  compoundId String
         """
-        md5 = self.hashVariantAnnotation(gaVariant, gaAnnotation)
+        md5 = self.hashVariantAnnotation(
+            gaVariant, gaAnnotation, transcriptEffectIds)
         compoundId = datamodel.VariantAnnotationCompoundId(
             self.getCompoundId(), gaVariant.reference_name,
             str(gaVariant.start), md5)
@@ -951,9 +1266,24 @@ class SimulatedVariantAnnotationSet(AbstractVariantAnnotationSet):
         ann = self.generateVariantAnnotation(variant, randomNumberGenerator)
         return ann
 
-    def getVariantAnnotations(self, referenceName, start, end):
+    def getVariantAnnotations(
+            self, referenceName, start, end, effectNames=None,
+            featureIds=None):
         for variant in self._variantSet.getVariants(referenceName, start, end):
-            yield variant, self.generateVariantAnnotation(variant)
+            annotation = self.generateVariantAnnotation(variant)
+            if effectNames is not None or featureIds is not None:
+                transcriptEffects = [
+                    transcriptEffect for transcriptEffect in
+                    annotation.transcript_effects
+                    if (effectNames is None or self._hasEffectNamed(
+                        transcriptEffect, effectNames)) and
+                    (featureIds is None or
+                        transcriptEffect.feature_id in featureIds)]
+                if len(transcriptEffects) == 0:
+                    continue
+                annotation.ClearField('transcript_effects')
+                annotation.transcript_effects.extend(transcriptEffects)
+            yield variant, annotation
 
     def generateVariantAnnotation(self, variant):
         """
@@ -1042,12 +1372,16 @@ class HtslibVariantAnnotationSet(AbstractVariantAnnotationSet):
     """
     def __init__(self, variantSet, localId):
         super(HtslibVariantAnnotationSet, self).__init__(variantSet, localId)
+        self._fieldIndexes = {}
+        self._hgvsMemo = {}
+        self._annotationIndexes = {}
 
     def populateFromFile(self, varFile, annotationType):
         self._annotationType = annotationType
         self._analysis = self._getAnnotationAnalysis(varFile)
         self._creationTime = self._analysis.created
         self._updatedTime = datetime.datetime.now().isoformat() + "Z"
+        self._initialiseAnnotationFields()
 
     def populateFromRow(self, annotationSetRecord):
         """
@@ -1059,6 +1393,56 @@ class HtslibVariantAnnotationSet(AbstractVariantAnnotationSet):
         self._creationTime = annotationSetRecord.created
         self._updatedTime = annotationSetRecord.updated
         self.setAttributesJson(annotationSetRecord.attributes)
+        self._initialiseAnnotationFields()
+
+    def _getAnnotationKey(self):
+        """
+        Returns the key of the INFO field holding the annotations.
+        """
+        if self._annotationType == ANNOTATIONS_VEP_V77:
+            return b'CSQ'
+        return b'ANN'
+
+    def _initialiseAnnotationFields(self):
+        """
+        Maps the annotation fields we use to their indexes in the ANN or
+        CSQ annotations, as listed by the description of the INFO field in
+        the VCF header, which the analysis holds. The default format of the
+        annotator is used if the header does not list the fields we need.
+        """
+        key = "INFO.{}".format(self._getAnnotationKey())
+        fieldNames = None
+        if key in self._analysis.attributes.attr:
+            for value in self._analysis.attributes.attr[key].values:
+                fieldNames = parseAnnotationFormat(value.string_value)
+        if fieldNames is None or not all(
+                any(name in fieldNames for name in names)
+                for names in (
+                    ANNOTATION_FIELD_NAMES["alt"],
+                    ANNOTATION_FIELD_NAMES["effects"])):
+            fieldNames = DEFAULT_ANNOTATION_FORMATS[
+                self._annotationType].split("|")
+        self._fieldIndexes = {}
+        for field, names in ANNOTATION_FIELD_NAMES.items():
+            for name in names:
+                if name in fieldNames:
+                    self._fieldIndexes[field] = fieldNames.index(name)
+                    break
+
+    def _splitAnnotation(self, annStr):
+        """
+        Returns a dictionary of the fields we use in the specified ANN or
+        CSQ annotation string, with empty strings for missing fields.
+        """
+        values = annStr.split('|')
+        fields = {}
+        for field in ANNOTATION_FIELD_NAMES:
+            index = self._fieldIndexes.get(field)
+            if index is not None and index < len(values):
+                fields[field] = values[index]
+            else:
+                fields[field] = ""
+        return fields
 
     def getAnnotationType(self):
         """
@@ -1117,20 +1501,35 @@ class HtslibVariantAnnotationSet(AbstractVariantAnnotationSet):
             self._compoundId, "analysis"))
         return analysis
 
-    def getVariantAnnotations(self, referenceName, startPosition, endPosition):
+    def getVariantAnnotations(
+            self, referenceName, startPosition, endPosition,
+            effectNames=None, featureIds=None):
         """
         Generator for iterating through variant annotations in this
         variant annotation set.
         :param referenceName:
         :param startPosition:
         :param endPosition:
+        :param effectNames: if not None, the set of sequence ontology term
+            names of the effects searched for. Records without any of them
+            are skipped before they are converted, and the annotations
+            hold only the transcript effects with one of them.
+        :param featureIds: if not None, the set of transcript or gene IDs
+            searched for, which filter the records and transcript effects
+            in the same way.
         :return: generator of protocol.VariantAnnotation
         """
         # TODO Refactor this so that we use the annotationType information
         # where it makes most sense, and rename the various methods so that
         # it's clear what program/version combination they operate on.
-        variantIter = self._variantSet.getPysamVariants(
-            referenceName, startPosition, endPosition)
+        variantIter = None
+        if effectNames is not None or featureIds is not None:
+            variantIter = self._getIndexedPysamVariants(
+                referenceName, startPosition, endPosition, effectNames,
+                featureIds)
+        if variantIter is None:
+            variantIter = self._variantSet.getPysamVariants(
+                referenceName, startPosition, endPosition)
         if self._annotationType == ANNOTATIONS_SNPEFF:
             transcriptConverter = self.convertTranscriptEffectSnpEff
         elif self._annotationType == ANNOTATIONS_VEP_V82:
@@ -1138,7 +1537,136 @@ class HtslibVariantAnnotationSet(AbstractVariantAnnotationSet):
         else:
             transcriptConverter = self.convertTranscriptEffectCSQ
         for record in variantIter:
-            yield self.convertVariantAnnotation(record, transcriptConverter)
+            if effectNames is not None and not self._hasAnyEffect(
+                    record, effectNames):
+                continue
+            if featureIds is not None and not self._hasAnyFeature(
+                    record, featureIds):
+                continue
+            variant, annotation = self.convertVariantAnnotation(
+                record, transcriptConverter, effectNames, featureIds)
+            # An effect and a feature may each be in the record without
+            # being in the same transcript effect.
+            if featureIds is None or len(annotation.transcript_effects) > 0:
+                yield variant, annotation
+
+    def _getAnnotationIndex(self, referenceName):
+        """
+        Returns the index of the effects and features of the VCF file
+        holding the specified reference, or None if it has no current
+        index.
+        """
+        dataUrlIndexMap = self._variantSet.getReferenceToDataUrlIndexMap()
+        if referenceName not in dataUrlIndexMap:
+            return None
+        dataUrl, _ = dataUrlIndexMap[referenceName]
+        if dataUrl not in self._annotationIndexes:
+            index = None
+            if annotation_index.isIndexCurrent(dataUrl):
+                index = annotation_index.AnnotationIndex(dataUrl)
+            self._annotationIndexes[dataUrl] = index
+        return self._annotationIndexes[dataUrl]
+
+    def _getIndexedPysamVariants(
+            self, referenceName, startPosition, endPosition, effectNames,
+            featureIds):
+        """
+        Returns an iterator over the pysam VCF records in the specified
+        region which may hold the specified effects and features, using
+        the index of the VCF file, or None if it has no current index.
+        """
+        index = self._getAnnotationIndex(referenceName)
+        if index is None:
+            return None
+        if endPosition is None:
+            endPosition = self._variantSet.vcfMax
+        positions = index.getPositions(
+            referenceName, startPosition, endPosition, effectNames,
+            featureIds)
+        return self._variantSet.getPysamVariantsAt(referenceName, positions)
+
+    def writeIndexes(self):
+        """
+        Writes the indexes of the effects and features in the VCF files of
+        this annotation set, which are used by searches from then on.
+        """
+        for dataUrl, indexFile in self._variantSet.getDataUrlIndexPairs():
+            # Remote files are not indexed.
+            if not os.path.exists(dataUrl):
+                continue
+            if not annotation_index.isIndexCurrent(dataUrl):
+                varFile = self._variantSet.openFile((dataUrl, indexFile))
+                try:
+                    annotation_index.writeIndex(
+                        dataUrl, self._getIndexRecords(varFile))
+                finally:
+                    varFile.close()
+            self._annotationIndexes.pop(dataUrl, None)
+
+    def _getIndexRecords(self, varFile):
+        """
+        Returns an iterator over the (referenceName, start, end,
+        effectNames, featureIds) tuples of the records in the specified
+        pysam VCF file.
+        """
+        for chrom in varFile.index:
+            for record in varFile.fetch(chrom):
+                effectNames = set()
+                featureIds = set()
+                for ann in record.info.get(self._getAnnotationKey()) or []:
+                    fields = self._splitAnnotation(ann)
+                    effectNames.update(fields["effects"].split('&'))
+                    featureIds.update(
+                        [fields["featureId"], fields["geneId"]])
+                effectNames.discard("")
+                featureIds.discard("")
+                yield (
+                    record.contig, record.start, record.stop, effectNames,
+                    featureIds)
+
+    def _getRawAnnotations(self, record):
+        """
+        Returns the list of annotation strings in the INFO field of the
+        specified pysam variant record, and the index of the column holding
+        the effect names in each.
+        """
+        return (
+            record.info.get(self._getAnnotationKey()),
+            self._fieldIndexes["effects"])
+
+    def _hasAnyEffect(self, record, effectNames):
+        """
+        Returns True if any of the raw annotations of the specified record
+        has an effect named in the specified set.
+        """
+        annotations, column = self._getRawAnnotations(record)
+        for ann in annotations or []:
+            fields = ann.split('|')
+            if len(fields) > column and not effectNames.isdisjoint(
+                    fields[column].split('&')):
+                return True
+        return False
+
+    def _hasAnyFeature(self, record, featureIds):
+        """
+        Returns True if any of the raw annotations of the specified record
+        is of a transcript or gene whose ID is in the specified set.
+        """
+        annotations, _ = self._getRawAnnotations(record)
+        for ann in annotations or []:
+            if self._hasFeatureId(ann, featureIds):
+                return True
+        return False
+
+    def _hasFeatureId(self, annStr, featureIds):
+        """
+        Returns True if the transcript or gene ID of the specified raw
+        annotation is in the specified set.
+        """
+        fields = self._splitAnnotation(annStr)
+        return (
+            fields["featureId"] in featureIds or
+            fields["geneId"] in featureIds)
 
     def convertLocation(self, pos):
         """
@@ -1165,14 +1693,14 @@ class HtslibVariantAnnotationSet(AbstractVariantAnnotationSet):
         """
         if isUnspecified(hgvsc):
             return None
-        match = re.match(".*c.(\d+)(\D+)>(\D+)", hgvsc)
-        if match:
-            pos = int(match.group(1))
+        groups = self._matchHgvs(HGVS_C_PATTERN, hgvsc)
+        if groups:
+            pos = int(groups[0])
             if pos > 0:
                 allLoc = self._createGaAlleleLocation()
                 allLoc.start = pos - 1
-                allLoc.reference_sequence = match.group(2)
-                allLoc.alternate_sequence = match.group(3)
+                allLoc.reference_sequence = groups[1]
+                allLoc.alternate_sequence = groups[2]
                 return allLoc
         return None
 
@@ -1185,24 +1713,44 @@ class HtslibVariantAnnotationSet(AbstractVariantAnnotationSet):
         """
         if isUnspecified(hgvsp):
             return None
-        match = re.match(".*p.(\D+)(\d+)(\D+)", hgvsp, flags=re.UNICODE)
-        if match is not None:
+        groups = self._matchHgvs(HGVS_P_PATTERN, hgvsp)
+        if groups is not None:
             allLoc = self._createGaAlleleLocation()
-            allLoc.reference_sequence = match.group(1)
-            allLoc.start = int(match.group(2)) - 1
-            allLoc.alternate_sequence = match.group(3)
+            allLoc.reference_sequence = groups[0]
+            allLoc.start = int(groups[1]) - 1
+            allLoc.alternate_sequence = groups[2]
             return allLoc
         return None
 
+    def _matchHgvs(self, pattern, hgvs):
+        """
+        Returns the groups matched by the specified pattern at the start
+        of the specified HGVS string, or None if it does not match. The
+        same HGVS strings recur across transcripts and variants, so the
+        results are memoized.
+        """
+        key = (pattern.pattern, hgvs)
+        if key in self._hgvsMemo:
+            return self._hgvsMemo[key]
+        match = pattern.match(hgvs)
+        groups = None if match is None else match.groups()
+        if len(self._hgvsMemo) >= HGVS_MEMO_SIZE:
+            self._hgvsMemo.clear()
+        self._hgvsMemo[key] = groups
+        return groups
+
     def addCDSLocation(self, effect, cdnaPos):
         hgvsC = effect.hgvs_annotation.transcript
         allele_location = None
         if not isUnspecified(hgvsC):
             allele_location = self.convertLocationHgvsC(hgvsC)
             if allele_location:
-                effect.cds_location.CopyFrom(self.convertLocationHgvsC(hgvsC))
-        if allele_location is None and self.convertLocation(cdnaPos):
-                effect.cds_location.CopyFrom(self.convertLocation(cdnaPos))
+                effect.cds_location.CopyFrom(allele_location)
+        cdna_location = None
+        if allele_location is None:
+            cdna_location = self.convertLocation(cdnaPos)
+        if cdna_location:
+            effect.cds_location.CopyFrom(cdna_location)
         else:
             # These are not stored in the VCF
             effect.cds_location.alternate_sequence = ""
@@ -1214,20 +1762,23 @@ class HtslibVariantAnnotationSet(AbstractVariantAnnotationSet):
         if not isUnspecified(hgvsP):
             protein_location = self.convertLocationHgvsP(hgvsP)
             if protein_location:
-                effect.protein_location.CopyFrom(
-                    self.convertLocationHgvsP(hgvsP))
-        if protein_location is None and self.convertLocation(protPos):
-            effect.protein_location.CopyFrom(self.convertLocation(protPos))
+                effect.protein_location.CopyFrom(protein_location)
+        if protein_location is None:
+            protein_location = self.convertLocation(protPos)
+            if protein_location:
+                effect.protein_location.CopyFrom(protein_location)
 
     def addCDNALocation(self, effect, cdnaPos):
         hgvsC = effect.hgvs_annotation.transcript
-        if self.convertLocation(cdnaPos):
-            effect.cdna_location.CopyFrom(self.convertLocation(cdnaPos))
-        if self.convertLocationHgvsC(hgvsC):
+        cdna_location = self.convertLocation(cdnaPos)
+        if cdna_location:
+            effect.cdna_location.CopyFrom(cdna_location)
+        allele_location = self.convertLocationHgvsC(hgvsC)
+        if allele_location:
             effect.cdna_location.alternate_sequence = \
-                self.convertLocationHgvsC(hgvsC).alternate_sequence
+                allele_location.alternate_sequence
             effect.cdna_location.reference_sequence = \
-                self.convertLocationHgvsC(hgvsC).reference_sequence
+                allele_location.reference_sequence
 
     def addLocations(self, effect, protPos, cdnaPos):
         """
@@ -1244,88 +1795,85 @@ class HtslibVariantAnnotationSet(AbstractVariantAnnotationSet):
         self.addProteinLocation(effect, protPos)
         return effect
 
-    def convertTranscriptEffectCSQ(self, annStr, hgvsG):
+    def convertTranscriptEffectCSQ(self, annStr, hgvsG, effectNames=None):
         """
         Takes the consequence string of an annotated VCF using a
         CSQ field as opposed to ANN and returns an array of
         transcript effects.
         :param annStr: String
         :param hgvsG: String
+        :param effectNames: if not None, only the effects named in this
+            set are given locations
         :return: [protocol.TranscriptEffect]
         """
-        # Allele|Gene|Feature|Feature_type|Consequence|cDNA_position|
-        # CDS_position|Protein_position|Amino_acids|Codons|Existing_variation|
-        # DISTANCE|STRAND|SIFT|PolyPhen|MOTIF_NAME|MOTIF_POS|HIGH_INF_POS|MOTIF_SCORE_CHANGE
-
-        (alt, gene, featureId, featureType, effects, cdnaPos,
-         cdsPos, protPos, aminos, codons, existingVar, distance,
-         strand, sift, polyPhen, motifName, motifPos,
-         highInfPos, motifScoreChange) = annStr.split('|')
-        terms = effects.split("&")
+        fields = self._splitAnnotation(annStr)
+        terms = fields["effects"].split("&")
         transcriptEffects = []
         for term in terms:
             transcriptEffects.append(
                 self._createCsqTranscriptEffect(
-                    alt, term, protPos,
-                    cdnaPos, featureId))
+                    fields["alt"], term, fields["protPos"],
+                    fields["cdnaPos"], fields["featureId"], effectNames))
         return transcriptEffects
 
     def _createCsqTranscriptEffect(
-            self, alt, term, protPos, cdnaPos, featureId):
+            self, alt, term, protPos, cdnaPos, featureId, effectNames=None):
         effect = self._createGaTranscriptEffect()
         effect.alternate_bases = alt
         effect.effects.extend(self.convertSeqOntology(term))
         effect.feature_id = featureId
         # These are not present in the data
-        self.addLocations(effect, protPos, cdnaPos)
+        self._addLocationsIfNamed(effect, protPos, cdnaPos, effectNames)
         effect.id = self.getTranscriptEffectId(effect)
         return effect
 
-    def convertTranscriptEffectVEP(self, annStr, hgvsG):
+    def _addLocationsIfNamed(self, effect, protPos, cdnaPos, effectNames):
+        """
+        Adds locations to the specified transcript effect, unless a set of
+        effect names is specified and the effect has none of them, in
+        which case it is only needed for its ID.
+        """
+        if effectNames is None or self._hasEffectNamed(effect, effectNames):
+            self.addLocations(effect, protPos, cdnaPos)
+
+    def convertTranscriptEffectVEP(self, annStr, hgvsG, effectNames=None):
         """
         Takes the ANN string of a VEP generated VCF, splits it
         and returns a populated GA4GH transcript effect object.
         :param annStr: String
         :param hgvsG: String
+        :param effectNames: if not None, the effect is only given locations
+            if it has one of the effects named in this set
         :return: effect protocol.TranscriptEffect
         """
-        effect = self._createGaTranscriptEffect()
-        (alt, effects, impact, symbol, geneName, featureType,
-         featureId, trBiotype, exon, intron, hgvsC, hgvsP,
-         cdnaPos, cdsPos, protPos, aminos, codons,
-         existingVar, distance, strand, symbolSource,
-         hgncId, hgvsOffset) = annStr.split('|')
-        effect.alternate_bases = alt
-        effect.effects.extend(self.convertSeqOntology(effects))
-        effect.feature_id = featureId
-        effect.hgvs_annotation.CopyFrom(protocol.HGVSAnnotation())
-        effect.hgvs_annotation.genomic = hgvsG
-        effect.hgvs_annotation.transcript = hgvsC
-        effect.hgvs_annotation.protein = hgvsP
-        self.addLocations(effect, protPos, cdnaPos)
-        effect.id = self.getTranscriptEffectId(effect)
-        return effect
+        return self._convertTranscriptEffectAnn(annStr, hgvsG, effectNames)
 
-    def convertTranscriptEffectSnpEff(self, annStr, hgvsG):
+    def convertTranscriptEffectSnpEff(
+            self, annStr, hgvsG, effectNames=None):
         """
         Takes the ANN string of a SnpEff generated VCF, splits it
         and returns a populated GA4GH transcript effect object.
         :param annStr: String
         :param hgvsG: String
+        :param effectNames: if not None, the effect is only given locations
+            if it has one of the effects named in this set
         :return: effect protocol.TranscriptEffect()
         """
+        return self._convertTranscriptEffectAnn(annStr, hgvsG, effectNames)
+
+    def _convertTranscriptEffectAnn(self, annStr, hgvsG, effectNames):
+        # SnpEff and VEP don't agree on the order of the fields, which
+        # are found by the names in the header.
+        fields = self._splitAnnotation(annStr)
         effect = self._createGaTranscriptEffect()
-        # SnpEff and VEP don't agree on this :)
-        (alt, effects, impact, geneName, geneId, featureType,
-            featureId, trBiotype, rank, hgvsC, hgvsP, cdnaPos,
-            cdsPos, protPos, distance, errsWarns) = annStr.split('|')
-        effect.alternate_bases = alt
-        effect.effects.extend(self.convertSeqOntology(effects))
-        effect.feature_id = featureId
+        effect.alternate_bases = fields["alt"]
+        effect.effects.extend(self.convertSeqOntology(fields["effects"]))
+        effect.feature_id = fields["featureId"]
         effect.hgvs_annotation.genomic = hgvsG
-        effect.hgvs_annotation.transcript = hgvsC
-        effect.hgvs_annotation.protein = hgvsP
-        self.addLocations(effect, protPos, cdnaPos)
+        effect.hgvs_annotation.transcript = fields["hgvsC"]
+        effect.hgvs_annotation.protein = fields["hgvsP"]
+        self._addLocationsIfNamed(
+            effect, fields["protPos"], fields["cdnaPos"], effectNames)
         effect.id = self.getTranscriptEffectId(effect)
         return effect
 
@@ -1341,11 +1889,15 @@ class HtslibVariantAnnotationSet(AbstractVariantAnnotationSet):
             self._ontology.getGaTermByName(soName)
             for soName in seqOntStr.split('&')]
 
-    def convertVariantAnnotation(self, record, transcriptConverter):
+    def convertVariantAnnotation(
+            self, record, transcriptConverter, effectNames=None,
+            featureIds=None):
         """
         Converts the specfied pysam variant record into a GA4GH variant
         annotation object using the specified function to convert the
-        transcripts.
+        transcripts. If a set of effect names is specified, the annotation
+        only holds the transcript effects with one of them, and likewise
+        for a set of transcript or gene IDs.
         """
         variant = self._variantSet.convertVariant(record, [])
         annotation = self._createGaVariantAnnotation()
@@ -1353,22 +1905,48 @@ class HtslibVariantAnnotationSet(AbstractVariantAnnotationSet):
         # Convert annotations from INFO field into TranscriptEffect
         transcriptEffects = []
         hgvsG = record.info.get(b'HGVS.g')
+        annotations = record.info.get(self._getAnnotationKey())
+        # The features of the transcript effects, when they are filtered
+        featureMatches = []
         if transcriptConverter != self.convertTranscriptEffectCSQ:
-            annotations = record.info.get(b'ANN')
             transcriptEffects = self._convertAnnotations(
-                annotations, variant, hgvsG, transcriptConverter)
+                annotations, variant, hgvsG, transcriptConverter,
+                effectNames)
+            if featureIds is not None:
+                featureMatches = [
+                    self._hasFeatureId(ann, featureIds)
+                    for ann in annotations or []]
         else:
-            annotations = record.info.get('CSQ'.encode())
             transcriptEffects = []
             for ann in annotations:
-                transcriptEffects.extend(
-                    self.convertTranscriptEffectCSQ(ann, hgvsG))
+                effects = self.convertTranscriptEffectCSQ(
+                    ann, hgvsG, effectNames)
+                transcriptEffects.extend(effects)
+                if featureIds is not None:
+                    featureMatches.extend(
+                        [self._hasFeatureId(ann, featureIds)] * len(effects))
+        transcriptEffectIds = None
+        if featureIds is not None:
+            transcriptEffectIds = [effect.id for effect in transcriptEffects]
+            transcriptEffects = [
+                effect for effect, matches in zip(
+                    transcriptEffects, featureMatches) if matches]
+        if effectNames is not None:
+            # The ID of the annotation covers all of its transcript effects
+            if transcriptEffectIds is None:
+                transcriptEffectIds = [
+                    effect.id for effect in transcriptEffects]
+            transcriptEffects = [
+                effect for effect in transcriptEffects
+                if self._hasEffectNamed(effect, effectNames)]
         annotation.transcript_effects.extend(transcriptEffects)
-        annotation.id = self.getVariantAnnotationId(variant, annotation)
+        annotation.id = self.getVariantAnnotationId(
+            variant, annotation, transcriptEffectIds)
         return variant, annotation
 
     def _convertAnnotations(
-            self, annotations, variant, hgvsG, transcriptConverter):
+            self, annotations, variant, hgvsG, transcriptConverter,
+            effectNames=None):
         transcriptEffects = []
         if annotations is not None:
             for index, ann in enumerate(annotations):
@@ -1378,5 +1956,5 @@ class HtslibVariantAnnotationSet(AbstractVariantAnnotationSet):
                     # each alternate allele
                     altshgvsG = hgvsG[index % len(variant.alternate_bases)]
                 transcriptEffects.append(
-                    transcriptConverter(ann, altshgvsG))
+                    transcriptConverter(ann, altshgvsG, effectNames))
         return transcriptEffects
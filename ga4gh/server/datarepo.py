@@ -5,11 +5,18 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import collections
+import cPickle as pickle
 import json
 import os
 import sqlite3
+import struct
 import datetime
+import threading
 
+import peewee
+
+import ga4gh.server
 import ga4gh.server.datamodel as datamodel
 import ga4gh.server.datamodel.datasets as datasets
 import ga4gh.server.datamodel.ontologies as ontologies
@@ -30,6 +37,23 @@ import ga4gh.schemas.protocol as protocol
 MODE_READ = 'r'
 MODE_WRITE = 'w'
 
+SNAPSHOT_SUFFIX = ".snapshot"
+SNAPSHOT_VERSION = 2
+
+# The attributes of a loaded repository which are saved in its snapshot
+SNAPSHOT_ATTRIBUTES = [
+    "_datasetIdMap", "_datasetNameMap", "_datasetIds",
+    "_referenceSetIdMap", "_referenceSetNameMap", "_referenceSetIds",
+    "_ontologyNameMap", "_ontologyIdMap", "_ontologyIds", "_loadedObjects"]
+
+# The objects which are reused when a repository is reloaded, if their
+# records are unchanged. Containers are always created afresh, as the
+# objects they hold may have changed.
+REUSABLE_MODELS = (
+    m.Ontology, m.Reference, m.Readgroup, m.Callset,
+    m.Variantannotationset, m.Featureset, m.Biosample, m.Individual,
+    m.Phenotypeassociationset, m.Rnaquantificationset)
+
 
 class AbstractDataRepository(object):
     """
@@ -99,6 +123,28 @@ class AbstractDataRepository(object):
         """
         return self._datasetIdMap[self._datasetIds[index]]
 
+    def hasChanged(self):
+        """
+        Returns True if the stored contents of this data repository have
+        changed since it was loaded.
+        """
+        return False
+
+    def reload(self):
+        """
+        Returns a copy of this data repository loaded from its current
+        stored contents.
+        """
+        return self
+
+    def getVersion(self):
+        """
+        Returns a string identifying the stored contents of this data
+        repository, which changes whenever they change, or None if the
+        contents cannot be identified.
+        """
+        return None
+
     def getDatasetByName(self, name):
         """
         Returns the dataset with the specified name.
@@ -454,6 +500,7 @@ class SqlDataRepository(AbstractDataRepository):
     version = SchemaVersion("2.1")
     systemKeySchemaVersion = "schemaVersion"
     systemKeyCreationTimeStamp = "creationTimeStamp"
+    systemKeyChangeCounter = "changeCounter"
 
     def __init__(self, fileName):
         super(SqlDataRepository, self).__init__()
@@ -466,6 +513,12 @@ class SqlDataRepository(AbstractDataRepository):
         # we have called load()
         self._schemaVersion = None
         self._creationTimeStamp = None
+        self._changeCounter = None
+        # The (record values, object) pairs for the records read by the
+        # last load, keyed by (model name, ID), and those of the load
+        # before it whose objects may be reused.
+        self._loadedObjects = {}
+        self._previousObjects = {}
         # Connection to the DB.
         self._dbConnection = None
         self.database = m.SqliteDatabase(self._dbFilename, **{})
@@ -506,6 +559,13 @@ class SqlDataRepository(AbstractDataRepository):
         this function if the repo is not opened in write-mode.
         """
         self._checkWriteMode()
+        # Servers watching the repo reload it when the counter changes.
+        changeCounter = int(self._getChangeCounter() or 0) + 1
+        query = m.System.update(value=changeCounter).where(
+            m.System.key == self.systemKeyChangeCounter)
+        if query.execute() == 0:
+            m.System.create(
+                key=self.systemKeyChangeCounter, value=changeCounter)
 
     def close(self):
         """
@@ -633,11 +693,77 @@ class SqlDataRepository(AbstractDataRepository):
                 m.System.key == self.systemKeyCreationTimeStamp).value
         except Exception:
             raise exceptions.RepoInvalidDatabaseException(self._dbFilename)
+        self._changeCounter = self._getChangeCounter()
         schemaVersion = self.SchemaVersion(self._schemaVersion)
         if schemaVersion.major != self.version.major:
             raise exceptions.RepoSchemaVersionMismatchException(
                 schemaVersion, self.version)
 
+    def _getChangeCounter(self):
+        """
+        Returns the number of times changes to this repo have been
+        committed, or None if that has not been recorded.
+        """
+        try:
+            return m.System.get(
+                m.System.key == self.systemKeyChangeCounter).value
+        except m.System.DoesNotExist:
+            return None
+
+    def hasChanged(self):
+        return self._getChangeCounter() != self._changeCounter
+
+    def getVersion(self):
+        return "{}:{}:{}".format(
+            os.path.abspath(self._dbFilename), self._creationTimeStamp,
+            self._changeCounter)
+
+    def reload(self):
+        """
+        Returns a copy of this repo loaded from its current contents,
+        which reuses the objects of this repo whose records are unchanged.
+        This repo is not modified, so requests using it are not disturbed.
+        """
+        repo = SqlDataRepository(self._dbFilename)
+        repo._previousObjects = self._loadedObjects
+        repo.open(MODE_READ)
+        return repo
+
+    def _isRecordUnchanged(self, key):
+        previous = self._previousObjects.get(key)
+        current = self._loadedObjects.get(key)
+        return (
+            previous is not None and current is not None and
+            previous[0] == current[0])
+
+    def _loadObject(self, record, createMethod, *parents):
+        """
+        Returns the object for the specified record, which is created by
+        calling the specified method with the specified parent containers
+        and the record. When the repo is reloaded, the object read by the
+        previous load is reused if neither its record nor the records it
+        refers to have changed.
+        """
+        key = (type(record).__name__, record.id)
+        values = tuple(sorted(record._data.items()))
+        previous = self._previousObjects.get(key)
+        object_ = None
+        if previous is not None and previous[0] == values:
+            referencedKeys = [
+                (field.rel_model.__name__, record._data[name])
+                for name, field in record._meta.fields.items()
+                if isinstance(field, peewee.ForeignKeyField) and
+                record._data.get(name) is not None]
+            if all(map(self._isRecordUnchanged, referencedKeys)):
+                object_ = previous[1]
+        if object_ is None:
+            object_ = createMethod(*(parents + (record,)))
+        if isinstance(record, REUSABLE_MODELS):
+            self._loadedObjects[key] = (values, object_)
+        else:
+            self._loadedObjects[key] = (values, None)
+        return object_
+
     def _createOntologyTable(self):
         self.database.create_table(m.Ontology)
 
@@ -657,11 +783,15 @@ class SqlDataRepository(AbstractDataRepository):
         # TODO we need to create a proper ID when we're doing ID generation
         # for the rest of the container objects.
 
+    def _createOntology(self, ontologyRecord):
+        ontology = ontologies.Ontology(ontologyRecord.name)
+        ontology.populateFromRow(ontologyRecord)
+        return ontology
+
     def _readOntologyTable(self):
-        for ont in m.Ontology.select():
-            ontology = ontologies.Ontology(ont.name)
-            ontology.populateFromRow(ont)
-            self.addOntology(ontology)
+        for ontologyRecord in m.Ontology.select():
+            self.addOntology(
+                self._loadObject(ontologyRecord, self._createOntology))
 
     def removeOntology(self, ontology):
         """
@@ -688,15 +818,19 @@ class SqlDataRepository(AbstractDataRepository):
             sourceaccessions=json.dumps(reference.getSourceAccessions()),
             sourceuri=reference.getSourceUri())
 
+    def _createReference(self, referenceSet, referenceRecord):
+        reference = references.HtslibReference(
+            referenceSet, referenceRecord.name)
+        reference.populateFromRow(referenceRecord)
+        assert reference.getId() == referenceRecord.id
+        return reference
+
     def _readReferenceTable(self):
         for referenceRecord in m.Reference.select():
             referenceSet = self.getReferenceSet(
                 referenceRecord.referencesetid.id)
-            reference = references.HtslibReference(
-                referenceSet, referenceRecord.name)
-            reference.populateFromRow(referenceRecord)
-            assert reference.getId() == referenceRecord.id
-            referenceSet.addReference(reference)
+            referenceSet.addReference(self._loadObject(
+                referenceRecord, self._createReference, referenceSet))
 
     def _createReferenceSetTable(self):
         self.database.create_table(m.Referenceset)
@@ -724,14 +858,18 @@ class SqlDataRepository(AbstractDataRepository):
             raise exceptions.DuplicateNameException(
                 referenceSet.getLocalId())
 
+    def _createReferenceSet(self, referenceSetRecord):
+        referenceSet = references.HtslibReferenceSet(
+            referenceSetRecord.name)
+        referenceSet.populateFromRow(referenceSetRecord)
+        assert referenceSet.getId() == referenceSetRecord.id
+        return referenceSet
+
     def _readReferenceSetTable(self):
         for referenceSetRecord in m.Referenceset.select():
-            referenceSet = references.HtslibReferenceSet(
-                referenceSetRecord.name)
-            referenceSet.populateFromRow(referenceSetRecord)
-            assert referenceSet.getId() == referenceSetRecord.id
             # Insert the referenceSet into the memory-based object model.
-            self.addReferenceSet(referenceSet)
+            self.addReferenceSet(self._loadObject(
+                referenceSetRecord, self._createReferenceSet))
 
     def _createDatasetTable(self):
         self.database.create_table(m.Dataset)
@@ -775,13 +913,17 @@ class SqlDataRepository(AbstractDataRepository):
             m.Featureset.id == featureSet.getId())
         q.execute()
 
+    def _createDataset(self, datasetRecord):
+        dataset = datasets.Dataset(datasetRecord.name)
+        dataset.populateFromRow(datasetRecord)
+        assert dataset.getId() == datasetRecord.id
+        return dataset
+
     def _readDatasetTable(self):
         for datasetRecord in m.Dataset.select():
-            dataset = datasets.Dataset(datasetRecord.name)
-            dataset.populateFromRow(datasetRecord)
-            assert dataset.getId() == datasetRecord.id
             # Insert the dataset into the memory-based object model.
-            self.addDataset(dataset)
+            self.addDataset(
+                self._loadObject(datasetRecord, self._createDataset))
 
     def _createReadGroupTable(self):
         self.database.create_table(m.Readgroup)
@@ -840,17 +982,21 @@ class SqlDataRepository(AbstractDataRepository):
         q = m.Individual.delete().where(m.Individual.id == individual.getId())
         q.execute()
 
+    def _createReadGroup(self, readGroupSet, readGroupRecord):
+        readGroup = reads.HtslibReadGroup(
+            readGroupSet, readGroupRecord.name)
+        # TODO set the reference set.
+        readGroup.populateFromRow(readGroupRecord)
+        assert readGroup.getId() == readGroupRecord.id
+        return readGroup
+
     def _readReadGroupTable(self):
         for readGroupRecord in m.Readgroup.select():
             readGroupSet = self.getReadGroupSet(
                 readGroupRecord.readgroupsetid.id)
-            readGroup = reads.HtslibReadGroup(
-                readGroupSet, readGroupRecord.name)
-            # TODO set the reference set.
-            readGroup.populateFromRow(readGroupRecord)
-            assert readGroup.getId() == readGroupRecord.id
             # Insert the readGroupSet into the memory-based object model.
-            readGroupSet.addReadGroup(readGroup)
+            readGroupSet.addReadGroup(self._loadObject(
+                readGroupRecord, self._createReadGroup, readGroupSet))
 
     def _createReadGroupSetTable(self):
         self.database.create_table(m.Readgroupset)
@@ -901,18 +1047,22 @@ class SqlDataRepository(AbstractDataRepository):
                    "the reference set.")
             raise exceptions.RepoManagerException(msg)
 
+    def _createReadGroupSet(self, dataset, readGroupSetRecord):
+        readGroupSet = reads.HtslibReadGroupSet(
+            dataset, readGroupSetRecord.name)
+        referenceSet = self.getReferenceSet(
+            readGroupSetRecord.referencesetid.id)
+        readGroupSet.setReferenceSet(referenceSet)
+        readGroupSet.populateFromRow(readGroupSetRecord)
+        assert readGroupSet.getId() == readGroupSetRecord.id
+        return readGroupSet
+
     def _readReadGroupSetTable(self):
         for readGroupSetRecord in m.Readgroupset.select():
             dataset = self.getDataset(readGroupSetRecord.datasetid.id)
-            readGroupSet = reads.HtslibReadGroupSet(
-                dataset, readGroupSetRecord.name)
-            referenceSet = self.getReferenceSet(
-                readGroupSetRecord.referencesetid.id)
-            readGroupSet.setReferenceSet(referenceSet)
-            readGroupSet.populateFromRow(readGroupSetRecord)
-            assert readGroupSet.getId() == readGroupSetRecord.id
             # Insert the readGroupSet into the memory-based object model.
-            dataset.addReadGroupSet(readGroupSet)
+            dataset.addReadGroupSet(self._loadObject(
+                readGroupSetRecord, self._createReadGroupSet, dataset))
 
     def _createVariantAnnotationSetTable(self):
         self.database.create_table(m.Variantannotationset)
@@ -937,18 +1087,23 @@ class SqlDataRepository(AbstractDataRepository):
         except Exception as e:
             raise exceptions.RepoManagerException(e)
 
+    def _createVariantAnnotationSet(self, variantSet, annotationSetRecord):
+        ontology = self.getOntology(annotationSetRecord.ontologyid.id)
+        variantAnnotationSet = variants.HtslibVariantAnnotationSet(
+            variantSet, annotationSetRecord.name)
+        variantAnnotationSet.setOntology(ontology)
+        variantAnnotationSet.populateFromRow(annotationSetRecord)
+        assert variantAnnotationSet.getId() == annotationSetRecord.id
+        return variantAnnotationSet
+
     def _readVariantAnnotationSetTable(self):
         for annotationSetRecord in m.Variantannotationset.select():
             variantSet = self.getVariantSet(
                 annotationSetRecord.variantsetid.id)
-            ontology = self.getOntology(annotationSetRecord.ontologyid.id)
-            variantAnnotationSet = variants.HtslibVariantAnnotationSet(
-                variantSet, annotationSetRecord.name)
-            variantAnnotationSet.setOntology(ontology)
-            variantAnnotationSet.populateFromRow(annotationSetRecord)
-            assert variantAnnotationSet.getId() == annotationSetRecord.id
             # Insert the variantAnnotationSet into the memory-based model.
-            variantSet.addVariantAnnotationSet(variantAnnotationSet)
+            variantSet.addVariantAnnotationSet(self._loadObject(
+                annotationSetRecord, self._createVariantAnnotationSet,
+                variantSet))
 
     def _createCallSetTable(self):
         self.database.create_table(m.Callset)
@@ -967,14 +1122,18 @@ class SqlDataRepository(AbstractDataRepository):
         except Exception as e:
             raise exceptions.RepoManagerException(e)
 
+    def _createCallSet(self, variantSet, callSetRecord):
+        callSet = variants.CallSet(variantSet, callSetRecord.name)
+        callSet.populateFromRow(callSetRecord)
+        assert callSet.getId() == callSetRecord.id
+        return callSet
+
     def _readCallSetTable(self):
         for callSetRecord in m.Callset.select():
             variantSet = self.getVariantSet(callSetRecord.variantsetid.id)
-            callSet = variants.CallSet(variantSet, callSetRecord.name)
-            callSet.populateFromRow(callSetRecord)
-            assert callSet.getId() == callSetRecord.id
             # Insert the callSet into the memory-based object model.
-            variantSet.addCallSet(callSet)
+            variantSet.addCallSet(self._loadObject(
+                callSetRecord, self._createCallSet, variantSet))
 
     def _createVariantSetTable(self):
         self.database.create_table(m.Variantset)
@@ -1006,18 +1165,22 @@ class SqlDataRepository(AbstractDataRepository):
         for callSet in variantSet.getCallSets():
             self.insertCallSet(callSet)
 
+    def _createVariantSet(self, dataset, variantSetRecord):
+        referenceSet = self.getReferenceSet(
+            variantSetRecord.referencesetid.id)
+        variantSet = variants.HtslibVariantSet(
+            dataset, variantSetRecord.name)
+        variantSet.setReferenceSet(referenceSet)
+        variantSet.populateFromRow(variantSetRecord)
+        assert variantSet.getId() == variantSetRecord.id
+        return variantSet
+
     def _readVariantSetTable(self):
         for variantSetRecord in m.Variantset.select():
             dataset = self.getDataset(variantSetRecord.datasetid.id)
-            referenceSet = self.getReferenceSet(
-                variantSetRecord.referencesetid.id)
-            variantSet = variants.HtslibVariantSet(
-                dataset, variantSetRecord.name)
-            variantSet.setReferenceSet(referenceSet)
-            variantSet.populateFromRow(variantSetRecord)
-            assert variantSet.getId() == variantSetRecord.id
             # Insert the variantSet into the memory-based object model.
-            dataset.addVariantSet(variantSet)
+            dataset.addVariantSet(self._loadObject(
+                variantSetRecord, self._createVariantSet, dataset))
 
     def _createFeatureSetTable(self):
         self.database.create_table(m.Featureset)
@@ -1039,26 +1202,30 @@ class SqlDataRepository(AbstractDataRepository):
         except Exception as e:
             raise exceptions.RepoManagerException(e)
 
+    def _createFeatureSet(self, dataset, featureSetRecord):
+        # FIXME this should be handled elsewhere
+        if 'cgd' in featureSetRecord.name:
+            featureSet = \
+                g2pFeatureset \
+                .PhenotypeAssociationFeatureSet(
+                    dataset, featureSetRecord.name)
+        else:
+            featureSet = sequence_annotations.Gff3DbFeatureSet(
+                dataset, featureSetRecord.name)
+        featureSet.setReferenceSet(
+            self.getReferenceSet(
+                featureSetRecord.referencesetid.id))
+        featureSet.setOntology(
+            self.getOntology(featureSetRecord.ontologyid.id))
+        featureSet.populateFromRow(featureSetRecord)
+        assert featureSet.getId() == featureSetRecord.id
+        return featureSet
+
     def _readFeatureSetTable(self):
         for featureSetRecord in m.Featureset.select():
             dataset = self.getDataset(featureSetRecord.datasetid.id)
-            # FIXME this should be handled elsewhere
-            if 'cgd' in featureSetRecord.name:
-                featureSet = \
-                    g2pFeatureset \
-                    .PhenotypeAssociationFeatureSet(
-                        dataset, featureSetRecord.name)
-            else:
-                featureSet = sequence_annotations.Gff3DbFeatureSet(
-                    dataset, featureSetRecord.name)
-            featureSet.setReferenceSet(
-                self.getReferenceSet(
-                    featureSetRecord.referencesetid.id))
-            featureSet.setOntology(
-                self.getOntology(featureSetRecord.ontologyid.id))
-            featureSet.populateFromRow(featureSetRecord)
-            assert featureSet.getId() == featureSetRecord.id
-            dataset.addFeatureSet(featureSet)
+            dataset.addFeatureSet(self._loadObject(
+                featureSetRecord, self._createFeatureSet, dataset))
 
     def _createBiosampleTable(self):
         self.database.create_table(m.Biosample)
@@ -1083,14 +1250,18 @@ class SqlDataRepository(AbstractDataRepository):
                 biosample.getLocalId(),
                 biosample.getParentContainer().getLocalId())
 
+    def _createBiosample(self, dataset, biosampleRecord):
+        biosample = biodata.Biosample(
+            dataset, biosampleRecord.name)
+        biosample.populateFromRow(biosampleRecord)
+        assert biosample.getId() == biosampleRecord.id
+        return biosample
+
     def _readBiosampleTable(self):
         for biosampleRecord in m.Biosample.select():
             dataset = self.getDataset(biosampleRecord.datasetid.id)
-            biosample = biodata.Biosample(
-                dataset, biosampleRecord.name)
-            biosample.populateFromRow(biosampleRecord)
-            assert biosample.getId() == biosampleRecord.id
-            dataset.addBiosample(biosample)
+            dataset.addBiosample(self._loadObject(
+                biosampleRecord, self._createBiosample, dataset))
 
     def _createIndividualTable(self):
         self.database.create_table(m.Individual)
@@ -1116,14 +1287,18 @@ class SqlDataRepository(AbstractDataRepository):
                 individual.getLocalId(),
                 individual.getParentContainer().getLocalId())
 
+    def _createIndividual(self, dataset, individualRecord):
+        individual = biodata.Individual(
+            dataset, individualRecord.name)
+        individual.populateFromRow(individualRecord)
+        assert individual.getId() == individualRecord.id
+        return individual
+
     def _readIndividualTable(self):
         for individualRecord in m.Individual.select():
             dataset = self.getDataset(individualRecord.datasetid.id)
-            individual = biodata.Individual(
-                dataset, individualRecord.name)
-            individual.populateFromRow(individualRecord)
-            assert individual.getId() == individualRecord.id
-            dataset.addIndividual(individual)
+            dataset.addIndividual(self._loadObject(
+                individualRecord, self._createIndividual, dataset))
 
     def _createPhenotypeAssociationSetTable(self):
         self.database.create_table(m.Phenotypeassociationset)
@@ -1149,15 +1324,18 @@ class SqlDataRepository(AbstractDataRepository):
             raise exceptions.DuplicateNameException(
                 phenotypeAssociationSet.getParentContainer().getId())
 
+    def _createPhenotypeAssociationSet(self, dataset, associationSetRecord):
+        return genotype_phenotype.RdfPhenotypeAssociationSet(
+            dataset,
+            associationSetRecord.name,
+            associationSetRecord.dataurl)
+
     def _readPhenotypeAssociationSetTable(self):
         for associationSetRecord in m.Phenotypeassociationset.select():
             dataset = self.getDataset(associationSetRecord.datasetid.id)
-            phenotypeAssociationSet = \
-                genotype_phenotype.RdfPhenotypeAssociationSet(
-                    dataset,
-                    associationSetRecord.name,
-                    associationSetRecord.dataurl)
-            dataset.addPhenotypeAssociationSet(phenotypeAssociationSet)
+            dataset.addPhenotypeAssociationSet(self._loadObject(
+                associationSetRecord, self._createPhenotypeAssociationSet,
+                dataset))
 
     def insertRnaQuantificationSet(self, rnaQuantificationSet):
         """
@@ -1176,18 +1354,23 @@ class SqlDataRepository(AbstractDataRepository):
                 rnaQuantificationSet.getLocalId(),
                 rnaQuantificationSet.getParentContainer().getLocalId())
 
+    def _createRnaQuantificationSet(self, dataset, quantificationSetRecord):
+        referenceSet = self.getReferenceSet(
+            quantificationSetRecord.referencesetid.id)
+        rnaQuantificationSet = \
+            rna_quantification.SqliteRnaQuantificationSet(
+                dataset, quantificationSetRecord.name)
+        rnaQuantificationSet.setReferenceSet(referenceSet)
+        rnaQuantificationSet.populateFromRow(quantificationSetRecord)
+        assert rnaQuantificationSet.getId() == quantificationSetRecord.id
+        return rnaQuantificationSet
+
     def _readRnaQuantificationSetTable(self):
         for quantificationSetRecord in m.Rnaquantificationset.select():
             dataset = self.getDataset(quantificationSetRecord.datasetid.id)
-            referenceSet = self.getReferenceSet(
-                quantificationSetRecord.referencesetid.id)
-            rnaQuantificationSet = \
-                rna_quantification.SqliteRnaQuantificationSet(
-                    dataset, quantificationSetRecord.name)
-            rnaQuantificationSet.setReferenceSet(referenceSet)
-            rnaQuantificationSet.populateFromRow(quantificationSetRecord)
-            assert rnaQuantificationSet.getId() == quantificationSetRecord.id
-            dataset.addRnaQuantificationSet(rnaQuantificationSet)
+            dataset.addRnaQuantificationSet(self._loadObject(
+                quantificationSetRecord, self._createRnaQuantificationSet,
+                dataset))
 
     def removeRnaQuantificationSet(self, rnaQuantificationSet):
         """
@@ -1241,11 +1424,98 @@ class SqlDataRepository(AbstractDataRepository):
         """
         os.unlink(self._dbFilename)
 
+    def getSnapshotPath(self):
+        """
+        Returns the path of the snapshot of this repository.
+        """
+        return self._dbFilename + SNAPSHOT_SUFFIX
+
+    def _getSnapshotHeader(self):
+        """
+        Returns the header identifying a snapshot of the current version
+        of this repository, written by this version of the server.
+        """
+        stat = os.stat(self._dbFilename)
+        return {
+            "snapshotVersion": SNAPSHOT_VERSION,
+            "schemaVersion": str(self.version),
+            "serverVersion": ga4gh.server.__version__,
+            "size": stat.st_size,
+            "mtime": repr(stat.st_mtime),
+            "fileChangeCounter": self._getFileChangeCounter()}
+
+    def _getFileChangeCounter(self):
+        """
+        Returns the file change counter in the header of the database,
+        which SQLite increments whenever a transaction changes the file,
+        even when its size and modification time appear unchanged.
+        """
+        with open(self._dbFilename, "rb") as dbFile:
+            dbFile.seek(24)
+            return struct.unpack(b">I", dbFile.read(4))[0]
+
+    def _readSnapshot(self, headerOnly=False):
+        """
+        Reads the snapshot of this repository, returning its state, or
+        True if headerOnly is set. Returns None if there is no snapshot of
+        the current version of this repository.
+        """
+        snapshotPath = self.getSnapshotPath()
+        if not os.path.exists(snapshotPath):
+            return None
+        try:
+            with open(snapshotPath, "rb") as snapshotFile:
+                if pickle.load(snapshotFile) != self._getSnapshotHeader():
+                    return None
+                if headerOnly:
+                    return True
+                return pickle.load(snapshotFile)
+        except Exception:
+            # Unpickling a damaged file can raise almost anything.
+            return None
+
+    def isSnapshotCurrent(self):
+        """
+        Returns True if there is a snapshot of the current version of this
+        repository.
+        """
+        return self._readSnapshot(headerOnly=True) is not None
+
+    def writeSnapshot(self):
+        """
+        Writes a snapshot of the objects loaded from this repository next
+        to its database, from which the repository is loaded until the
+        database is next changed. The snapshot replaces any previous one
+        atomically.
+        """
+        self._checkReadMode()
+        snapshotPath = self.getSnapshotPath()
+        tempPath = snapshotPath + ".tmp"
+        state = dict(
+            (name, getattr(self, name)) for name in SNAPSHOT_ATTRIBUTES)
+        with open(tempPath, "wb") as snapshotFile:
+            pickle.dump(
+                self._getSnapshotHeader(), snapshotFile,
+                pickle.HIGHEST_PROTOCOL)
+            pickle.dump(state, snapshotFile, pickle.HIGHEST_PROTOCOL)
+        os.rename(tempPath, snapshotPath)
+
     def load(self):
         """
-        Loads this data repository into memory.
+        Loads this data repository into memory, from its snapshot if that
+        is up to date.
         """
         self._readSystemTable()
+        self._loadedObjects = {}
+        state = self._readSnapshot()
+        if state is not None:
+            for name in SNAPSHOT_ATTRIBUTES:
+                setattr(self, name, state[name])
+        else:
+            self._readTables()
+        self._previousObjects = {}
+
+    def _readTables(self):
         self._readOntologyTable()
         self._readReferenceSetTable()
         self._readReferenceTable()
@@ -1260,3 +1530,296 @@ class SqlDataRepository(AbstractDataRepository):
         self._readIndividualTable()
         self._readPhenotypeAssociationSetTable()
         self._readRnaQuantificationSetTable()
+
+
+def _getOrderedRecords(query):
+    """
+    Returns the records selected by the specified query in the order they
+    were inserted, which is the order in which they are loaded.
+    """
+    return query.order_by(peewee.SQL("rowid"))
+
+
+def _getRecordByIndex(query, index):
+    """
+    Returns the record at the specified index among those selected by the
+    specified query.
+    """
+    records = list(_getOrderedRecords(query).offset(index).limit(1))
+    if index < 0 or len(records) == 0:
+        raise IndexError("Record index out of range")
+    return records[0]
+
+
+def _getRecord(query, exception):
+    """
+    Returns the single record selected by the specified query, or raises
+    the specified exception if there is none.
+    """
+    records = list(query.limit(1))
+    if len(records) == 0:
+        raise exception
+    return records[0]
+
+
+class ObjectCache(object):
+    """
+    A bounded cache of the objects read from a data repository. When the
+    cache is full the least recently used objects are evicted, and are
+    read again from the repository the next time they are needed.
+    """
+    def __init__(self, maxSize=1000):
+        if maxSize < 1:
+            raise ValueError("The size of the cache must be positive")
+        self._maxSize = maxSize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """
+        Removes all objects from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def getObject(self, key, createMethod):
+        """
+        Returns the object with the specified key, calling the specified
+        method to create it if it is not in the cache.
+        """
+        with self._lock:
+            if key in self._entries:
+                object_ = self._entries.pop(key)
+                self._entries[key] = object_
+                return object_
+        object_ = createMethod()
+        with self._lock:
+            self._entries[key] = object_
+            while len(self._entries) > self._maxSize:
+                self._entries.popitem(last=False)
+        return object_
+
+
+class LazyDataset(datasets.Dataset):
+    """
+    A dataset whose variant sets are read from a LazySqlDataRepository
+    when they are used, rather than held by the dataset.
+    """
+    def __init__(self, localId, repository):
+        super(LazyDataset, self).__init__(localId)
+        self._repository = repository
+
+    def _getVariantSetQuery(self):
+        return m.Variantset.select().where(
+            m.Variantset.datasetid == self.getId())
+
+    def _getVariantSet(self, variantSetRecord):
+        return self._repository._getVariantSet(
+            self, variantSetRecord.id, lambda: variantSetRecord)
+
+    def getVariantSets(self):
+        return [
+            self._getVariantSet(variantSetRecord)
+            for variantSetRecord in _getOrderedRecords(
+                self._getVariantSetQuery())]
+
+    def getNumVariantSets(self):
+        return self._getVariantSetQuery().count()
+
+    def getVariantSet(self, id_):
+        def getRecord():
+            return _getRecord(
+                self._getVariantSetQuery().where(m.Variantset.id == id_),
+                exceptions.VariantSetNotFoundException(id_))
+        return self._repository._getVariantSet(self, id_, getRecord)
+
+    def getVariantSetByIndex(self, index):
+        return self._getVariantSet(_getRecordByIndex(
+            self._getVariantSetQuery(), index))
+
+    def getVariantSetByName(self, name):
+        return self._getVariantSet(_getRecord(
+            self._getVariantSetQuery().where(m.Variantset.name == name),
+            exceptions.VariantSetNameNotFoundException(name)))
+
+
+class LazySqlDataRepository(SqlDataRepository):
+    """
+    A SqlDataRepository which reads objects from the database when they
+    are first used, rather than loading the whole database into memory
+    when it is opened. Datasets, reference sets, ontologies and variant
+    sets are held in a bounded cache, and the numbers of objects are
+    counted by the database. The other objects in a dataset are read with
+    the dataset, and the call sets and annotation sets of a variant set
+    with the variant set.
+    """
+    def __init__(self, fileName, cacheSize=1000):
+        super(LazySqlDataRepository, self).__init__(fileName)
+        self._cacheSize = cacheSize
+        self._cache = ObjectCache(cacheSize)
+
+    def reload(self):
+        repo = LazySqlDataRepository(self._dbFilename, self._cacheSize)
+        repo.open(MODE_READ)
+        return repo
+
+    def load(self):
+        """
+        Checks the schema of this repository. Objects are read from the
+        database on demand.
+        """
+        self._cache.clear()
+        self._readSystemTable()
+
+    def _getObject(self, kind, id_, createMethod):
+        return self._cache.getObject((kind, id_), createMethod)
+
+    def _getDataset(self, datasetRecord):
+        return self._getObject(
+            "dataset", datasetRecord.id,
+            lambda: self._createDataset(datasetRecord))
+
+    def _getReferenceSet(self, referenceSetRecord):
+        return self._getObject(
+            "referenceSet", referenceSetRecord.id,
+            lambda: self._createReferenceSet(referenceSetRecord))
+
+    def _getOntology(self, ontologyRecord):
+        return self._getObject(
+            "ontology", ontologyRecord.id,
+            lambda: self._createOntology(ontologyRecord))
+
+    def _getVariantSet(self, dataset, id_, getRecordMethod):
+        """
+        Returns the variant set with the specified ID in the specified
+        dataset, calling the specified method for its record only when it
+        is not in the cache.
+        """
+        return self._getObject(
+            "variantSet", id_, lambda: self._createVariantSet(
+                dataset, getRecordMethod()))
+
+    def _createDataset(self, datasetRecord):
+        dataset = LazyDataset(datasetRecord.name, self)
+        dataset.populateFromRow(datasetRecord)
+        assert dataset.getId() == datasetRecord.id
+        for model, createMethod, addMethod in [
+                (m.Readgroupset, self._createReadGroupSet,
+                 dataset.addReadGroupSet),
+                (m.Featureset, self._createFeatureSet,
+                 dataset.addFeatureSet),
+                (m.Biosample, self._createBiosample, dataset.addBiosample),
+                (m.Individual, self._createIndividual,
+                 dataset.addIndividual),
+                (m.Phenotypeassociationset,
+                 self._createPhenotypeAssociationSet,
+                 dataset.addPhenotypeAssociationSet),
+                (m.Rnaquantificationset, self._createRnaQuantificationSet,
+                 dataset.addRnaQuantificationSet)]:
+            for record in _getOrderedRecords(
+                    model.select().where(model.datasetid == dataset.getId())):
+                addMethod(createMethod(dataset, record))
+        return dataset
+
+    def _createReferenceSet(self, referenceSetRecord):
+        referenceSet = super(
+            LazySqlDataRepository, self)._createReferenceSet(
+                referenceSetRecord)
+        for referenceRecord in _getOrderedRecords(m.Reference.select().where(
+                m.Reference.referencesetid == referenceSet.getId())):
+            referenceSet.addReference(
+                self._createReference(referenceSet, referenceRecord))
+        return referenceSet
+
+    def _createReadGroupSet(self, dataset, readGroupSetRecord):
+        readGroupSet = super(
+            LazySqlDataRepository, self)._createReadGroupSet(
+                dataset, readGroupSetRecord)
+        for readGroupRecord in _getOrderedRecords(m.Readgroup.select().where(
+                m.Readgroup.readgroupsetid == readGroupSet.getId())):
+            readGroupSet.addReadGroup(
+                self._createReadGroup(readGroupSet, readGroupRecord))
+        return readGroupSet
+
+    def _createVariantSet(self, dataset, variantSetRecord):
+        variantSet = super(LazySqlDataRepository, self)._createVariantSet(
+            dataset, variantSetRecord)
+        # The call sets are needed to decode the calls of every variant, so
+        # they are read with the variant set.
+        for callSetRecord in _getOrderedRecords(m.Callset.select().where(
+                m.Callset.variantsetid == variantSet.getId())):
+            variantSet.addCallSet(
+                self._createCallSet(variantSet, callSetRecord))
+        for annotationSetRecord in _getOrderedRecords(
+                m.Variantannotationset.select().where(
+                    m.Variantannotationset.variantsetid ==
+                    variantSet.getId())):
+            variantSet.addVariantAnnotationSet(
+                self._createVariantAnnotationSet(
+                    variantSet, annotationSetRecord))
+        return variantSet
+
+    def getDatasets(self):
+        return [
+            self._getDataset(datasetRecord)
+            for datasetRecord in _getOrderedRecords(m.Dataset.select())]
+
+    def getNumDatasets(self):
+        return m.Dataset.select().count()
+
+    def getDataset(self, id_):
+        return self._getObject("dataset", id_, lambda: self._createDataset(
+            _getRecord(
+                m.Dataset.select().where(m.Dataset.id == id_),
+                exceptions.DatasetNotFoundException(id_))))
+
+    def getDatasetByIndex(self, index):
+        return self._getDataset(_getRecordByIndex(m.Dataset.select(), index))
+
+    def getDatasetByName(self, name):
+        return self._getDataset(_getRecord(
+            m.Dataset.select().where(m.Dataset.name == name),
+            exceptions.DatasetNameNotFoundException(name)))
+
+    def getReferenceSets(self):
+        return [
+            self._getReferenceSet(referenceSetRecord)
+            for referenceSetRecord in _getOrderedRecords(
+                m.Referenceset.select())]
+
+    def getNumReferenceSets(self):
+        return m.Referenceset.select().count()
+
+    def getReferenceSet(self, id_):
+        return self._getObject(
+            "referenceSet", id_, lambda: self._createReferenceSet(_getRecord(
+                m.Referenceset.select().where(m.Referenceset.id == id_),
+                exceptions.ReferenceSetNotFoundException(id_))))
+
+    def getReferenceSetByIndex(self, index):
+        return self._getReferenceSet(
+            _getRecordByIndex(m.Referenceset.select(), index))
+
+    def getReferenceSetByName(self, name):
+        return self._getReferenceSet(_getRecord(
+            m.Referenceset.select().where(m.Referenceset.name == name),
+            exceptions.ReferenceSetNameNotFoundException(name)))
+
+    def getOntologys(self):
+        return [
+            self._getOntology(ontologyRecord)
+            for ontologyRecord in _getOrderedRecords(m.Ontology.select())]
+
+    def getOntology(self, id_):
+        return self._getObject("ontology", id_, lambda: self._createOntology(
+            _getRecord(
+                m.Ontology.select().where(m.Ontology.id == id_),
+                exceptions.OntologyNotFoundException(id_))))
+
+    def getOntologyByName(self, name):
+        return self._getOntology(_getRecord(
+            m.Ontology.select().where(m.Ontology.name == name),
+            exceptions.OntologyNameNotFoundException(name)))
@@ -145,6 +145,29 @@ class InvalidJsonException(BadRequestException):
         self.message = "Cannot parse JSON: '{}'".format(jsonString)
 
 
+class BadSearchOptionException(BadRequestException):
+    def __init__(self, optionName, value):
+        self.message = "Search option '{}' has invalid value '{}'".format(
+            optionName, value)
+
+
+class BadBatchGetRequestException(BadRequestException):
+    message = "Batch get requests must provide a list of string 'ids'"
+
+
+class BatchGetTooLargeException(BadRequestException):
+    def __init__(self, maxIds):
+        self.message = (
+            "Batch get requests may list at most {} ids".format(maxIds))
+
+
+class BadExpressionMatrixRequestException(BadRequestException):
+    message = (
+        "Expression matrix requests must provide a string "
+        "'rnaQuantificationSetId', and may provide a list of string "
+        "'featureIds' and a numeric 'threshold'")
+
+
 class Validator(object):
     """
     Check that a JSON dictionary is a valid representation of a protocol
@@ -7,6 +7,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import atexit
 import os
 import datetime
 import socket
@@ -27,15 +28,18 @@ from werkzeug.contrib.cache import FileSystemCache
 
 import ga4gh.server
 import ga4gh.server.backend as backend
+import ga4gh.server.conversion_pool as conversion_pool
 import ga4gh.server.datamodel as datamodel
 import ga4gh.server.exceptions as exceptions
 import ga4gh.server.datarepo as datarepo
 import ga4gh.server.auth as auth
+import ga4gh.server.response_cache as response_cache
 
 import ga4gh.schemas.protocol as protocol
 
 
 MIMETYPE = "application/json"
+BINARY_MIMETYPE = "application/octet-stream"
 SEARCH_ENDPOINT_METHODS = ['POST', 'OPTIONS']
 SECRET_KEY_LENGTH = 24
 
@@ -94,6 +98,13 @@ class ServerStatus(object):
         ]
         return [(k, app.config[k]) for k in keys]
 
+    def getResponseCacheStatistics(self):
+        """
+        Returns the statistics of the response cache, or None if search
+        responses are not cached.
+        """
+        return app.backend.getResponseCacheStatistics()
+
     def getPreciseUptime(self):
         """
         Returns the server precisely.
@@ -248,7 +259,11 @@ def _configure_backend(app):
         dataRepository = datarepo.EmptyDataRepository()
     elif dataSource.scheme == "file":
         path = os.path.join(dataSource.netloc, dataSource.path)
-        dataRepository = datarepo.SqlDataRepository(path)
+        if app.config["LAZY_DATA_REPOSITORY"]:
+            dataRepository = datarepo.LazySqlDataRepository(
+                path, app.config["DATA_REPOSITORY_CACHE_MAX_SIZE"])
+        else:
+            dataRepository = datarepo.SqlDataRepository(path)
         dataRepository.open(datarepo.MODE_READ)
     else:
         raise exceptions.ConfigurationException(
@@ -257,11 +272,48 @@ def _configure_backend(app):
     theBackend.setRequestValidation(app.config["REQUEST_VALIDATION"])
     theBackend.setDefaultPageSize(app.config["DEFAULT_PAGE_SIZE"])
     theBackend.setMaxResponseLength(app.config["MAX_RESPONSE_LENGTH"])
+    theBackend.setMaxBatchGetIds(app.config["BATCH_GET_MAX_IDS"])
+    theBackend.setResultCacheSize(app.config["RESULT_CACHE_MAX_SIZE"])
+    theBackend.setResultCacheTimeToLive(
+        app.config["RESULT_CACHE_TIME_TO_LIVE"])
+    theBackend.setContinuationCacheSize(
+        app.config["CONTINUATION_CACHE_MAX_SIZE"])
+    theBackend.setContinuationCacheTimeToLive(
+        app.config["CONTINUATION_CACHE_TIME_TO_LIVE"])
+    theBackend.setReadAhead(
+        app.config["SEARCH_READ_AHEAD_SIZE"],
+        app.config["SEARCH_READ_AHEAD_THREADS"])
+    theBackend.setDataRepositoryReloadInterval(
+        app.config["DATA_REPOSITORY_RELOAD_INTERVAL"])
+    theBackend.setResponseCache(_configure_response_cache(app))
+    if app.config["CONVERSION_POOL_PROCESSES"] > 0:
+        theBackend.setConversionPool(conversion_pool.ConversionPool(
+            app.config["CONVERSION_POOL_PROCESSES"],
+            app.config["CONVERSION_POOL_PARALLELISM"]))
     return theBackend
 
 
+def _configure_response_cache(app):
+    """
+    Returns the response cache specified by the configuration, or None if
+    responses are not cached.
+    """
+    timeToLive = app.config["RESPONSE_CACHE_TIME_TO_LIVE"]
+    tiers = []
+    if app.config["RESPONSE_CACHE_MAX_BYTES"] > 0:
+        tiers.append(response_cache.MemoryResponseCache(
+            app.config["RESPONSE_CACHE_MAX_BYTES"], timeToLive))
+    if app.config["RESPONSE_CACHE_DIRECTORY"]:
+        tiers.append(response_cache.FileSystemResponseCache(
+            app.config["RESPONSE_CACHE_DIRECTORY"],
+            app.config["RESPONSE_CACHE_DIRECTORY_MAX_BYTES"], timeToLive))
+    if len(tiers) == 0:
+        return None
+    return response_cache.TieredResponseCache(tiers)
+
+
 def configure(configFile=None, baseConfig="ProductionConfig",
-              port=8000, extraConfig={}):
+              port=8000, extraConfig={}, startConversionPool=True):
     """
     TODO Document this critical function! What does it do? What does
     it assume?
@@ -287,6 +339,10 @@ def configure(configFile=None, baseConfig="ProductionConfig",
     app.serverStatus = ServerStatus()
 
     app.backend = _configure_backend(app)
+    if startConversionPool:
+        # Forked servers start the pool in each of their processes instead.
+        app.backend.startConversionPool()
+        atexit.register(app.backend.stopConversionPool)
     if app.config.get('SECRET_KEY'):
         app.secret_key = app.config['SECRET_KEY']
     elif app.config.get('OIDC_PROVIDER'):
@@ -468,6 +524,27 @@ def checkAuthentication():
             return startLogin()
 
 
+@app.before_request
+def checkDataRepository():
+    """
+    Picks up changes made to the data repository since it was loaded, so
+    that the server does not need to be restarted, and pins the current
+    repository for the rest of the request.
+    """
+    if getattr(app, "backend", None) is not None:
+        app.backend.checkDataRepository()
+        app.backend.beginRequest()
+
+
+@app.teardown_request
+def releaseDataRepository(exception=None):
+    """
+    Releases the data repository pinned for the request.
+    """
+    if getattr(app, "backend", None) is not None:
+        app.backend.endRequest()
+
+
 def handleFlaskGetRequest(id_, flaskRequest, endpoint):
     """
     Handles the specified flask request for one of the GET URLs
@@ -626,6 +703,13 @@ def searchCallSets():
         flask.request, app.backend.runSearchCallSets)
 
 
+@DisplayedRoute('/callsets/batchget', postMethod=True)
+@requires_auth
+def batchGetCallSets():
+    return handleFlaskPostRequest(
+        flask.request, app.backend.runBatchGetCallSets)
+
+
 @DisplayedRoute('/readgroupsets/search', postMethod=True)
 def searchReadGroupSets():
     return handleFlaskPostRequest(
@@ -662,6 +746,25 @@ def searchVariants():
         flask.request, app.backend.runSearchVariants)
 
 
+@DisplayedRoute('/variants/batchget', postMethod=True)
+@requires_auth
+def batchGetVariants():
+    return handleFlaskPostRequest(
+        flask.request, app.backend.runBatchGetVariants)
+
+
+@DisplayedRoute('/variants/regions/search', postMethod=True)
+def searchVariantsInRegions():
+    return handleFlaskPostRequest(
+        flask.request, app.backend.runSearchVariantsInRegions)
+
+
+@DisplayedRoute('/variants/summary', postMethod=True)
+def searchVariantSummaries():
+    return handleFlaskPostRequest(
+        flask.request, app.backend.runSearchVariantSummaries)
+
+
 @DisplayedRoute('/variantannotationsets/search', postMethod=True)
 def searchVariantAnnotationSets():
     return handleFlaskPostRequest(
@@ -695,6 +798,13 @@ def searchFeatures():
         flask.request, app.backend.runSearchFeatures)
 
 
+@DisplayedRoute('/features/batchget', postMethod=True)
+@requires_auth
+def batchGetFeatures():
+    return handleFlaskPostRequest(
+        flask.request, app.backend.runBatchGetFeatures)
+
+
 @DisplayedRoute('/biosamples/search', postMethod=True)
 @requires_auth
 def searchBiosamples():
@@ -748,6 +858,21 @@ def searchExpressionLevels():
         flask.request, app.backend.runSearchExpressionLevels)
 
 
+@DisplayedRoute('/expressionlevels/matrix', postMethod=True)
+@requires_auth
+def getExpressionMatrix():
+    # Clients preferring binary output get the float32 matrix as bytes
+    if (flask.request.method == "POST" and
+            flask.request.accept_mimetypes.best == BINARY_MIMETYPE):
+        if flask.request.mimetype != MIMETYPE:
+            raise exceptions.UnsupportedMediaTypeException()
+        responseBytes = app.backend.runGetExpressionMatrix(
+            flask.request.get_data(), binary=True)
+        return flask.Response(responseBytes, mimetype=BINARY_MIMETYPE)
+    return handleFlaskPostRequest(
+        flask.request, app.backend.runGetExpressionMatrix)
+
+
 @DisplayedRoute(
     '/variantsets/<no(search):id>',
     pathDisplay='/variantsets/<id>')
@@ -758,7 +883,7 @@ def getVariantSet(id):
 
 
 @DisplayedRoute(
-    '/variants/<no(search):id>',
+    '/variants/<no(search,summary,batchget):id>',
     pathDisplay='/variants/<id>')
 @requires_auth
 def getVariant(id):
@@ -783,7 +908,7 @@ def getReadGroup(id):
 
 
 @DisplayedRoute(
-    '/callsets/<no(search):id>',
+    '/callsets/<no(search,batchget):id>',
     pathDisplay='/callsets/<id>')
 @requires_auth
 def getCallSet(id):
@@ -801,7 +926,7 @@ def getFeatureSet(id):
 
 
 @DisplayedRoute(
-    '/features/<no(search):id>',
+    '/features/<no(search,batchget):id>',
     pathDisplay='/features/<id>')
 @requires_auth
 def getFeature(id):
@@ -828,7 +953,7 @@ def getRnaQuantification(id):
 
 
 @DisplayedRoute(
-    '/expressionlevels/<no(search):id>',
+    '/expressionlevels/<no(search,matrix):id>',
     pathDisplay='/expressionlevels/<id>')
 @requires_auth
 def getExpressionLevel(id):
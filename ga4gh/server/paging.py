@@ -6,6 +6,10 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import collections
+import Queue
+import threading
+import time
 
 import ga4gh.server.exceptions as exceptions
 
@@ -30,6 +34,257 @@ def _parsePageToken(pageToken, numValues):
     return values
 
 
+class ResultCache(object):
+    """
+    Cache of the ordered results of searches, so that successive pages of
+    a search are slices of the same list rather than new searches. Results
+    are evicted when they are older than the time to live, in seconds, or
+    when the cache is full, least recently used first.
+    """
+    def __init__(self, maxSize=100, timeToLive=300):
+        self._maxSize = maxSize
+        self._timeToLive = timeToLive
+        # Results in order of use, and the times they were searched for
+        # in order of search, as using results does not extend their life.
+        self._entries = collections.OrderedDict()
+        self._timestamps = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def setMaxSize(self, maxSize):
+        """
+        Sets the maximum number of results held in the cache. A size of
+        zero disables caching.
+        """
+        if maxSize < 0:
+            raise ValueError("The size of the cache must not be negative")
+        with self._lock:
+            self._maxSize = maxSize
+            self._evict(time.time())
+
+    def setTimeToLive(self, timeToLive):
+        """
+        Sets the number of seconds for which results are kept.
+        """
+        self._timeToLive = timeToLive
+
+    def clear(self):
+        """
+        Removes all results from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._timestamps.clear()
+
+    def _evict(self, now):
+        while len(self._entries) > self._maxSize:
+            key, _ = self._entries.popitem(last=False)
+            del self._timestamps[key]
+        for key, timestamp in self._timestamps.items():
+            if now - timestamp <= self._timeToLive:
+                break
+            del self._timestamps[key]
+            del self._entries[key]
+
+    def getResults(self, key, searchMethod):
+        """
+        Returns the list of results for the specified key, calling the
+        specified method to search for them if they are not in the cache.
+        The list is shared between callers and must not be modified.
+        """
+        now = time.time()
+        with self._lock:
+            timestamp = self._timestamps.get(key)
+            if timestamp is not None and now - timestamp <= self._timeToLive:
+                results = self._entries.pop(key)
+                self._entries[key] = results
+                return results
+        results = searchMethod()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._timestamps.pop(key, None)
+            self._entries[key] = results
+            self._timestamps[key] = now
+            self._evict(now)
+        return results
+
+
+class ContinuationCache(object):
+    """
+    Cache of the live iterators of searches, each held under the page
+    token it last returned, so that the search for the next page resumes
+    it rather than starting again from the token. Iterators are removed
+    from the cache when they are resumed, and are evicted when they are
+    older than the time to live, in seconds, or when the cache is full,
+    least recently used first.
+    """
+    def __init__(self, maxSize=0, timeToLive=60):
+        self._maxSize = maxSize
+        self._timeToLive = timeToLive
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def setMaxSize(self, maxSize):
+        """
+        Sets the maximum number of iterators held in the cache. A size of
+        zero disables the cache.
+        """
+        if maxSize < 0:
+            raise ValueError("The size of the cache must not be negative")
+        with self._lock:
+            self._maxSize = maxSize
+            self._evict(time.time())
+
+    def setTimeToLive(self, timeToLive):
+        """
+        Sets the number of seconds for which iterators are kept.
+        """
+        self._timeToLive = timeToLive
+
+    def isEnabled(self):
+        """
+        Returns True if iterators are kept in the cache.
+        """
+        return self._maxSize > 0
+
+    def clear(self):
+        """
+        Removes all iterators from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self, now):
+        while len(self._entries) > self._maxSize:
+            self._entries.popitem(last=False)
+        for key, (timestamp, _) in self._entries.items():
+            if now - timestamp <= self._timeToLive:
+                break
+            del self._entries[key]
+
+    def put(self, key, continuation):
+        """
+        Holds the specified continuation under the specified key.
+        """
+        now = time.time()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (now, continuation)
+            self._evict(now)
+
+    def take(self, key):
+        """
+        Removes the continuation held under the specified key from the
+        cache and returns it, or returns None if there is none.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None or time.time() - entry[0] > self._timeToLive:
+            return None
+        return entry[1]
+
+
+class ReadAheadIterator(object):
+    """
+    Iterator over the values of another iterator, which while started
+    reads up to maxSize values ahead in a background thread, so that the
+    values are decoded and converted while the earlier ones are used.
+    Values which have been read ahead when the iterator is stopped are
+    kept, so that it can be resumed later, with or without reading ahead.
+    """
+    _VALUE = 0
+    _END = 1
+    _ERROR = 2
+
+    def __init__(self, iterator, maxSize):
+        self._iterator = iterator
+        self._maxSize = maxSize
+        self._buffer = collections.deque()
+        self._finished = False
+        self._queue = None
+        self._thread = None
+        self._stopping = False
+        self._pendingItem = None
+
+    def __iter__(self):
+        return self
+
+    def start(self):
+        """
+        Starts reading values ahead in a background thread.
+        """
+        if self._thread is not None or self._finished:
+            return
+        self._queue = Queue.Queue(self._maxSize)
+        self._stopping = False
+        self._thread = threading.Thread(target=self._readAhead)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops reading values ahead, waiting for the value being read to
+        be finished, and keeps the values which have not been returned.
+        """
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._thread.join()
+        self._thread = None
+        while not self._queue.empty():
+            self._buffer.append(self._queue.get())
+        if self._pendingItem is not None:
+            self._buffer.append(self._pendingItem)
+            self._pendingItem = None
+
+    def _readAhead(self):
+        try:
+            for value in self._iterator:
+                if not self._put((self._VALUE, value)):
+                    return
+            self._put((self._END, None))
+        except Exception as exception:
+            self._put((self._ERROR, exception))
+
+    def _put(self, item):
+        """
+        Puts the specified item in the queue, waiting for space unless
+        the iterator is stopped, in which case the item is kept for
+        stop() and False is returned.
+        """
+        while not self._stopping:
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        self._pendingItem = item
+        return False
+
+    def next(self):
+        if len(self._buffer) > 0:
+            item = self._buffer.popleft()
+        elif self._thread is not None:
+            item = self._queue.get()
+            if item[0] != self._VALUE:
+                self._thread.join()
+                self._thread = None
+        elif self._finished:
+            raise StopIteration()
+        else:
+            try:
+                return next(self._iterator)
+            except StopIteration:
+                self._finished = True
+                raise
+        kind, value = item
+        if kind == self._VALUE:
+            return value
+        self._finished = True
+        if kind == self._END:
+            raise StopIteration()
+        raise value
+
+
 def _parseIntegerArgument(args, key, defaultValue):
     """
     Attempts to parse the specified key in the specified argument
@@ -204,22 +459,151 @@ class VariantsIntervalIterator(IntervalIterator):
         return variant.end
 
 
+class VariantSummariesIntervalIterator(IntervalIterator):
+    """
+    An interval iterator for the allele and genotype summaries of variants,
+    over the calls of the requested call sets, or of all call sets if
+    none are requested.
+    """
+    def _search(self, start, end):
+        return self._parentContainer.getVariantSummaries(
+            self._request.reference_name, start, end,
+            list(self._request.call_set_ids) or None)
+
+    @classmethod
+    def _getStart(cls, summary):
+        return summary["start"]
+
+    @classmethod
+    def _getEnd(cls, summary):
+        return summary["end"]
+
+
+class VariantRegionsIterator(object):
+    """
+    Returns an iterator over the (variant, nextPageToken) pairs of the
+    variants overlapping a sorted list of disjoint (referenceName, start,
+    end) regions, in that order. Variants overlapping several regions are
+    only returned for the first. Page tokens hold the index of a region,
+    the start of the next variant in it, and the number of variants of
+    the region starting there which have already been returned.
+    """
+    def __init__(self, request, variantSet, regions):
+        self._regions = regions
+        self._regionIndex = 0
+        self._searchAnchor = None
+        self._distanceFromAnchor = 0
+        if request.page_token:
+            (self._regionIndex, self._searchAnchor,
+             self._distanceFromAnchor) = _parsePageToken(
+                request.page_token, 3)
+            if not 0 <= self._regionIndex < len(regions):
+                raise exceptions.BadPageTokenException()
+        ranges = []
+        for index in range(self._regionIndex, len(regions)):
+            referenceName, start, end = regions[index]
+            minStart = None
+            if index > 0 and regions[index - 1][0] == referenceName:
+                minStart = regions[index - 1][2]
+            if index == self._regionIndex and (
+                    self._searchAnchor is not None):
+                start = max(start, self._searchAnchor)
+                minStart = self._searchAnchor
+            ranges.append((referenceName, start, end, minStart))
+        self._searchIterator = self._generateVariants(
+            variantSet.getVariantsInRanges(ranges, request.call_set_ids))
+        self._nextVariant = next(self._searchIterator, None)
+
+    def _generateVariants(self, variantIterators):
+        """
+        Yields the (regionIndex, variant) pairs of the variants of each
+        region, skipping those returned before the page token.
+        """
+        objectsToSkip = self._distanceFromAnchor
+        for regionIndex, variants in enumerate(
+                variantIterators, self._regionIndex):
+            for variant in variants:
+                if objectsToSkip > 0:
+                    if variant.start != self._searchAnchor:
+                        raise exceptions.BadPageTokenException()
+                    objectsToSkip -= 1
+                    continue
+                yield regionIndex, variant
+
+    def next(self):
+        """
+        Returns the next (variant, nextPageToken) pair.
+        """
+        if self._nextVariant is None:
+            raise StopIteration()
+        regionIndex, variant = self._nextVariant
+        if (regionIndex, variant.start) == (
+                self._regionIndex, self._searchAnchor):
+            self._distanceFromAnchor += 1
+        else:
+            self._regionIndex = regionIndex
+            self._searchAnchor = variant.start
+            self._distanceFromAnchor = 1
+        self._nextVariant = next(self._searchIterator, None)
+        nextPageToken = None
+        if self._nextVariant is not None:
+            nextRegionIndex, nextVariant = self._nextVariant
+            distance = 0
+            if (nextRegionIndex, nextVariant.start) == (
+                    self._regionIndex, self._searchAnchor):
+                distance = self._distanceFromAnchor
+            nextPageToken = "{}:{}:{}".format(
+                nextRegionIndex, nextVariant.start, distance)
+        return variant, nextPageToken
+
+    def __iter__(self):
+        return self
+
+
 class VariantAnnotationsIntervalIterator(IntervalIterator):
     """
     An interval iterator for annotations
     """
-    def __init__(self, request, parentContainer):
-        super(VariantAnnotationsIntervalIterator, self).__init__(
-            request, parentContainer)
+    def __init__(
+            self, request, parentContainer, includeDescendants=False,
+            featureIds=None):
+        # The effect filters are set up first, as the superclass starts
+        # the search.
         # TODO do input validation somewhere more sensible
-        if self._request.effects is None:
+        if request.effects is None:
             self._effects = []
         else:
-            self._effects = self._request.effects
+            self._effects = request.effects
+        self._effectIds = set(
+            effect.term_id for effect in self._effects if effect.term_id)
+        # Effects which are descendants of the requested effects are
+        # matched by testing the bitsets of their is_a ancestors against
+        # the bitset of the requested effects.
+        self._ontology = None
+        if includeDescendants:
+            self._ontology = parentContainer.getOntology()
+        if self._ontology is not None:
+            self._effectMask = self._ontology.getTermMask(self._effectIds)
+        # The requested effects are translated into the term names used in
+        # the data once, so that records without any of them are skipped
+        # before they are converted.
+        self._effectNames = None
+        ontology = parentContainer.getOntology()
+        if len(self._effects) != 0 and ontology is not None:
+            self._effectNames = ontology.getTermNames(
+                self._effectIds, includeDescendants)
+        # Annotations are filtered by transcript or gene ID in the
+        # container, as the gene IDs are only held in the raw records.
+        self._featureIds = None
+        if featureIds:
+            self._featureIds = set(featureIds)
+        super(VariantAnnotationsIntervalIterator, self).__init__(
+            request, parentContainer)
 
     def _search(self, start, end):
         return self._parentContainer.getVariantAnnotations(
-            self._request.reference_name, start, end)
+            self._request.reference_name, start, end, self._effectNames,
+            self._featureIds)
 
     def _extractProtocolObject(self, pair):
         variant, annotation = pair
@@ -247,7 +631,6 @@ class VariantAnnotationsIntervalIterator(IntervalIterator):
         """
         Returns true when an annotation should be included.
         """
-        # TODO reintroduce feature ID search
         ret = False
         if len(self._effects) != 0 and not vann.transcript_effects:
             return False
@@ -268,22 +651,12 @@ class VariantAnnotationsIntervalIterator(IntervalIterator):
             ret = self._matchAnyEffects(effect) or ret
         return ret
 
-    def _checkIdEquality(self, requestedEffect, effect):
-        """
-        Tests whether a requested effect and an effect
-        present in an annotation are equal.
-        """
-        return self._idPresent(requestedEffect) and (
-            effect.term_id == requestedEffect.term_id)
-
-    def _idPresent(self, requestedEffect):
-        return requestedEffect.term_id != ""
-
     def _matchAnyEffects(self, effect):
-        ret = False
-        for requestedEffect in self._effects:
-            ret = self._checkIdEquality(requestedEffect, effect) or ret
-        return ret
+        if self._ontology is not None:
+            return (
+                self._ontology.getAncestorMask(effect.term_id) &
+                self._effectMask) != 0
+        return effect.term_id in self._effectIds
 
     def _removeNonMatchingTranscriptEffects(self, ann):
         newTxE = []
@@ -391,9 +764,12 @@ class FeaturesIterator(SequenceIterator):
     """
     Iterates through features
     """
-    def __init__(self, request, featureSet, parentId):
+    def __init__(self, request, featureSet, parentId,
+                 includeDescendants=False, namePrefix=None):
         self._featureSet = featureSet
         self._parentId = parentId
+        self._includeDescendants = includeDescendants
+        self._namePrefix = namePrefix
         super(FeaturesIterator, self).__init__(request)
 
     def _initialize(self):
@@ -415,7 +791,9 @@ class FeaturesIterator(SequenceIterator):
             self._request.feature_types,
             self._parentId,
             self._request.name,
-            self._request.gene_symbol))
+            self._request.gene_symbol,
+            includeDescendants=self._includeDescendants,
+            namePrefix=self._namePrefix))
         return iterator
 
     def _prepare(self, obj):
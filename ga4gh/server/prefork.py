@@ -0,0 +1,268 @@
+"""
+A pre-forking WSGI server for running the GA4GH server in production.
+
+The master process binds the listening socket and then forks the workers,
+which accept connections on it and handle each request in a thread. The
+application is configured in the master before forking, so the data
+repository and ontologies are loaded once and shared copy-on-write by
+the workers. The master replaces workers which exit, restarts them all
+gracefully on SIGHUP and stops them gracefully on SIGTERM or SIGINT.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import logging
+import os
+import signal
+import threading
+import time
+
+import werkzeug.serving as serving
+
+
+# How often the master and workers check for signals and exited children
+POLL_INTERVAL = 0.5
+
+
+class WorkerServer(serving.ThreadedWSGIServer):
+    """
+    The WSGI server of a worker process, which accepts connections on the
+    socket inherited from the master. It handles at most maxThreads
+    requests at a time and, if maxRequests is not zero, stops accepting
+    connections after maxRequests requests.
+    """
+    daemon_threads = True
+
+    def __init__(
+            self, host, app, fd, maxThreads=1, maxRequests=0,
+            sslContext=None):
+        self._maxThreads = maxThreads
+        self._maxRequests = maxRequests
+        self._numRequests = 0
+        self._activeRequests = 0
+        self._condition = threading.Condition()
+        self._stopping = False
+        super(WorkerServer, self).__init__(
+            host, 0, app, ssl_context=sslContext, fd=fd)
+        self.timeout = POLL_INTERVAL
+
+    def stop(self):
+        """
+        Stops accepting connections, letting the requests in progress
+        finish.
+        """
+        self._stopping = True
+
+    def process_request(self, request, clientAddress):
+        with self._condition:
+            while self._activeRequests >= self._maxThreads:
+                self._condition.wait(POLL_INTERVAL)
+            self._activeRequests += 1
+        self._numRequests += 1
+        if self._maxRequests and self._numRequests >= self._maxRequests:
+            self.stop()
+        super(WorkerServer, self).process_request(request, clientAddress)
+
+    def process_request_thread(self, request, clientAddress):
+        try:
+            super(WorkerServer, self).process_request_thread(
+                request, clientAddress)
+        finally:
+            with self._condition:
+                self._activeRequests -= 1
+                self._condition.notify_all()
+
+    def serveUntilStopped(self, gracefulTimeout):
+        """
+        Handles requests until the server is stopped, and then waits for
+        up to gracefulTimeout seconds for the requests in progress to
+        finish.
+        """
+        while not self._stopping:
+            self.handle_request()
+        deadline = time.time() + gracefulTimeout
+        with self._condition:
+            while self._activeRequests > 0 and time.time() < deadline:
+                self._condition.wait(POLL_INTERVAL)
+
+
+class PreforkServer(object):
+    """
+    A master process managing a pool of forked worker processes serving
+    the specified WSGI application. If given, workerStart is called in
+    each worker before it serves any requests, and workerStop after it
+    has stopped.
+    """
+    def __init__(
+            self, app, host="127.0.0.1", port=8000, workers=2, threads=1,
+            maxRequests=0, gracefulTimeout=30, sslContext=None,
+            workerStart=None, workerStop=None):
+        if workers < 1:
+            raise ValueError("There must be at least one worker")
+        if threads < 1:
+            raise ValueError("Workers must have at least one thread")
+        if maxRequests < 0:
+            raise ValueError("The request limit must not be negative")
+        self._app = app
+        self._host = host
+        self._port = port
+        self._numWorkers = workers
+        self._threads = threads
+        self._maxRequests = maxRequests
+        self._gracefulTimeout = gracefulTimeout
+        self._sslContext = sslContext
+        self._workerStart = workerStart
+        self._workerStop = workerStop
+        self._workers = set()
+        self._stopping = False
+        self._restarting = False
+        self._listener = None
+        self._log = logging.getLogger(__name__)
+
+    def getWorkerPids(self):
+        """
+        Returns the list of the process IDs of the running workers.
+        """
+        return list(self._workers)
+
+    def serveForever(self):
+        """
+        Binds the listening socket and manages the workers until the
+        master receives SIGTERM or SIGINT.
+        """
+        # Bind the socket once in the master, so that all the workers
+        # accept connections on the same socket.
+        self._listener = serving.BaseWSGIServer(
+            self._host, self._port, self._app)
+        if self._sslContext == "adhoc":
+            # All the workers must present the same certificate.
+            self._sslContext = serving.generate_adhoc_ssl_context()
+        signal.signal(signal.SIGTERM, self._handleStop)
+        signal.signal(signal.SIGINT, self._handleStop)
+        signal.signal(signal.SIGHUP, self._handleRestart)
+        self._log.info(
+            "Serving on %s:%d with %d workers",
+            self._host, self._listener.server_address[1], self._numWorkers)
+        try:
+            while not self._stopping:
+                if self._restarting:
+                    self._restarting = False
+                    self._restartWorkers()
+                while len(self._workers) < self._numWorkers:
+                    self._spawnWorker()
+                self._reapWorkers()
+                time.sleep(POLL_INTERVAL)
+        finally:
+            self._stopWorkers(self._workers)
+            self._listener.server_close()
+
+    def _handleStop(self, signum, frame):
+        self._stopping = True
+
+    def _handleRestart(self, signum, frame):
+        self._restarting = True
+
+    def _spawnWorker(self):
+        pid = os.fork()
+        if pid != 0:
+            self._workers.add(pid)
+            return
+        # In the worker
+        exitCode = 0
+        try:
+            self._runWorker()
+        except Exception:
+            self._log.exception("Worker %d failed", os.getpid())
+            exitCode = 1
+        finally:
+            os._exit(exitCode)
+
+    def _runWorker(self):
+        if self._workerStart is not None:
+            self._workerStart()
+        try:
+            self._serveWorker()
+        finally:
+            if self._workerStop is not None:
+                self._workerStop()
+
+    def _serveWorker(self):
+        server = WorkerServer(
+            self._host, self._app, self._listener.fileno(),
+            maxThreads=self._threads, maxRequests=self._maxRequests,
+            sslContext=self._sslContext)
+
+        def handleStop(signum, frame):
+            server.stop()
+        signal.signal(signal.SIGTERM, handleStop)
+        signal.signal(signal.SIGINT, handleStop)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        server.serveUntilStopped(self._gracefulTimeout)
+
+    def _reapWorkers(self):
+        """
+        Forgets the workers which have exited, so that they are replaced.
+        """
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as error:
+                if error.errno == errno.EINTR:
+                    continue
+                if error.errno == errno.ECHILD:
+                    return
+                raise
+            if pid == 0:
+                return
+            if pid in self._workers and status != 0:
+                self._log.warning(
+                    "Worker %d exited with status %d", pid, status)
+            self._workers.discard(pid)
+
+    def _restartWorkers(self):
+        """
+        Replaces all the workers, starting the new workers before the old
+        ones are stopped so that connections are always accepted.
+        """
+        oldPids = self._workers
+        self._workers = set()
+        for _ in range(self._numWorkers):
+            self._spawnWorker()
+        self._stopWorkers(oldPids)
+
+    def _stopWorkers(self, pids):
+        """
+        Asks the specified workers to stop, and kills those which are
+        still running after the graceful timeout.
+        """
+        pids = set(pids)
+        for pid in pids:
+            self._signalWorker(pid, signal.SIGTERM)
+        deadline = time.time() + self._gracefulTimeout + POLL_INTERVAL
+        while pids and time.time() < deadline:
+            for pid in list(pids):
+                try:
+                    exited, _ = os.waitpid(pid, os.WNOHANG)
+                except OSError:
+                    exited = pid
+                if exited != 0:
+                    pids.discard(pid)
+                    self._workers.discard(pid)
+            time.sleep(POLL_INTERVAL / 10)
+        for pid in pids:
+            self._log.warning("Killing worker %d", pid)
+            self._signalWorker(pid, signal.SIGKILL)
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+            self._workers.discard(pid)
+
+    def _signalWorker(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError as error:
+            if error.errno != errno.ESRCH:
+                raise
@@ -2,9 +2,9 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import sqlite3
 import csv
-import uuid
+import multiprocessing
+import sqlite3
 
 import ga4gh.server.exceptions as exceptions
 
@@ -15,7 +15,8 @@ SUPPORTED_RNA_INPUT_FORMATS = ["cufflinks", "kallisto", "rsem"]
 class RnaSqliteStore(object):
     """
     Defines a sqlite store for RNA data as well as methods for loading the
-    tables.
+    tables. Rows are inserted in batches within a single transaction, which
+    is only committed by commit() or createIndexes().
     """
     def __init__(self, sqliteFileName):
         self._dbConn = sqlite3.connect(sqliteFileName)
@@ -34,8 +35,9 @@ class RnaSqliteStore(object):
                        read_group_ids TEXT,
                        programs TEXT,
                        biosample_id TEXT)''')
+        # id is an alias for the rowid, assigned by SQLite on insert
         self._cursor.execute('''CREATE TABLE Expression (
-                       id TEXT NOT NULL PRIMARY KEY,
+                       id INTEGER PRIMARY KEY,
                        rna_quantification_id TEXT,
                        name TEXT,
                        feature_id TEXT,
@@ -48,6 +50,57 @@ class RnaSqliteStore(object):
                        conf_hi REAL)''')
         self._dbConn.commit()
 
+    def createIndexes(self):
+        """
+        Creates the indexes used by expression level searches, if they do
+        not already exist. These are best created once the expression data
+        has been loaded, as maintaining them slows down every insert.
+        """
+        self._cursor.execute('''CREATE INDEX IF NOT EXISTS
+                       expression_quantification_feature
+                       ON Expression (rna_quantification_id, feature_id)''')
+        self._cursor.execute('''CREATE INDEX IF NOT EXISTS
+                       expression_quantification_expression
+                       ON Expression (rna_quantification_id, expression)''')
+        # Gather statistics so that the query planner can choose between
+        # the indexes for feature ID and threshold searches.
+        self._cursor.execute("ANALYZE Expression")
+        self._dbConn.commit()
+
+    def dropIndexes(self):
+        """
+        Drops the expression level search indexes, so that a bulk load
+        does not have to maintain them on every insert.
+        """
+        self._cursor.execute(
+            "DROP INDEX IF EXISTS expression_quantification_feature")
+        self._cursor.execute(
+            "DROP INDEX IF EXISTS expression_quantification_expression")
+        self._dbConn.commit()
+
+    def commit(self):
+        """
+        Writes any pending rows and commits the current transaction.
+        """
+        self.batchaddRNAQuantification()
+        self.batchAddExpression()
+        self._dbConn.commit()
+
+    def rollback(self):
+        """
+        Discards any pending rows and rolls back the current transaction.
+        """
+        self._rnaValueList = []
+        self._expressionValueList = []
+        self._dbConn.rollback()
+
+    def hasExpressions(self):
+        """
+        Returns True if the Expression table holds any rows.
+        """
+        self._cursor.execute("SELECT 1 FROM Expression LIMIT 1")
+        return self._cursor.fetchone() is not None
+
     def addRNAQuantification(self, datafields):
         """
         Adds an RNAQuantification to the db.  Datafields is a tuple in the
@@ -63,7 +116,6 @@ class RnaSqliteStore(object):
         if len(self._rnaValueList) > 0:
             sql = "INSERT INTO RnaQuantification VALUES (?,?,?,?,?,?,?)"
             self._cursor.executemany(sql, self._rnaValueList)
-            self._dbConn.commit()
             self._rnaValueList = []
 
     def addExpression(self, datafields):
@@ -71,6 +123,7 @@ class RnaSqliteStore(object):
         Adds an Expression to the db.  Datafields is a tuple in the order:
         id, rna_quantification_id, name, feature_id, expression,
         is_normalized, raw_read_count, score, units, conf_low, conf_hi
+        where an id of None has SQLite assign the next integer id.
         """
         self._expressionValueList.append(datafields)
         if len(self._expressionValueList) >= self._batchSize:
@@ -80,10 +133,58 @@ class RnaSqliteStore(object):
         if len(self._expressionValueList) > 0:
             sql = "INSERT INTO Expression VALUES (?,?,?,?,?,?,?,?,?,?,?)"
             self._cursor.executemany(sql, self._expressionValueList)
-            self._dbConn.commit()
             self._expressionValueList = []
 
 
+def readQuantificationFile(columns, quantFilename):
+    """
+    Reads the specified tab separated quantification results file, and
+    returns a list of (name, featureName, expression, rawCount, score,
+    confidenceLow, confidenceHi) tuples. The columns are a tuple of the
+    expression, name, feature, count, low and high confidence column
+    names, where the last three may be None or missing from the file.
+    """
+    (expressionLevelCol, nameCol, featureCol, countCol, confColLow,
+     confColHi) = columns
+    rows = []
+    with open(quantFilename, "r") as quantFile:
+        quantificationReader = csv.reader(quantFile, delimiter=b"\t")
+        header = next(quantificationReader)
+        # Resolve the column positions once rather than looking up
+        # every field by name on every row.
+        indexes = dict((column, index) for index, column in enumerate(header))
+        expressionIndex = indexes[expressionLevelCol]
+        nameIndex = indexes[nameCol]
+        featureIndex = indexes[featureCol]
+        countIndex = indexes.get(countCol)
+        confIndexLow = indexes.get(confColLow)
+        confIndexHi = indexes.get(confColHi)
+        hasConfidence = confIndexLow is not None and confIndexHi is not None
+        for expression in quantificationReader:
+            rawCount = 0.0
+            if countIndex is not None:
+                rawCount = expression[countIndex]
+            confidenceLow = 0.0
+            confidenceHi = 0.0
+            score = 0.0
+            if hasConfidence:
+                confidenceLow = float(expression[confIndexLow])
+                confidenceHi = float(expression[confIndexHi])
+                score = (confidenceLow + confidenceHi)/2
+            rows.append((
+                expression[nameIndex], expression[featureIndex],
+                expression[expressionIndex], rawCount, score,
+                confidenceLow, confidenceHi))
+    return rows
+
+
+def _readQuantificationFile(args):
+    """
+    Unpacks the arguments of readQuantificationFile for Pool.imap.
+    """
+    return readQuantificationFile(*args)
+
+
 class AbstractWriter(object):
     """
     Base class to use for the rna quantification writers
@@ -102,6 +203,7 @@ class AbstractWriter(object):
         self._dataRepo = None
         self._dataset = dataset
         self._featureType = featureType
+        self._featureIds = {}
 
     def setUnits(self, units):
         if units == "fpkm":
@@ -109,55 +211,72 @@ class AbstractWriter(object):
         elif units == "tpm":
             self._units = 2
 
-    def writeExpression(self, rnaQuantificationId, quantfilename,
-                        featureSetNames=None):
+    def getColumns(self):
         """
-        Reads the quantification results file and adds entries to the
-        specified database.
+        Returns the columns read from quantification files by this writer,
+        in the order expected by readQuantificationFile.
         """
-        isNormalized = self._isNormalized
-        units = self._units
+        return (
+            self._expressionLevelCol, self._nameCol, self._featureCol,
+            self._countCol, self._confColLow, self._confColHi)
+
+    def _getFeatureSets(self, featureSetNames):
         featureSets = None
         if self._dataset and featureSetNames:
             featureSets = []
             for annotationName in featureSetNames.split(","):
                 featureSets.append(
                     self._dataset.getFeatureSetByName(annotationName))
-        with open(quantfilename, "r") as quantFile:
-            quantificationReader = csv.DictReader(quantFile, delimiter=b"\t")
-            for expression in quantificationReader:
-                expressionLevel = expression[self._expressionLevelCol]
-                expressionId = str(uuid.uuid4())
-                name = expression[self._nameCol]
-                rawCount = 0.0
-                if self._countCol in expression.keys():
-                    rawCount = expression[self._countCol]
-                confidenceLow = 0.0
-                confidenceHi = 0.0
-                score = 0.0
-                if (self._confColLow in expression.keys() and
-                        self._confColHi in expression.keys()):
-                    confidenceLow = float(expression[self._confColLow])
-                    confidenceHi = float(expression[self._confColHi])
-                    score = (confidenceLow + confidenceHi)/2
-
-                featureName = expression[self._featureCol]
-                featureId = ""
-                if featureSets is not None:
-                    for featureSet in featureSets:
-                        if featureId == "":
-                            for feature in featureSet.getFeatures(
-                                    name=featureName):
-                                featureId = feature.id
-                                break
-                        else:
-                            break
-                datafields = (expressionId, rnaQuantificationId, name,
-                              featureId, expressionLevel, isNormalized,
-                              rawCount, score, units, confidenceLow,
-                              confidenceHi)
-                self._db.addExpression(datafields)
-            self._db.batchAddExpression()
+        return featureSets
+
+    def _getFeatureId(self, featureSets, featureName):
+        """
+        Returns the ID of the first feature with the specified name in
+        the specified feature sets, or "" if there is none. Lookups are
+        cached, as the same features recur across quantifications.
+        """
+        if featureSets is None:
+            return ""
+        if featureName not in self._featureIds:
+            featureId = ""
+            for featureSet in featureSets:
+                for feature in featureSet.getFeatures(name=featureName):
+                    featureId = feature.id
+                    break
+                if featureId != "":
+                    break
+            self._featureIds[featureName] = featureId
+        return self._featureIds[featureName]
+
+    def writeExpressionRows(self, rnaQuantificationId, rows,
+                            featureSetNames=None):
+        """
+        Adds the rows returned by readQuantificationFile to the database,
+        as expression levels of the specified rna quantification.
+        """
+        isNormalized = self._isNormalized
+        units = self._units
+        featureSets = self._getFeatureSets(featureSetNames)
+        for (name, featureName, expressionLevel, rawCount, score,
+                confidenceLow, confidenceHi) in rows:
+            expressionId = None
+            featureId = self._getFeatureId(featureSets, featureName)
+            datafields = (expressionId, rnaQuantificationId, name,
+                          featureId, expressionLevel, isNormalized,
+                          rawCount, score, units, confidenceLow,
+                          confidenceHi)
+            self._db.addExpression(datafields)
+
+    def writeExpression(self, rnaQuantificationId, quantfilename,
+                        featureSetNames=None):
+        """
+        Reads the quantification results file and adds entries to the
+        specified database.
+        """
+        rows = readQuantificationFile(self.getColumns(), quantfilename)
+        self.writeExpressionRows(
+            rnaQuantificationId, rows, featureSetNames=featureSetNames)
+        self._db.batchAddExpression()
 
 
 class CufflinksWriter(AbstractWriter):
@@ -250,10 +369,28 @@ def writeRnaseqTable(rnaDB, analysisIds, description, annotationId,
     rnaDB.batchaddRNAQuantification()
 
 
-def writeExpressionTable(writer, data, featureSetNames=None):
-    for rnaQuantId, quantfilename in data:
-        writer.writeExpression(
-            rnaQuantId, quantfilename, featureSetNames=featureSetNames)
+def writeExpressionTable(writer, data, featureSetNames=None, workers=1):
+    """
+    Adds the expression levels in the specified list of (rnaQuantId,
+    quantfilename) pairs. The files are parsed by a pool of the specified
+    number of worker processes, while this process writes their rows to
+    the database in order.
+    """
+    tasks = [(writer.getColumns(), quantfilename) for _, quantfilename in data]
+    pool = None
+    if workers > 1 and len(data) > 1:
+        pool = multiprocessing.Pool(min(workers, len(data)))
+        results = pool.imap(_readQuantificationFile, tasks)
+    else:
+        results = (_readQuantificationFile(task) for task in tasks)
+    try:
+        for (rnaQuantId, _), rows in zip(data, results):
+            writer.writeExpressionRows(
+                rnaQuantId, rows, featureSetNames=featureSetNames)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
 
 
 def rnaseq2ga(quantificationFilename, sqlFilename, localName, rnaType,
@@ -266,6 +403,25 @@ def rnaseq2ga(quantificationFilename, sqlFilename, localName, rnaType,
     Supports the following quantification output types:
     Cufflinks, kallisto, RSEM
     """
+    batchRnaseq2ga(
+        [(localName, quantificationFilename)], sqlFilename, rnaType,
+        dataset=dataset, featureType=featureType, description=description,
+        programs=programs, featureSetNames=featureSetNames,
+        readGroupSetNames=readGroupSetNames, biosampleId=biosampleId)
+
+
+def batchRnaseq2ga(quantifications, sqlFilename, rnaType, dataset=None,
+                   featureType="gene", description="", programs="",
+                   featureSetNames="", readGroupSetNames="", biosampleId="",
+                   workers=1):
+    """
+    Stores the RNA Quantification data in the specified list of
+    (localName, quantificationFilename) pairs in a sqlite database, as
+    rnaseq2ga does for a single file. The files are parsed by the
+    specified number of worker processes and loaded in one transaction.
+    If the store holds no expression levels yet, the search indexes are
+    built once all the rows are in.
+    """
     readGroupSetName = ""
     if readGroupSetNames:
         readGroupSetName = readGroupSetNames.strip().split(",")[0]
@@ -292,10 +448,24 @@ def rnaseq2ga(quantificationFilename, sqlFilename, localName, rnaType,
         writer = KallistoWriter(rnaDB, featureType, dataset=dataset)
     elif rnaType == "rsem":
         writer = RsemWriter(rnaDB, featureType, dataset=dataset)
-    writeRnaseqTable(rnaDB, [localName], description,
-                     featureSetIds,
-                     readGroupId=readGroupIds, programs=programs,
-                     biosampleId=biosampleId)
-    writeExpressionTable(
-        writer, [(localName, quantificationFilename)],
-        featureSetNames=featureSetNames)
+    # Building the indexes after the load is only cheaper than maintaining
+    # them when the load makes up the whole table. They are rebuilt even if
+    # the load fails, so that searches of the store never lose them.
+    deferIndexes = not rnaDB.hasExpressions()
+    if deferIndexes:
+        rnaDB.dropIndexes()
+    try:
+        writeRnaseqTable(
+            rnaDB, [localName for localName, _ in quantifications],
+            description, featureSetIds, readGroupId=readGroupIds,
+            programs=programs, biosampleId=biosampleId)
+        writeExpressionTable(
+            writer, quantifications, featureSetNames=featureSetNames,
+            workers=workers)
+        rnaDB.commit()
+    except Exception:
+        rnaDB.rollback()
+        raise
+    finally:
+        if deferIndexes:
+            rnaDB.createIndexes()
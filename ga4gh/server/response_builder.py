@@ -5,10 +5,26 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
+
 import ga4gh.schemas.pb as pb
 import ga4gh.schemas.protocol as protocol
 
 
+class ConvertedValue(object):
+    """
+    A protocol object which has already been converted into the dictionary
+    from which its JSON representation is made, along with the length of
+    its serialised protobuf.
+    """
+    def __init__(self, jsonDict, byteSize):
+        self.jsonDict = jsonDict
+        self.byteSize = byteSize
+
+    def ByteSize(self):
+        return self.byteSize
+
+
 class SearchResponseBuilder(object):
     """
     A class to allow sequential building of SearchResponse objects.
@@ -29,6 +45,8 @@ class SearchResponseBuilder(object):
         self._protoObject = responseClass()
         self._valueListName = protocol.getValueListName(responseClass)
         self._bufferSize = self._protoObject.ByteSize()
+        # The values, in order, once any of them is a ConvertedValue.
+        self._values = None
 
     def getPageSize(self):
         """
@@ -61,14 +79,20 @@ class SearchResponseBuilder(object):
 
     def addValue(self, protocolElement):
         """
-        Appends the specified protocolElement to the value list for this
-        response.
+        Appends the specified protocolElement, which may be a
+        ConvertedValue, to the value list for this response.
         """
         self._numElements += 1
         self._bufferSize += protocolElement.ByteSize()
         attr = getattr(self._protoObject, self._valueListName)
-        obj = attr.add()
-        obj.CopyFrom(protocolElement)
+        if isinstance(protocolElement, ConvertedValue) and (
+                self._values is None):
+            self._values = list(attr)
+        if self._values is not None:
+            self._values.append(protocolElement)
+        else:
+            obj = attr.add()
+            obj.CopyFrom(protocolElement)
 
     def isFull(self):
         """
@@ -91,5 +115,14 @@ class SearchResponseBuilder(object):
         been built by this SearchResponseBuilder.
         """
         self._protoObject.next_page_token = pb.string(self._nextPageToken)
-        s = protocol.toJson(self._protoObject)
-        return s
+        if self._values is None:
+            return protocol.toJson(self._protoObject)
+        self._protoObject.ClearField(self._valueListName)
+        jsonDict = protocol.json_format.MessageToDict(self._protoObject, False)
+        jsonName = self._responseClass.DESCRIPTOR.fields_by_name[
+            self._valueListName].json_name
+        jsonDict[jsonName] = [
+            value.jsonDict if isinstance(value, ConvertedValue) else
+            protocol.json_format.MessageToDict(value, False)
+            for value in self._values]
+        return json.dumps(jsonDict)
@@ -0,0 +1,282 @@
+"""
+Caches of serialized search responses, so that repeated searches are
+answered without running them again. Responses are stored under keys
+made from the endpoint, the canonical form of the request and the
+version of the data repository it was run against.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import errno
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+
+FILE_SUFFIX = ".response"
+
+
+def makeKey(*parts):
+    """
+    Returns a cache key, as a hexadecimal string, for the specified
+    sequence of strings. Each part is prefixed by its length, so that
+    different sequences of parts never give the same key.
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, unicode):
+            part = part.encode("utf-8")
+        digest.update(str(len(part)).encode() + b":" + part)
+    return digest.hexdigest()
+
+
+class ResponseCache(object):
+    """
+    A cache of JSON responses, which keeps the counts of hits and
+    misses used to report its hit rate.
+    """
+    def __init__(self):
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key):
+        """
+        Returns the response stored under the specified key, or None if
+        there is no such response or it has expired.
+        """
+        value = self._get(key)
+        if value is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return value
+
+    def set(self, key, value):
+        """
+        Stores the specified response under the specified key.
+        """
+        raise NotImplementedError()
+
+    def clear(self):
+        """
+        Removes all responses from the cache.
+        """
+        raise NotImplementedError()
+
+    def getSize(self):
+        """
+        Returns the number of bytes used by the cached responses.
+        """
+        raise NotImplementedError()
+
+    def getStatistics(self):
+        """
+        Returns a dictionary of the numbers of hits and misses, the hit
+        rate and the number of bytes used by the cache.
+        """
+        lookups = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hitRate": self._hits / lookups if lookups > 0 else 0,
+            "size": self.getSize(),
+        }
+
+    def _get(self, key):
+        raise NotImplementedError()
+
+
+class MemoryResponseCache(ResponseCache):
+    """
+    A cache held in the memory of this process, which evicts the least
+    recently used responses when their total size exceeds maxBytes, and
+    ignores responses older than timeToLive seconds.
+    """
+    def __init__(self, maxBytes, timeToLive=300):
+        super(MemoryResponseCache, self).__init__()
+        self._maxBytes = maxBytes
+        self._timeToLive = timeToLive
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self._timeToLive:
+                self._size -= len(entry[1])
+                return None
+            self._entries[key] = entry
+        return entry[1].decode("utf-8")
+
+    def set(self, key, value):
+        # Responses are held encoded, so that their sizes are in bytes.
+        value = value.encode("utf-8")
+        if len(value) > self._maxBytes:
+            return
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= len(entry[1])
+            self._entries[key] = (time.time(), value)
+            self._size += len(value)
+            while self._size > self._maxBytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def getSize(self):
+        return self._size
+
+
+class FileSystemResponseCache(ResponseCache):
+    """
+    A cache held in files in the specified directory, which may be shared
+    by several server processes. Responses older than timeToLive seconds
+    are ignored, and when the total size of the files exceeds maxBytes the
+    oldest files are removed.
+    """
+    def __init__(self, directory, maxBytes, timeToLive=300):
+        super(FileSystemResponseCache, self).__init__()
+        self._directory = directory
+        self._maxBytes = maxBytes
+        self._timeToLive = timeToLive
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(directory)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+        # An estimate of the size of the directory, which is only
+        # measured again when it appears to exceed the budget, as other
+        # processes also write to it.
+        self._size = self.getSize()
+
+    def _getPath(self, key):
+        return os.path.join(self._directory, key + FILE_SUFFIX)
+
+    def _listFiles(self):
+        """
+        Returns a list of (modification time, size, path) tuples for
+        the cached responses.
+        """
+        files = []
+        for fileName in os.listdir(self._directory):
+            if fileName.endswith(FILE_SUFFIX):
+                path = os.path.join(self._directory, fileName)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue  # Removed by another process
+                files.append((status.st_mtime, status.st_size, path))
+        return files
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+
+    def _get(self, key):
+        path = self._getPath(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self._timeToLive:
+                self._remove(path)
+                return None
+            with open(path, "rb") as cacheFile:
+                value = cacheFile.read().decode("utf-8")
+        except (IOError, OSError):
+            return None
+        return value
+
+    def set(self, key, value):
+        value = value.encode("utf-8")
+        if len(value) > self._maxBytes:
+            return
+        # Write to a temporary file first, so that other processes never
+        # read a partly written response.
+        fd, tempPath = tempfile.mkstemp(dir=self._directory)
+        try:
+            with os.fdopen(fd, "wb") as tempFile:
+                tempFile.write(value)
+            os.rename(tempPath, self._getPath(key))
+        except Exception:
+            self._remove(tempPath)
+            raise
+        with self._lock:
+            self._size += len(value)
+            if self._size > self._maxBytes:
+                self._prune()
+
+    def _prune(self):
+        """
+        Removes expired files, and then the oldest files until the cache
+        is within its budget.
+        """
+        now = time.time()
+        files = sorted(self._listFiles())
+        size = sum(fileSize for _, fileSize, _ in files)
+        for modificationTime, fileSize, path in files:
+            if size <= self._maxBytes and (
+                    now - modificationTime <= self._timeToLive):
+                break
+            self._remove(path)
+            size -= fileSize
+        self._size = size
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._listFiles():
+                self._remove(path)
+            self._size = 0
+
+    def getSize(self):
+        return sum(fileSize for _, fileSize, _ in self._listFiles())
+
+
+class TieredResponseCache(ResponseCache):
+    """
+    A cache made of a list of tiers, fastest first. Responses are looked
+    up in each tier in turn and copied into the faster tiers when found,
+    and are stored in all the tiers.
+    """
+    def __init__(self, tiers):
+        super(TieredResponseCache, self).__init__()
+        self._tiers = tiers
+
+    def _get(self, key):
+        for index, tier in enumerate(self._tiers):
+            value = tier.get(key)
+            if value is not None:
+                for fasterTier in self._tiers[:index]:
+                    fasterTier.set(key, value)
+                return value
+        return None
+
+    def set(self, key, value):
+        for tier in self._tiers:
+            tier.set(key, value)
+
+    def clear(self):
+        for tier in self._tiers:
+            tier.clear()
+
+    def getSize(self):
+        return sum(tier.getSize() for tier in self._tiers)
+
+    def getStatistics(self):
+        statistics = super(TieredResponseCache, self).getStatistics()
+        statistics["tiers"] = [
+            tier.getStatistics() for tier in self._tiers]
+        return statistics
@@ -19,6 +19,7 @@ class BaseConfig(object):
     MAX_RESPONSE_LENGTH = 1024 * 1024  # 1MB
     REQUEST_VALIDATION = True
     DEFAULT_PAGE_SIZE = 100
+    BATCH_GET_MAX_IDS = 1000
     DATA_SOURCE = "empty://"
 
     # Options for the simulated backend.
@@ -37,6 +38,40 @@ class BaseConfig(object):
 
     FILE_HANDLE_CACHE_MAX_SIZE = 50
 
+    # Search results kept for paging, and how long for in seconds.
+    RESULT_CACHE_MAX_SIZE = 100
+    RESULT_CACHE_TIME_TO_LIVE = 300
+
+    # Live search iterators kept for resuming at the next page, and how
+    # long for in seconds; 0 disables keeping them.
+    CONTINUATION_CACHE_MAX_SIZE = 0
+    CONTINUATION_CACHE_TIME_TO_LIVE = 60
+
+    # Objects read ahead by searches in background threads, and the
+    # number of such threads; 0 disables reading ahead.
+    SEARCH_READ_AHEAD_SIZE = 0
+    SEARCH_READ_AHEAD_THREADS = 4
+
+    # Processes converting the variants of searches, and the number of
+    # parts of a search converted at once; 0 converts them in the server.
+    CONVERSION_POOL_PROCESSES = 0
+    CONVERSION_POOL_PARALLELISM = 4
+
+    # Read the data repository on demand, keeping this many objects.
+    LAZY_DATA_REPOSITORY = False
+    DATA_REPOSITORY_CACHE_MAX_SIZE = 1000
+
+    # Seconds between checks for changes to the data repository; 0 never
+    # reloads it.
+    DATA_REPOSITORY_RELOAD_INTERVAL = 0
+
+    # Bytes of search responses cached in memory, and optionally in a
+    # directory shared by server processes, and how long for in seconds.
+    RESPONSE_CACHE_MAX_BYTES = 0
+    RESPONSE_CACHE_DIRECTORY = None
+    RESPONSE_CACHE_DIRECTORY_MAX_BYTES = 2**30
+    RESPONSE_CACHE_TIME_TO_LIVE = 300
+
     LANDING_MESSAGE_HTML = "landing_message.html"
 
 
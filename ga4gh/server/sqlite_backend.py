@@ -89,3 +89,9 @@ class SqliteBackedDataSource(object):
 
     def __exit__(self, type, value, traceback):
         self._dbconn.close()
+
+    def __getstate__(self):
+        # Connections cannot be pickled, and are opened on entry.
+        state = dict(self.__dict__)
+        state.pop("_dbconn", None)
+        return state
@@ -21,6 +21,7 @@ import glue
 
 glue.ga4ghImportGlue()
 import ga4gh.server.gff3 as gff3  # NOQA
+import ga4gh.server.datamodel.sequence_annotations as sequence_annotations  # NOQA
 
 # TODO: Shift this to use the Gff3DbBackend class.
 
@@ -119,10 +120,17 @@ class Gff32Db(object):
         dbcur.execute((
             "create INDEX idx1 "
             "on feature(start, end, reference_name)"))
+        # Used by parent_id searches and by the recursive descendant
+        # queries, which join each feature to its children.
+        dbcur.execute((
+            "create INDEX idx2 "
+            "on feature(parent_id)"))
         dbcur.execute("PRAGMA INDEX_LIST('feature')")
 
         dbcur.close()
         dbconn.close()
+        with sequence_annotations.Gff3DbBackend(self.dbFile) as dataSource:
+            dataSource.createNameIndex()
 
 
 @utils.Timed()
@@ -7,9 +7,14 @@ from __future__ import unicode_literals
 
 import os
 import rdflib
+import re
+import shutil
+import tempfile
 
+import ga4gh.server.datamodel.g2p_snapshot as g2p_snapshot
 import ga4gh.server.datamodel.genotype_phenotype as genotype_phenotype
 import ga4gh.server.datamodel.datasets as datasets
+import ga4gh.server.exceptions as exceptions
 import tests.datadriven as datadriven
 import tests.paths as paths
 
@@ -270,3 +275,76 @@ class PhenotypeAssociationSetTest(datadriven.DataDrivenTest):
         self.assertEqual(len(fpa_dict['featureIds']), 1)
         self.assertEqual(len(fpa_dict['evidence']), 1)
         self.assertEqual(len(fpa_dict['environmentalContexts']), 1)
+
+    def testSnapshot(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            dataDir = os.path.join(tempDir, self._localId)
+            os.mkdir(dataDir)
+            for filename in os.listdir(self._dataPath):
+                if filename.endswith(".ttl"):
+                    shutil.copy(
+                        os.path.join(self._dataPath, filename), dataDir)
+            parsedSet = self.getDataModelInstance(self._localId, dataDir)
+            patterns = parsedSet.dataFilePatterns
+            self.assertFalse(g2p_snapshot.isSnapshotCurrent(
+                dataDir, patterns))
+            parsedSet.writeSnapshot()
+            self.assertTrue(g2p_snapshot.isSnapshotCurrent(
+                dataDir, patterns))
+            snapshotSet = self.getDataModelInstance(self._localId, dataDir)
+            self.assertIsInstance(
+                snapshotSet._rdfGraph.store, g2p_snapshot.SnapshotStore)
+            self.assertEqual(
+                set(snapshotSet._rdfGraph.triples((None, None, None))),
+                set(parsedSet._rdfGraph.triples((None, None, None))))
+            self.assertEqual(
+                set(snapshotSet._rdfGraph.namespaces()),
+                set(parsedSet._rdfGraph.namespaces()))
+            # Fields chosen among several values depend on the order of
+            # the triples, which differs even between two parses.
+
+            def summarize(associationSet):
+                return sorted(
+                    (association.id, tuple(association.feature_ids),
+                     association.phenotype.id,
+                     association.environmental_contexts[0].id)
+                    for association in associationSet.getAssociations(
+                        featureSets=[self._dataset]))
+            self.assertEqual(summarize(snapshotSet), summarize(parsedSet))
+            # Modifying the data files invalidates the snapshot
+            with open(os.path.join(dataDir, "extra.ttl"), "w") as ttlFile:
+                ttlFile.write("")
+            self.assertFalse(g2p_snapshot.isSnapshotCurrent(
+                dataDir, patterns))
+        finally:
+            shutil.rmtree(tempDir)
+
+    def testIndexedSearch(self):
+        featureSets = [self._dataset]
+        associations = self._gaObject.getAssociations(
+            featureSets=featureSets)
+        self.assertGreater(len(associations), 0)
+        self.assertEqual(
+            [association.id for association in associations],
+            sorted(association.id for association in associations))
+        association = associations[0]
+        request = protocol.SearchGenotypePhenotypeRequest()
+        request.phenotype_ids.append(association.phenotype.id)
+        matches = self._gaObject.getAssociations(request, featureSets)
+        self.assertIn(association.id, [match.id for match in matches])
+        for match in matches:
+            self.assertEqual(match.phenotype.id, association.phenotype.id)
+        evidenceQuery = request.evidence.add()
+        evidenceQuery.description = "^{}$".format(re.escape(
+            association.environmental_contexts[0].description))
+        matches = self._gaObject.getAssociations(request, featureSets)
+        self.assertIn(association.id, [match.id for match in matches])
+        evidenceQuery.description = "no such environment"
+        self.assertEqual(
+            self._gaObject.getAssociations(request, featureSets), [])
+        request = protocol.SearchPhenotypesRequest()
+        request.description = "("
+        with self.assertRaises(
+                exceptions.BadFeatureSetSearchRequestRegularExpression):
+            self._gaObject.getAssociations(request, featureSets)
@@ -5,7 +5,9 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import os.path
+import os
+import shutil
+import tempfile
 
 # TODO it may be a bit circular to use obo_parser as our method of
 # accessing ontology information, since this is the method we use
@@ -58,3 +60,67 @@ class OntologyTest(datadriven.DataDrivenTest):
     def testBadMappings(self):
         for badName in ["Not a term", None, 1234]:
             self.assertEqual(0, len(self._gaObject.getTermIds(badName)))
+
+    def testAncestorMasks(self):
+        ontology = self._gaObject
+        for term in self._oboReader:
+            termMask = ontology.getTermMask([term.id])
+            self.assertNotEqual(termMask, 0)
+            self.assertTrue(ontology.getAncestorMask(term.id) & termMask)
+            for altId in term.alt_ids:
+                self.assertEqual(ontology.getTermMask([altId]), termMask)
+            for parentId in term._parents:
+                parentMask = ontology.getTermMask([parentId])
+                self.assertTrue(ontology.getAncestorMask(term.id) & parentMask)
+                self.assertFalse(
+                    ontology.getAncestorMask(parentId) & termMask)
+        self.assertEqual(ontology.getTermMask(["NotATerm"]), 0)
+        self.assertEqual(ontology.getAncestorMask("NotATerm"), 0)
+
+    def testTermNames(self):
+        ontology = self._gaObject
+        for term in self._oboReader:
+            termId = ontology.getGaTermByName(term.name).term_id
+            self.assertIn(term.name, ontology.getTermNames([termId]))
+            if termId != term.id:
+                # Only the first of the IDs sharing a name is mapped to
+                continue
+            for parentId in term._parents:
+                self.assertNotIn(term.name, ontology.getTermNames([parentId]))
+                self.assertIn(
+                    term.name, ontology.getTermNames([parentId], True))
+        self.assertEqual(ontology.getTermNames(["NotATerm"], True), set())
+
+    def testGaTermsShared(self):
+        for term in self._oboReader:
+            gaTerm = self._gaObject.getGaTermByName(term.name)
+            self.assertIs(gaTerm, self._gaObject.getGaTermByName(term.name))
+
+    def testCache(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            dataPath = os.path.join(tempDir, os.path.basename(self._dataPath))
+            shutil.copy(self._dataPath, dataPath)
+            ontology = self.getDataModelInstance(self._localId, dataPath)
+            self.assertFalse(ontology._readCache())
+            ontology.writeCache()
+            self.assertTrue(os.path.exists(ontology.getCachePath()))
+            cachedOntology = self.getDataModelInstance(
+                self._localId, dataPath)
+            self.assertTrue(cachedOntology._readCache())
+            self.assertEqual(
+                cachedOntology.getOntologyPrefix(),
+                ontology.getOntologyPrefix())
+            self.assertEqual(
+                cachedOntology.getSourceVersion(),
+                ontology.getSourceVersion())
+            for term in self._oboReader:
+                self.assertEqual(
+                    cachedOntology.getTermIds(term.name),
+                    ontology.getTermIds(term.name))
+            # Changing the OBO file invalidates the cache
+            with open(dataPath, "a") as oboFile:
+                oboFile.write("\n")
+            self.assertFalse(cachedOntology._readCache())
+        finally:
+            shutil.rmtree(tempDir)
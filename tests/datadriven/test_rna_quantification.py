@@ -5,11 +5,17 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import math
+import os
+import shutil
+import tempfile
+
 import ga4gh.server.datarepo as datarepo
 import ga4gh.server.datamodel as datamodel
 import ga4gh.server.datamodel.datasets as datasets
 import ga4gh.server.datamodel.references as references
 import ga4gh.server.datamodel.rna_quantification as rna_quantification
+import ga4gh.server.exceptions as exceptions
 import tests.datadriven as datadriven
 import tests.paths as paths
 
@@ -175,3 +181,64 @@ class RnaQuantificationTest(datadriven.DataDrivenTest):
         self.assertEqual(
             _expressionTestData["num_expression_entries"],
             len(expressionLevels))
+
+    def testExpressionMatrix(self):
+        matrix = self._gaObject.getExpressionMatrix()
+        rnaQuantification = self._gaObject.getRnaQuantificationByIndex(0)
+        rowIndex = matrix.getRowIndex(rnaQuantification.getLocalId())
+        self.assertEqual(
+            matrix.getRnaQuantificationIds()[rowIndex],
+            rnaQuantification.getLocalId())
+        self.assertIsNone(matrix.getRowIndex("not_a_quantification"))
+        self.assertEqual(
+            sorted(matrix.getFeatureIds()),
+            sorted(_expressionTestData["feature_ids"]))
+        row = matrix.getRow(rowIndex)
+        for expressionLevel in rnaQuantification.getExpressionLevels(
+                threshold=float("-inf")):
+            index = matrix.getNames().index(expressionLevel.getName())
+            self.assertAlmostEqual(
+                row[index], expressionLevel.getExpression(), ndigits=4)
+        self.assertEqual(
+            len(matrix.selectColumns(threshold=100.0)),
+            _expressionTestData["num_entries_over_threshold"])
+        columns = matrix.selectColumns(
+            featureIds=[_expressionTestData["feature_id"]])
+        self.assertEqual(
+            [matrix.getFeatureIds()[column] for column in columns],
+            [_expressionTestData["feature_id"]])
+        self.assertAlmostEqual(
+            matrix.getRow(rowIndex, columns)[0],
+            _expressionTestData["expression"], ndigits=4)
+
+    def testExpressionMatrixFile(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            dbPath = os.path.join(tempDir, os.path.basename(self._dataPath))
+            shutil.copy(self._dataPath, dbPath)
+            rna_quantification.writeExpressionMatrix(dbPath)
+            matrixPath = dbPath + rna_quantification.EXPRESSION_MATRIX_SUFFIX
+            fileMatrix = rna_quantification.ExpressionMatrix.fromFile(
+                matrixPath)
+            dbMatrix = self._gaObject.getExpressionMatrix()
+            self.assertEqual(
+                fileMatrix.getRnaQuantificationIds(),
+                dbMatrix.getRnaQuantificationIds())
+            self.assertEqual(
+                fileMatrix.getFeatureIds(), dbMatrix.getFeatureIds())
+            self.assertEqual(fileMatrix.getNames(), dbMatrix.getNames())
+            for rowIndex in range(
+                    len(dbMatrix.getRnaQuantificationIds())):
+                for fileValue, dbValue in zip(
+                        fileMatrix.getRow(rowIndex),
+                        dbMatrix.getRow(rowIndex)):
+                    if math.isnan(dbValue):
+                        self.assertTrue(math.isnan(fileValue))
+                    else:
+                        self.assertEqual(fileValue, dbValue)
+            with open(matrixPath, "r+b") as matrixFile:
+                matrixFile.write(b"notmagic")
+            with self.assertRaises(exceptions.FileOpenFailedException):
+                rna_quantification.ExpressionMatrix.fromFile(matrixPath)
+        finally:
+            shutil.rmtree(tempDir)
@@ -5,6 +5,10 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import os
+import shutil
+import tempfile
+
 import ga4gh.server.datarepo as datarepo
 import ga4gh.server.datamodel as datamodel
 import ga4gh.server.datamodel.datasets as datasets
@@ -200,3 +204,84 @@ class FeatureSetTests(datadriven.DataDrivenTest):
             features.append(feature)
         self.assertEqual(len(features),
                          self._testData["sampleSiblings"])
+
+    def testFetchFeaturesWithDescendants(self):
+        features = list(self._gaObject.getFeatures(
+            self._testData["referenceName"],
+            self._testData["region"][0],
+            self._testData["region"][1],
+            None, 1000,
+            featureTypes=self._testData["ontologyRestriction"],
+            includeDescendants=True))
+        featureIds = set(feature.id for feature in features)
+        self.assertEqual(len(featureIds), len(features))
+        roots = [
+            feature for feature in features
+            if feature.feature_type.term in
+            self._testData["ontologyRestriction"]]
+        self.assertEqual(len(roots), self._testData["featuresWithOntology"])
+        for feature in features:
+            if feature not in roots:
+                self.assertIn(feature.parent_id, featureIds)
+            for childId in feature.child_ids:
+                self.assertIn(childId, featureIds)
+
+    def testGetFeaturesByIds(self):
+        featureIds = [self._testData["sampleFeatureId"]]
+        if self._testData["sampleParentId"] is not None:
+            featureIds.append(self._testData["sampleParentId"])
+        featureIds.append(self._testData["sampleFeatureId"])
+        compoundIds = [
+            datamodel.FeatureCompoundId.parse(_getFeatureCompoundId(
+                _datasetName, self._testData["featureSetName"], featureId))
+            for featureId in featureIds]
+        features = self._gaObject.getFeaturesByIds(
+            compoundIds + [datamodel.FeatureCompoundId.parse(
+                _getFeatureCompoundId(
+                    _datasetName, self._testData["featureSetName"],
+                    "999999999"))])
+        self.assertEqual(len(features), len(compoundIds) + 1)
+        self.assertIsNone(features[-1])
+        for compoundId, feature in zip(compoundIds, features):
+            self.assertEqual(feature, self._gaObject.getFeature(compoundId))
+
+    def testFetchFeaturesByNamePrefix(self):
+        idString = _getFeatureCompoundId(
+            _datasetName,
+            self._testData["featureSetName"],
+            self._testData["sampleFeatureId"])
+        sampleFeature = self._gaObject.getFeature(
+            datamodel.FeatureCompoundId.parse(idString))
+        namePrefix = sampleFeature.name[:4].swapcase()
+        features = list(self._gaObject.getFeatures(
+            self._testData["referenceName"],
+            self._testData["region"][0],
+            self._testData["region"][1],
+            None, 1000, namePrefix=namePrefix))
+        self.assertIn(sampleFeature, features)
+        for feature in features:
+            names = [feature.name.lower(), feature.gene_symbol.lower()]
+            names.extend(
+                value.string_value.lower() for value in
+                feature.attributes.attr["transcript_name"].values)
+            self.assertTrue(any(
+                name.startswith(namePrefix.lower()) for name in names))
+        # The indexed search must match the unindexed one.
+        tempDir = tempfile.mkdtemp()
+        try:
+            dbPath = os.path.join(tempDir, os.path.basename(self._dataPath))
+            shutil.copy(self._dataPath, dbPath)
+            indexedFeatureSet = self.getDataModelInstance(
+                self._localId, dbPath)
+            with sequence_annotations.Gff3DbBackend(dbPath) as dataSource:
+                dataSource.createNameIndex()
+            indexedFeatures = list(indexedFeatureSet.getFeatures(
+                self._testData["referenceName"],
+                self._testData["region"][0],
+                self._testData["region"][1],
+                None, 1000, namePrefix=namePrefix))
+            self.assertEqual(
+                sorted(feature.id for feature in indexedFeatures),
+                sorted(feature.id for feature in features))
+        finally:
+            shutil.rmtree(tempDir)
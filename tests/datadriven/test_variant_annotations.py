@@ -7,14 +7,18 @@ from __future__ import unicode_literals
 
 import os
 import glob
+import shutil
+import tempfile
 
 import vcf
 
 import ga4gh.server.datamodel as datamodel
 import ga4gh.server.datamodel.datasets as datasets
 import ga4gh.server.datamodel.variants as variants
+import ga4gh.server.datamodel.annotation_index as annotation_index
 import ga4gh.server.datamodel.references as references
 import ga4gh.server.datamodel.ontologies as ontologies
+import ga4gh.server.paging as paging
 import tests.datadriven as datadriven
 import tests.paths as paths
 
@@ -329,3 +333,206 @@ class VariantAnnotationSetTest(datadriven.DataDrivenTest):
             self.assertTrue(
                 self._pyvcfVariantAnnotationIsInGaVariantAnnotations(
                     variant, variantEnd-1, variantEnd+1))
+
+    def _searchEffects(self, referenceName, termIds, includeDescendants):
+        request = protocol.SearchVariantAnnotationsRequest()
+        request.reference_name = referenceName
+        request.start = 0
+        request.end = 2**32
+        for termId in termIds:
+            request.effects.add().term_id = termId
+        iterator = paging.VariantAnnotationsIntervalIterator(
+            request, self._gaObject, includeDescendants)
+        return [annotation for annotation, _ in iterator]
+
+    def testEffectFilterWithDescendants(self):
+        if not self._isAnnotated():
+            return
+        ontology = self._gaObject.getOntology()
+        for referenceName in self._referenceNames:
+            annotations = self._searchEffects(referenceName, [], False)
+            termIds = set(
+                effect.term_id for annotation in annotations
+                for transcriptEffect in annotation.transcript_effects
+                for effect in transcriptEffect.effects if effect.term_id)
+            self.assertGreater(len(termIds), 0)
+            for termId in sorted(termIds)[:3]:
+                for parentId in ontology._parentIdMap[termId]:
+                    parentMask = ontology.getTermMask([parentId])
+                    matches = self._searchEffects(
+                        referenceName, [parentId], True)
+                    expected = [
+                        annotation.id for annotation in annotations
+                        if any(
+                            ontology.getAncestorMask(effect.term_id) &
+                            parentMask
+                            for transcriptEffect in
+                            annotation.transcript_effects
+                            for effect in transcriptEffect.effects)]
+                    self.assertGreater(len(matches), 0)
+                    self.assertEqual(
+                        [annotation.id for annotation in matches], expected)
+                    for annotation in matches:
+                        for transcriptEffect in annotation.transcript_effects:
+                            self.assertTrue(any(
+                                ontology.getAncestorMask(effect.term_id) &
+                                parentMask
+                                for effect in transcriptEffect.effects))
+                exactMatches = self._searchEffects(
+                    referenceName, [termId], False)
+                self.assertGreater(len(exactMatches), 0)
+                descendantMatchIds = [
+                    annotation.id for annotation in self._searchEffects(
+                        referenceName, [termId], True)]
+                for annotation in exactMatches:
+                    self.assertIn(annotation.id, descendantMatchIds)
+                    for transcriptEffect in annotation.transcript_effects:
+                        self.assertIn(termId, [
+                            effect.term_id
+                            for effect in transcriptEffect.effects])
+
+    def testEffectFilterBeforeConversion(self):
+        if not self._isAnnotated():
+            return
+        for referenceName in self._referenceNames:
+            annotations = self._searchEffects(referenceName, [], False)
+            termIds = sorted(set(
+                effect.term_id for annotation in annotations
+                for transcriptEffect in annotation.transcript_effects
+                for effect in transcriptEffect.effects if effect.term_id))
+            for termId in termIds[:3] + ["SO:NotAnEffect"]:
+                expected = []
+                for annotation in annotations:
+                    transcriptEffects = [
+                        transcriptEffect for transcriptEffect in
+                        annotation.transcript_effects
+                        if termId in [
+                            effect.term_id
+                            for effect in transcriptEffect.effects]]
+                    if len(transcriptEffects) > 0:
+                        filtered = protocol.VariantAnnotation()
+                        filtered.CopyFrom(annotation)
+                        filtered.ClearField('transcript_effects')
+                        filtered.transcript_effects.extend(transcriptEffects)
+                        expected.append(filtered)
+                self.assertEqual(
+                    self._searchEffects(referenceName, [termId], False),
+                    expected)
+
+    def testAnnotationFieldsFromHeader(self):
+        if not self._isAnnotated():
+            return
+        key = 'CSQ' if self._isCsq else 'ANN'
+        pyvcfreader = vcf.Reader(
+            filename=glob.glob(
+                os.path.join(self._dataPath, "*.vcf.gz"))[0])
+        fieldNames = variants.parseAnnotationFormat(
+            pyvcfreader.infos[key].desc)
+        self.assertEqual(fieldNames[0], "Allele")
+        annStrs = next(pyvcfreader).INFO[key]
+        if self._isCsq:
+            converter = self._gaObject.convertTranscriptEffectCSQ
+        else:
+            converter = self._gaObject.convertTranscriptEffectSnpEff
+        effects = [converter(annStr, "") for annStr in annStrs]
+        # The fields are found by name, so reversing their order in the
+        # header and the annotations must not change the effects.
+        attr = self._gaObject._analysis.attributes.attr["INFO." + key]
+        description = attr.values[0].string_value
+        try:
+            attr.values[0].string_value = "Format: " + "|".join(
+                reversed(fieldNames))
+            self._gaObject._initialiseAnnotationFields()
+            reversedEffects = [
+                converter("|".join(reversed(annStr.split("|"))), "")
+                for annStr in annStrs]
+        finally:
+            attr.values[0].string_value = description
+            self._gaObject._initialiseAnnotationFields()
+        self.assertEqual(reversedEffects, effects)
+
+    def _searchFeatures(self, annotationSet, referenceName, featureIds):
+        request = protocol.SearchVariantAnnotationsRequest()
+        request.reference_name = referenceName
+        request.start = 0
+        request.end = 2**32
+        iterator = paging.VariantAnnotationsIntervalIterator(
+            request, annotationSet, featureIds=featureIds)
+        return [annotation for annotation, _ in iterator]
+
+    def testFeatureFilter(self):
+        if not self._isAnnotated():
+            return
+        for referenceName in self._referenceNames:
+            annotations = self._searchEffects(referenceName, [], False)
+            featureIds = sorted(set(
+                transcriptEffect.feature_id for annotation in annotations
+                for transcriptEffect in annotation.transcript_effects
+                if transcriptEffect.feature_id))
+            for featureId in featureIds[:3]:
+                matches = self._searchFeatures(
+                    self._gaObject, referenceName, [featureId])
+                # Gene IDs may also match the effects on other transcripts.
+                matchIds = set(annotation.id for annotation in matches)
+                for annotation in annotations:
+                    if featureId in [
+                            transcriptEffect.feature_id for transcriptEffect
+                            in annotation.transcript_effects]:
+                        self.assertIn(annotation.id, matchIds)
+                for annotation in matches:
+                    self.assertGreater(len(annotation.transcript_effects), 0)
+            self.assertEqual(
+                self._searchFeatures(
+                    self._gaObject, referenceName, ["NOT_A_FEATURE"]),
+                [])
+            self.assertEqual(
+                self._searchFeatures(self._gaObject, referenceName, []),
+                annotations)
+
+    def testIndexedSearch(self):
+        if not self._isAnnotated():
+            return
+        tempDir = tempfile.mkdtemp()
+        try:
+            for dataFile in glob.glob(os.path.join(self._dataPath, "*")):
+                shutil.copy(dataFile, tempDir)
+            indexedSet = self.getDataModelInstance(self._localId, tempDir)
+            indexedSet.writeIndexes()
+            for dataFile in glob.glob(os.path.join(tempDir, "*.vcf.gz")):
+                self.assertTrue(annotation_index.isIndexCurrent(dataFile))
+            for referenceName in self._referenceNames:
+                annotations = self._searchEffects(referenceName, [], False)
+                termIds = sorted(set(
+                    effect.term_id for annotation in annotations
+                    for transcriptEffect in annotation.transcript_effects
+                    for effect in transcriptEffect.effects
+                    if effect.term_id))
+                featureIds = sorted(set(
+                    transcriptEffect.feature_id for annotation in annotations
+                    for transcriptEffect in annotation.transcript_effects
+                    if transcriptEffect.feature_id))
+                for termId in termIds[:3]:
+                    request = protocol.SearchVariantAnnotationsRequest()
+                    request.reference_name = referenceName
+                    request.start = 0
+                    request.end = 2**32
+                    request.effects.add().term_id = termId
+                    indexed = [
+                        annotation for annotation, _ in
+                        paging.VariantAnnotationsIntervalIterator(
+                            request, indexedSet)]
+                    self.assertGreater(len(indexed), 0)
+                    self.assertEqual(
+                        [annotation.id for annotation in indexed],
+                        [annotation.id for annotation in self._searchEffects(
+                            referenceName, [termId], False)])
+                for featureId in featureIds[:3]:
+                    indexed = self._searchFeatures(
+                        indexedSet, referenceName, [featureId])
+                    self.assertGreater(len(indexed), 0)
+                    self.assertEqual(
+                        [annotation.id for annotation in indexed],
+                        [annotation.id for annotation in self._searchFeatures(
+                            self._gaObject, referenceName, [featureId])])
+        finally:
+            shutil.rmtree(tempDir)
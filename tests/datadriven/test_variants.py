@@ -431,6 +431,39 @@ class VariantSetTest(datadriven.DataDrivenTest):
                 for call, someId in zip(record.calls, somecall_set_ids):
                     self.assertEqual(call.call_set_id, someId)
 
+    def testGetVariantSummaries(self):
+        variantSet = self._gaObject
+        start = 0
+        end = datamodel.PysamDatamodelMixin.vcfMax
+        callSetIds = [cs.getId() for cs in variantSet.getCallSets()]
+        for callSetIdsArg in [None, callSetIds[:3], []]:
+            for referenceName in self._reference_names:
+                summaries = list(variantSet.getVariantSummaries(
+                    referenceName, start, end, callSetIdsArg))
+                if callSetIdsArg is not None:
+                    # The summaries of the converted calls must match
+                    expected = list(
+                        variants.AbstractVariantSet.getVariantSummaries(
+                            variantSet, referenceName, start, end,
+                            callSetIdsArg))
+                    self.assertEqual(summaries, expected)
+                for summary in summaries:
+                    self.assertEqual(
+                        summary["callCount"],
+                        len(callSetIds if callSetIdsArg is None
+                            else callSetIdsArg))
+                    self.assertEqual(
+                        summary["callCount"],
+                        summary["missingCount"] +
+                        sum(summary["genotypeCounts"].values()))
+                    self.assertEqual(
+                        len(summary["alleleCounts"]),
+                        len(summary["alternateBases"]))
+        self.assertRaises(
+            exceptions.CallSetNotInVariantSetException, list,
+            variantSet.getVariantSummaries(
+                "1", start, end, ["notACallSet"]))
+
     def testGetVariant(self):
         variantSet = self._gaObject
         for reference_name in self._reference_names:
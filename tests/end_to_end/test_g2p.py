@@ -205,6 +205,37 @@ class TestG2P(unittest.TestCase):
         self.assertEqual(feature.start,  43617416)
         self.assertEqual(feature.end,  43617416)
 
+    def testFeaturesSearchByLocation(self):
+        datasetName, featureSet = self.getCGDDataSetFeatureSet()
+        request = protocol.SearchFeaturesRequest()
+        request.feature_set_id = featureSet.id
+        request.reference_name = "chr10"
+        request.start = 43617416
+        request.end = 43617416
+        response = self.sendSearchRequest(
+            "features/search", request, protocol.SearchFeaturesResponse)
+        self.assertEqual(1, len(response.features))
+        self.assertEqual(response.features[0].start, 43617416)
+        request.start = 43000000
+        request.end = 44000000
+        response = self.sendSearchRequest(
+            "features/search", request, protocol.SearchFeaturesResponse)
+        self.assertEqual(1, len(response.features))
+        request.end = 43617415
+        response = self.sendSearchRequest(
+            "features/search", request, protocol.SearchFeaturesResponse)
+        self.assertEqual(0, len(response.features))
+        request.start = 43617417
+        request.end = 44000000
+        response = self.sendSearchRequest(
+            "features/search", request, protocol.SearchFeaturesResponse)
+        self.assertEqual(0, len(response.features))
+        request.reference_name = "chrNone"
+        request.start = request.end = 0
+        response = self.sendSearchRequest(
+            "features/search", request, protocol.SearchFeaturesResponse)
+        self.assertEqual(0, len(response.features))
+
     def testGenotypesSearchByName(self):
         # setup phenotype query
         request = protocol.SearchFeaturesRequest()
@@ -527,6 +558,30 @@ class TestG2P(unittest.TestCase):
             pageCount += 1
         self.assertEqual(3, pageCount)
 
+    def testGenotypePhenotypeSearchPaging(self):
+        request = protocol.SearchGenotypePhenotypeRequest()
+        request.phenotype_association_set_id = \
+            self.getPhenotypeAssociationSetId()
+        response = self.sendSearchRequest(
+            "featurephenotypeassociations/search", request,
+            protocol.SearchGenotypePhenotypeResponse)
+        associationIds = [
+            association.id for association in response.associations]
+        self.assertGreater(len(associationIds), 1)
+        self.assertEqual(associationIds, sorted(associationIds))
+        request.page_size = 1
+        pagedIds = []
+        while True:
+            response = self.sendSearchRequest(
+                "featurephenotypeassociations/search", request,
+                protocol.SearchGenotypePhenotypeResponse)
+            self.assertEqual(1, len(response.associations))
+            pagedIds.append(response.associations[0].id)
+            if not response.next_page_token:
+                break
+            request.page_token = response.next_page_token
+        self.assertEqual(associationIds, pagedIds)
+
     def testGenotypesSearchByNameError(self):
         """
         Search for feature by name with a malformed regular expression.
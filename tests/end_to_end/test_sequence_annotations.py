@@ -5,6 +5,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
 import unittest
 import logging
 
@@ -143,6 +144,73 @@ class TestSequenceAnnotations(unittest.TestCase):
             for feature in responseData.features:
                 self.assertIn(feature.feature_type.term, request.feature_types)
 
+    def testSearchFeaturesWithDescendants(self):
+        featureSets = self.getAllFeatureSets()
+        for featureSet in featureSets:
+            path = "features/search"
+            request = protocol.SearchFeaturesRequest()
+            request.feature_set_id = featureSet.id
+            request.feature_types.extend(["gene"])
+            request.page_size = 1000
+            genes = self.sendSearchRequest(
+                path, request, protocol.SearchFeaturesResponse).features
+            jsonDict = protocol.toJsonDict(request)
+            jsonDict["includeDescendants"] = True
+            response = self.sendJsonPostRequest(path, json.dumps(jsonDict))
+            self.assertEqual(200, response.status_code)
+            features = protocol.fromJson(
+                response.data, protocol.SearchFeaturesResponse).features
+            featureIds = set(feature.id for feature in features)
+            for gene in genes:
+                self.assertIn(gene.id, featureIds)
+                for childId in gene.child_ids:
+                    self.assertIn(childId, featureIds)
+            jsonDict["includeDescendants"] = "yes"
+            response = self.sendJsonPostRequest(path, json.dumps(jsonDict))
+            self.assertEqual(400, response.status_code)
+
+    def testSearchFeaturesByNamePrefix(self):
+        ran = False
+        featureSets = self.getAllFeatureSets()
+        for featureSet in featureSets:
+            path = "features/search"
+            request = protocol.SearchFeaturesRequest()
+            request.feature_set_id = featureSet.id
+            jsonDict = protocol.toJsonDict(request)
+            jsonDict["namePrefix"] = "ddx11"
+            response = self.sendJsonPostRequest(path, json.dumps(jsonDict))
+            self.assertEqual(200, response.status_code)
+            responseData = protocol.fromJson(
+                response.data, protocol.SearchFeaturesResponse)
+            for feature in responseData.features:
+                ran = True
+                self.assertTrue(
+                    feature.name.lower().startswith("ddx11") or
+                    feature.gene_symbol.lower().startswith("ddx11"))
+        self.assertTrue(ran)
+
+    def testBatchGetFeatures(self):
+        featureSets = self.getAllFeatureSets()
+        for featureSet in featureSets:
+            request = protocol.SearchFeaturesRequest()
+            request.feature_set_id = featureSet.id
+            request.page_size = 5
+            features = self.sendSearchRequest(
+                "features/search", request,
+                protocol.SearchFeaturesResponse).features
+            featureIds = [feature.id for feature in reversed(features)]
+            response = self.sendJsonPostRequest(
+                "features/batchget", json.dumps({"ids": featureIds}))
+            self.assertEqual(200, response.status_code)
+            responseData = protocol.fromJson(
+                response.data, protocol.SearchFeaturesResponse)
+            self.assertEqual(
+                [feature.id for feature in responseData.features],
+                featureIds)
+        response = self.sendJsonPostRequest(
+            "features/batchget", json.dumps({"ids": "notAList"}))
+        self.assertEqual(400, response.status_code)
+
     def sendJsonPostRequest(self, path, data):
         """
         Sends a JSON request to the specified path with the specified data
@@ -7,17 +7,22 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
 import unittest
 
 import ga4gh.server.exceptions as exceptions
 import ga4gh.server.backend as backend
+import ga4gh.server.datamodel as datamodel
 import ga4gh.server.paging as paging
+import ga4gh.server.response_cache as response_cache
 import ga4gh.server.datarepo as datarepo
 import ga4gh.server.datamodel.datasets as datasets
 import ga4gh.server.datamodel.references as references
 
 import tests.paths as paths
 
+import ga4gh.schemas.protocol as protocol
+
 
 class TestAbstractBackend(unittest.TestCase):
     """
@@ -213,6 +218,250 @@ class TestTopLevelObjectGenerator(unittest.TestCase):
         self.assertEqual(len(items), numItems)
 
 
+class TestDataRepositoryReload(unittest.TestCase):
+    """
+    Tests that the backend replaces its data repository when it changes
+    """
+    class FakeDataRepository(datarepo.AbstractDataRepository):
+
+        def __init__(self, generation=0):
+            super(TestDataRepositoryReload.FakeDataRepository, self).__init__()
+            self.generation = generation
+            self.changed = False
+
+        def hasChanged(self):
+            return self.changed
+
+        def reload(self):
+            return type(self)(self.generation + 1)
+
+    def setUp(self):
+        self._repo = self.FakeDataRepository()
+        self._backend = backend.Backend(self._repo)
+
+    def testReloadDisabled(self):
+        self._repo.changed = True
+        self._backend.checkDataRepository()
+        self.assertIs(self._backend.getDataRepository(), self._repo)
+
+    def testReload(self):
+        self._backend.setDataRepositoryReloadInterval(60)
+        self._backend._lastReloadCheck = 0
+        self._backend.checkDataRepository()
+        self.assertIs(self._backend.getDataRepository(), self._repo)
+        self._repo.changed = True
+        # Changes are not checked for again until the interval has passed.
+        self._backend.checkDataRepository()
+        self.assertIs(self._backend.getDataRepository(), self._repo)
+        self._backend._lastReloadCheck = 0
+        self._backend.checkDataRepository()
+        self._backend._reloadThread.join()
+        self.assertEqual(self._backend.getDataRepository().generation, 1)
+
+    def testPinnedRepository(self):
+        self._backend.setDataRepositoryReloadInterval(60)
+        self._backend.beginRequest()
+        self._repo.changed = True
+        self._backend._lastReloadCheck = 0
+        self._backend.checkDataRepository()
+        self._backend._reloadThread.join()
+        self.assertIs(self._backend.getDataRepository(), self._repo)
+        self._backend.endRequest()
+        self.assertEqual(self._backend.getDataRepository().generation, 1)
+
+
+class TestBackendResponseCache(unittest.TestCase):
+    """
+    Tests that the backend caches the responses to search requests
+    """
+    class FakeDataRepository(TestDataRepositoryReload.FakeDataRepository):
+
+        def getVersion(self):
+            return "version{}".format(self.generation)
+
+    def setUp(self):
+        self._repo = self.FakeDataRepository()
+        self._backend = backend.Backend(self._repo)
+        self._backend.setResponseCache(
+            response_cache.MemoryResponseCache(2**20))
+        self._numSearches = 0
+
+    def datasetsGenerator(self, request):
+        self._numSearches += 1
+        dataset = datasets.Dataset("dataset{}".format(self._numSearches))
+        yield dataset.toProtocolElement(), None
+
+    def runSearch(self, requestStr):
+        return self._backend.runSearchRequest(
+            requestStr, protocol.SearchDatasetsRequest,
+            protocol.SearchDatasetsResponse, self.datasetsGenerator)
+
+    def testCachedResponse(self):
+        response = self.runSearch('{"pageSize": 10}')
+        # Equivalent requests share their cached response.
+        self.assertEqual(self.runSearch('{"page_size": 10}'), response)
+        self.assertEqual(self._numSearches, 1)
+        self.assertNotEqual(self.runSearch('{"pageSize": 5}'), response)
+        self.assertEqual(self._numSearches, 2)
+        statistics = self._backend.getResponseCacheStatistics()
+        self.assertEqual(statistics["hits"], 1)
+        self.assertEqual(statistics["misses"], 2)
+
+    def testInvalidatedByReload(self):
+        response = self.runSearch('{}')
+        self._repo.changed = True
+        self._backend.setDataRepositoryReloadInterval(60)
+        self._backend._lastReloadCheck = 0
+        self._backend.checkDataRepository()
+        self._backend._reloadThread.join()
+        self.assertNotEqual(self.runSearch('{}'), response)
+        self.assertEqual(self._numSearches, 2)
+
+    def testUnversionedRepository(self):
+        self._backend = backend.Backend(datarepo.AbstractDataRepository())
+        self._backend.setResponseCache(
+            response_cache.MemoryResponseCache(2**20))
+        self.runSearch('{}')
+        self.runSearch('{}')
+        self.assertEqual(self._numSearches, 2)
+
+
+class TestBackendContinuationCache(unittest.TestCase):
+    """
+    Tests that the backend resumes the iterators of searches at the next
+    page
+    """
+    def setUp(self):
+        dataRepo = datarepo.SqlDataRepository(paths.testDataRepo)
+        dataRepo.open(datarepo.MODE_READ)
+        self._backend = backend.Backend(dataRepo)
+        self._variantSet = next(dataRepo.allVariantSets())
+        self._numSearches = 0
+
+    def variantsGenerator(self, request):
+        self._numSearches += 1
+        return self._backend.variantsGenerator(request)
+
+    def searchVariants(self, pageToken="", start=0):
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self._variantSet.getId()
+        request.reference_name = "1"
+        request.start = start
+        request.end = 2**32
+        request.page_size = 3
+        request.page_token = pageToken
+        responseString = self._backend.runSearchRequest(
+            protocol.toJson(request), protocol.SearchVariantsRequest,
+            protocol.SearchVariantsResponse, self.variantsGenerator)
+        return protocol.fromJson(
+            responseString, protocol.SearchVariantsResponse)
+
+    def getAllVariants(self, interleave=False):
+        variants = []
+        response = self.searchVariants()
+        variants.extend(response.variants)
+        while response.next_page_token:
+            if interleave:
+                self.searchVariants(start=1)
+            response = self.searchVariants(response.next_page_token)
+            variants.extend(response.variants)
+        return variants
+
+    def testResumed(self):
+        expected = self.getAllVariants()
+        self.assertGreater(self._numSearches, 1)
+        self._numSearches = 0
+        self._backend.setContinuationCacheSize(10)
+        self.assertEqual(self.getAllVariants(), expected)
+        self.assertEqual(self._numSearches, 1)
+
+    def testFilesUsedBetweenPages(self):
+        expected = self.getAllVariants()
+        numPages = self._numSearches
+        self._numSearches = 0
+        self._backend.setContinuationCacheSize(10)
+        self.assertEqual(self.getAllVariants(interleave=True), expected)
+        self.assertEqual(self._numSearches, 2 * numPages - 1)
+
+    def testReadAhead(self):
+        expected = self.getAllVariants()
+        self._backend.setReadAhead(2, 1)
+        self.assertEqual(self.getAllVariants(), expected)
+        self._numSearches = 0
+        self._backend.setContinuationCacheSize(10)
+        self.assertEqual(self.getAllVariants(), expected)
+        self.assertEqual(self._numSearches, 1)
+        self.assertRaises(ValueError, self._backend.setReadAhead, -1, 1)
+        self.assertRaises(ValueError, self._backend.setReadAhead, 1, 0)
+
+
+class TestBackendVariantRegions(unittest.TestCase):
+    """
+    Tests searching for the variants in lists of regions
+    """
+    regions = [
+        "3:60500-61000", "1:10620-10630", "1\t10630\t11000\tgene",
+        "3:62000-62200", "10:0-100", "2:10170-10200", "1:13000-14000"]
+    mergedRegions = [
+        ("1", 10620, 11000), ("1", 13000, 14000), ("2", 10170, 10200),
+        ("3", 60500, 61000), ("3", 62000, 62200), ("10", 0, 100)]
+
+    def setUp(self):
+        dataRepo = datarepo.SqlDataRepository(paths.testDataRepo)
+        dataRepo.open(datarepo.MODE_READ)
+        self._backend = backend.Backend(dataRepo)
+        self._variantSet = next(dataRepo.allVariantSets())
+
+    def searchVariants(self, pageSize, regions):
+        variants = []
+        request = {
+            "variantSetId": self._variantSet.getId(),
+            "pageSize": pageSize, "regions": regions}
+        while True:
+            response = protocol.fromJson(
+                self._backend.runSearchVariantsInRegions(
+                    json.dumps(request)),
+                protocol.SearchVariantsResponse)
+            self.assertLessEqual(len(response.variants), pageSize)
+            variants.extend(response.variants)
+            if not response.next_page_token:
+                return variants
+            request["pageToken"] = response.next_page_token
+
+    def testParseRegions(self):
+        self.assertEqual(
+            self._backend._parseRegions(self.regions), self.mergedRegions)
+        self.assertEqual(
+            self._backend._parseRegions([
+                "track name=panel", "chr10:5-10", "chr2:20-30",
+                "chr2:0-20\n"]),
+            [("chr2", 0, 30), ("chr10", 5, 10)])
+        for regions in [[], ["1:10-5"], ["1:-1-5"], ["1"], ["1\t5"]]:
+            with self.assertRaises(exceptions.BadSearchOptionException):
+                self._backend._parseRegions(regions)
+
+    def testVariantsInRegions(self):
+        expected = []
+        variantIds = set()
+        for referenceName, start, end in self.mergedRegions:
+            for variant in self._variantSet.getVariants(
+                    referenceName, start, end):
+                if variant.id not in variantIds:
+                    variantIds.add(variant.id)
+                    expected.append(variant)
+        self.assertGreater(len(expected), 10)
+        for pageSize in [100, 3, 1]:
+            self.assertEqual(
+                self.searchVariants(pageSize, self.regions), expected)
+
+    def testBadPageToken(self):
+        request = {
+            "variantSetId": self._variantSet.getId(),
+            "regions": self.regions, "pageToken": "6:0:0"}
+        with self.assertRaises(exceptions.BadPageTokenException):
+            self._backend.runSearchVariantsInRegions(json.dumps(request))
+
+
 class TestPrivateBackendMethods(unittest.TestCase):
     """
     keep tests of private backend methods here and not in one of the
@@ -240,3 +489,66 @@ class TestPrivateBackendMethods(unittest.TestCase):
         for key in bad:
             with self.assertRaises(exceptions.BadRequestIntegerException):
                 paging._parseIntegerArgument(bad, key, 0)
+
+
+class TestBackendBatchGet(unittest.TestCase):
+    """
+    Tests getting lists of objects by their IDs
+    """
+    def setUp(self):
+        dataRepo = datarepo.SqlDataRepository(paths.testDataRepo)
+        dataRepo.open(datarepo.MODE_READ)
+        self._backend = backend.Backend(dataRepo)
+        self._variantSet = next(dataRepo.allVariantSets())
+
+    def batchGet(self, runBatchGet, ids):
+        return json.loads(runBatchGet(json.dumps({"ids": ids})))
+
+    def testBatchGetVariants(self):
+        variants = []
+        for referenceName in ["3", "1", "2"]:
+            variants.extend(list(self._variantSet.getVariants(
+                referenceName, 0, 2**32))[::7])
+        variants.append(variants[0])
+        missingId = str(datamodel.VariantCompoundId(
+            self._variantSet.getCompoundId(), "1", str(variants[0].start),
+            "0" * 32))
+        unknownSetId = str(datamodel.VariantCompoundId(
+            datamodel.VariantSetCompoundId(
+                self._variantSet.getParentContainer().getCompoundId(),
+                "notAVariantSet"), "1", "1", "0" * 32))
+        ids = (
+            [variants[0].id, missingId] +
+            [variant.id for variant in variants[1:]] +
+            ["notAnId", unknownSetId])
+        response = self.batchGet(self._backend.runBatchGetVariants, ids)
+        self.assertEqual(response["variants"], [
+            json.loads(self._backend.runGetVariant(variant.id))
+            for variant in variants])
+        self.assertEqual(
+            [(error["index"], error["id"]) for error in response["errors"]],
+            [(1, missingId), (len(ids) - 2, "notAnId"),
+             (len(ids) - 1, unknownSetId)])
+        self.assertEqual(
+            response["errors"][0]["errorCode"],
+            exceptions.ObjectWithIdNotFoundException.getErrorCode())
+
+    def testBatchGetCallSets(self):
+        callSets = self._variantSet.getCallSets()[::-1]
+        ids = [callSet.getId() for callSet in callSets]
+        response = self.batchGet(self._backend.runBatchGetCallSets, ids)
+        self.assertNotIn("errors", response)
+        self.assertEqual(
+            [callSet["id"] for callSet in response["callSets"]], ids)
+        missingId = str(datamodel.CallSetCompoundId(
+            self._variantSet.getCompoundId(), "notASample"))
+        response = self.batchGet(
+            self._backend.runBatchGetCallSets, [missingId, ids[0]])
+        self.assertEqual(len(response["callSets"]), 1)
+        self.assertEqual(response["errors"][0]["index"], 0)
+
+    def testTooManyIds(self):
+        self._backend.setMaxBatchGetIds(2)
+        with self.assertRaises(exceptions.BatchGetTooLargeException):
+            self._backend.runBatchGetVariants(
+                json.dumps({"ids": ["a", "b", "c"]}))
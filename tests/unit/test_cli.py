@@ -32,6 +32,18 @@ class TestServerArguments(unittest.TestCase):
         self.assertTrue(args.tls)
         self.assertTrue(args.dont_use_reloader)
 
+    def testParseWorkerArguments(self):
+        cliInput = """--workers 4 --threads 8 --max-requests 1000
+        --graceful-timeout 10"""
+        parser = cli_server.getServerParser()
+        args = parser.parse_args(cliInput.split())
+        self.assertEqual(args.workers, 4)
+        self.assertEqual(args.threads, 8)
+        self.assertEqual(args.max_requests, 1000)
+        self.assertEqual(args.graceful_timeout, 10)
+        args = parser.parse_args([])
+        self.assertEqual(args.workers, 0)
+
 
 class TestGa2VcfArguments(unittest.TestCase):
     """
@@ -300,6 +312,29 @@ class TestRepoManagerCli(unittest.TestCase):
         self.assertEquals(args.runner, "removeIndividual")
         self.assertEquals(args.force, False)
 
+    def testAddRnaQuantification(self):
+        cliInput = (
+            "add-rnaquantification {} quant1.tsv quant2.tsv rsem {} {} "
+            "--workers 4").format(
+            self.filePath, self.registryPath, self.datasetName)
+        args = self.parser.parse_args(cliInput.split())
+        self.assertEquals(args.filePath, self.filePath)
+        self.assertEquals(
+            args.quantificationFilePaths, ["quant1.tsv", "quant2.tsv"])
+        self.assertEquals(args.format, "rsem")
+        self.assertEquals(args.registryPath, self.registryPath)
+        self.assertEquals(args.datasetName, self.datasetName)
+        self.assertEquals(args.workers, 4)
+        self.assertEquals(args.runner, "addRnaQuantification")
+
+    def testIndexRnaQuantificationSet(self):
+        cliInput = "index-rnaquantificationset {} {}".format(
+            self.registryPath, self.filePath)
+        args = self.parser.parse_args(cliInput.split())
+        self.assertEquals(args.registryPath, self.registryPath)
+        self.assertEquals(args.filePath, self.filePath)
+        self.assertEquals(args.runner, "indexRnaQuantificationSet")
+
     def testAddPhenotypeAssociationSet(self):
         cliInput = "add-phenotypeassociationset {} {} {} -n NAME".format(
             self.registryPath,
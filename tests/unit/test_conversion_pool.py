@@ -0,0 +1,160 @@
+"""
+Tests for the pool of processes converting variants
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+import unittest
+
+import ga4gh.server.backend as backend
+import ga4gh.server.conversion_pool as conversion_pool
+import ga4gh.server.datarepo as datarepo
+import ga4gh.server.datamodel.tabix_index as tabix_index
+import ga4gh.server.response_builder as response_builder
+
+import tests.paths as paths
+
+import ga4gh.schemas.protocol as protocol
+
+
+class TestTabixIndex(unittest.TestCase):
+
+    def setUp(self):
+        self._index = tabix_index.TabixIndex(os.path.join(
+            paths.annotatedVcfPath, "chr1.edit.vcf.gz.tbi"))
+
+    def testBlockBoundaries(self):
+        boundaries = self._index.getBlockBoundaries("1", 0, None)
+        self.assertGreater(len(boundaries), 0)
+        self.assertEqual(boundaries, sorted(boundaries))
+        for boundary in boundaries:
+            self.assertEqual(boundary % tabix_index.WINDOW_SIZE, 0)
+        self.assertEqual(
+            self._index.getBlockBoundaries("1", 0, boundaries[0]), [])
+        self.assertEqual(
+            self._index.getBlockBoundaries("1", boundaries[-1], None), [])
+        self.assertEqual(
+            self._index.getBlockBoundaries("1", 0, None, 2**30), [])
+        self.assertEqual(self._index.getBlockBoundaries("2", 0, None), [])
+
+
+class TestConvertedValues(unittest.TestCase):
+
+    def testMixedValues(self):
+        variants = []
+        for start in range(3):
+            variant = protocol.Variant()
+            variant.start = start
+            variants.append(variant)
+        builder = response_builder.SearchResponseBuilder(
+            protocol.SearchVariantsResponse, 10, 2**20)
+        builder.addValue(variants[0])
+        builder.addValue(response_builder.ConvertedValue(
+            protocol.json_format.MessageToDict(variants[1], False),
+            variants[1].ByteSize()))
+        builder.addValue(variants[2])
+        builder.setNextPageToken("token")
+        response = protocol.SearchVariantsResponse()
+        response.variants.extend(variants)
+        response.next_page_token = "token"
+        self.assertEqual(
+            json.loads(builder.getSerializedResponse()),
+            json.loads(protocol.toJson(response)))
+
+
+class TestConversionPool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls._dataRepo = datarepo.SqlDataRepository(paths.testDataRepo)
+        cls._dataRepo.open(datarepo.MODE_READ)
+        cls._variantSet = None
+        for variantSet in cls._dataRepo.allVariantSets():
+            if len(variantSet.getBlockBoundaries("1", 0, None)) > 0:
+                cls._variantSet = variantSet
+        cls._pool = conversion_pool.ConversionPool(2, 2, minBytes=0)
+        cls._pool.start(cls._dataRepo)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._pool.close()
+
+    def setUp(self):
+        self._backend = backend.Backend(self._dataRepo)
+
+    def searchVariants(self, pageSize):
+        variants = []
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self._variantSet.getId()
+        request.reference_name = "1"
+        request.end = 2**32
+        request.page_size = pageSize
+        while True:
+            response = json.loads(self._backend.runSearchRequest(
+                protocol.toJson(request), protocol.SearchVariantsRequest,
+                protocol.SearchVariantsResponse,
+                self._backend.variantsGenerator))
+            variants.extend(response.get("variants", []))
+            if not response.get("nextPageToken"):
+                return variants
+            request.page_token = response["nextPageToken"]
+
+    def testSameVariants(self):
+        expected = self.searchVariants(1000)
+        self.assertGreater(len(expected), 0)
+        self._backend.setConversionPool(self._pool)
+        for pageSize in [1000, 30]:
+            self.assertEqual(self.searchVariants(pageSize), expected)
+
+    def searchVariantsInRegions(self, pageSize, regions):
+        variants = []
+        request = {
+            "variantSetId": self._variantSet.getId(),
+            "pageSize": pageSize, "regions": regions}
+        while True:
+            response = json.loads(self._backend.runSearchVariantsInRegions(
+                json.dumps(request)))
+            variants.extend(response.get("variants", []))
+            if not response.get("nextPageToken"):
+                return variants
+            request["pageToken"] = response["nextPageToken"]
+
+    def testSameVariantsInRegions(self):
+        regions = [
+            "1:{}-{}".format(variant["start"], int(variant["start"]) + 1)
+            for variant in self.searchVariants(1000)[::5]]
+        expected = self.searchVariantsInRegions(1000, regions)
+        self.assertGreater(len(expected), 0)
+        self._backend.setConversionPool(self._pool)
+        for pageSize in [1000, 7]:
+            self.assertEqual(
+                self.searchVariantsInRegions(pageSize, regions), expected)
+
+    def testStaleRepository(self):
+        conversion_pool._dataRepository = self._dataRepo
+        try:
+            self.assertIsNone(conversion_pool._convertVariants(
+                "unknown", self._variantSet.getId(), "1", 0, None, [],
+                None, None))
+        finally:
+            conversion_pool._dataRepository = None
+
+    def testUnversionedRepository(self):
+        variantSet = self._pool.getVariantSet(
+            datarepo.AbstractDataRepository(), self._variantSet)
+        self.assertIs(variantSet, self._variantSet)
+
+    def testUnstartedPool(self):
+        pool = conversion_pool.ConversionPool(2, 2, minBytes=0)
+        self.assertIs(
+            pool.getVariantSet(self._dataRepo, self._variantSet),
+            self._variantSet)
+
+    def testBadArguments(self):
+        with self.assertRaises(ValueError):
+            conversion_pool.ConversionPool(0)
+        with self.assertRaises(ValueError):
+            conversion_pool.ConversionPool(1, parallelism=0)
@@ -6,11 +6,15 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import os
+import shutil
 import tempfile
 import unittest
 
 import ga4gh.server.datarepo as datarepo
+import ga4gh.server.datamodel.datasets as datasets
 import ga4gh.server.exceptions as exceptions
+import ga4gh.schemas.protocol as protocol
+import tests.paths as paths
 
 
 prefix = "ga4gh_datarepo_test"
@@ -92,3 +96,332 @@ class TestBadDatabaseNoSetup(unittest.TestCase):
         repo = datarepo.SqlDataRepository("aFilePathThatDoesNotExist")
         with self.assertRaises(exceptions.RepoNotFoundException):
             repo.open(datarepo.MODE_READ)
+
+
+class TestObjectCache(unittest.TestCase):
+    """
+    Tests the bounded cache of repository objects
+    """
+    def testEviction(self):
+        cache = datarepo.ObjectCache(2)
+        created = []
+
+        def createMethod(key):
+            def create():
+                created.append(key)
+                return object()
+            return create
+        first = cache.getObject("a", createMethod("a"))
+        cache.getObject("b", createMethod("b"))
+        self.assertIs(cache.getObject("a", createMethod("a")), first)
+        cache.getObject("c", createMethod("c"))
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.getObject("a", createMethod("a")), first)
+        cache.getObject("b", createMethod("b"))
+        self.assertEqual(created, ["a", "b", "c", "b"])
+
+    def testBadSize(self):
+        with self.assertRaises(ValueError):
+            datarepo.ObjectCache(0)
+
+
+class TestLazyDataRepository(unittest.TestCase):
+    """
+    Tests that the lazy repository reads the same objects as the repository
+    loaded into memory
+    """
+    def setUp(self):
+        self._eagerRepo = datarepo.SqlDataRepository(paths.testDataRepo)
+        self._eagerRepo.open(datarepo.MODE_READ)
+        self._lazyRepo = datarepo.LazySqlDataRepository(
+            paths.testDataRepo, cacheSize=2)
+        self._lazyRepo.open(datarepo.MODE_READ)
+
+    def assertSameObjects(self, objects, otherObjects):
+        self.assertEqual(
+            [object_.getId() for object_ in objects],
+            [object_.getId() for object_ in otherObjects])
+
+    def testCounts(self):
+        self.assertEqual(
+            self._lazyRepo.getNumDatasets(),
+            self._eagerRepo.getNumDatasets())
+        self.assertEqual(
+            self._lazyRepo.getNumReferenceSets(),
+            self._eagerRepo.getNumReferenceSets())
+        for dataset in self._eagerRepo.getDatasets():
+            lazyDataset = self._lazyRepo.getDataset(dataset.getId())
+            self.assertEqual(
+                lazyDataset.getNumVariantSets(), dataset.getNumVariantSets())
+
+    def testTopLevelObjects(self):
+        self.assertSameObjects(
+            self._lazyRepo.getDatasets(), self._eagerRepo.getDatasets())
+        self.assertSameObjects(
+            self._lazyRepo.getReferenceSets(),
+            self._eagerRepo.getReferenceSets())
+        self.assertSameObjects(
+            self._lazyRepo.getOntologys(), self._eagerRepo.getOntologys())
+        for index in range(self._eagerRepo.getNumDatasets()):
+            dataset = self._eagerRepo.getDatasetByIndex(index)
+            self.assertEqual(
+                self._lazyRepo.getDatasetByIndex(index).toProtocolElement(),
+                dataset.toProtocolElement())
+            self.assertEqual(
+                self._lazyRepo.getDatasetByName(
+                    dataset.getLocalId()).getId(),
+                dataset.getId())
+        for index in range(self._eagerRepo.getNumReferenceSets()):
+            referenceSet = self._eagerRepo.getReferenceSetByIndex(index)
+            lazyReferenceSet = self._lazyRepo.getReferenceSetByIndex(index)
+            self.assertEqual(
+                lazyReferenceSet.toProtocolElement(),
+                referenceSet.toProtocolElement())
+            self.assertSameObjects(
+                lazyReferenceSet.getReferences(),
+                referenceSet.getReferences())
+
+    def testDatasetContents(self):
+        for dataset in self._eagerRepo.getDatasets():
+            lazyDataset = self._lazyRepo.getDataset(dataset.getId())
+            self.assertSameObjects(
+                lazyDataset.getVariantSets(), dataset.getVariantSets())
+            for index, variantSet in enumerate(dataset.getVariantSets()):
+                lazyVariantSet = lazyDataset.getVariantSetByIndex(index)
+                self.assertEqual(
+                    lazyVariantSet.toProtocolElement(),
+                    variantSet.toProtocolElement())
+                self.assertSameObjects(
+                    lazyVariantSet.getCallSets(), variantSet.getCallSets())
+                self.assertSameObjects(
+                    lazyVariantSet.getVariantAnnotationSets(),
+                    variantSet.getVariantAnnotationSets())
+                self.assertEqual(
+                    lazyDataset.getVariantSetByName(
+                        variantSet.getLocalId()).getId(),
+                    variantSet.getId())
+                self.assertEqual(
+                    self._lazyRepo.getVariantSet(variantSet.getId()).getId(),
+                    variantSet.getId())
+            self.assertSameObjects(
+                lazyDataset.getReadGroupSets(), dataset.getReadGroupSets())
+            self.assertSameObjects(
+                lazyDataset.getFeatureSets(), dataset.getFeatureSets())
+            self.assertSameObjects(
+                lazyDataset.getBiosamples(), dataset.getBiosamples())
+            self.assertSameObjects(
+                lazyDataset.getIndividuals(), dataset.getIndividuals())
+            self.assertSameObjects(
+                lazyDataset.getPhenotypeAssociationSets(),
+                dataset.getPhenotypeAssociationSets())
+            self.assertSameObjects(
+                lazyDataset.getRnaQuantificationSets(),
+                dataset.getRnaQuantificationSets())
+
+    def testCachedObjects(self):
+        dataset = self._lazyRepo.getDatasetByIndex(0)
+        self.assertIs(self._lazyRepo.getDataset(dataset.getId()), dataset)
+        variantSet = dataset.getVariantSetByIndex(0)
+        self.assertIs(
+            dataset.getVariantSet(variantSet.getId()), variantSet)
+        # The cache holds two objects, so the dataset is read again after
+        # two other objects have been used.
+        self._lazyRepo.getReferenceSetByIndex(0)
+        self._lazyRepo.getOntologys()
+        otherDataset = self._lazyRepo.getDataset(dataset.getId())
+        self.assertIsNot(otherDataset, dataset)
+        self.assertEqual(otherDataset.getId(), dataset.getId())
+
+    def testNotFound(self):
+        dataset = self._lazyRepo.getDatasetByIndex(0)
+        with self.assertRaises(exceptions.DatasetNotFoundException):
+            self._lazyRepo.getDataset("notADataset")
+        with self.assertRaises(exceptions.DatasetNameNotFoundException):
+            self._lazyRepo.getDatasetByName("notADataset")
+        with self.assertRaises(exceptions.ReferenceSetNotFoundException):
+            self._lazyRepo.getReferenceSet("notAReferenceSet")
+        with self.assertRaises(
+                exceptions.ReferenceSetNameNotFoundException):
+            self._lazyRepo.getReferenceSetByName("notAReferenceSet")
+        with self.assertRaises(exceptions.OntologyNotFoundException):
+            self._lazyRepo.getOntology("notAnOntology")
+        with self.assertRaises(exceptions.OntologyNameNotFoundException):
+            self._lazyRepo.getOntologyByName("notAnOntology")
+        with self.assertRaises(exceptions.VariantSetNotFoundException):
+            dataset.getVariantSet("notAVariantSet")
+        with self.assertRaises(exceptions.VariantSetNameNotFoundException):
+            dataset.getVariantSetByName("notAVariantSet")
+        with self.assertRaises(IndexError):
+            self._lazyRepo.getDatasetByIndex(
+                self._lazyRepo.getNumDatasets())
+
+
+class TestRepoSnapshot(unittest.TestCase):
+    """
+    Tests that a repository loaded from its snapshot holds the same
+    objects as one loaded from its database
+    """
+    def setUp(self):
+        self._tempDir = makeTempDir()
+        self._repoPath = os.path.join(self._tempDir, "registry.db")
+        shutil.copy2(paths.testDataRepo, self._repoPath)
+        self._repo = datarepo.SqlDataRepository(self._repoPath)
+        self._repo.open(datarepo.MODE_READ)
+
+    def tearDown(self):
+        shutil.rmtree(self._tempDir)
+
+    def readSnapshotRepo(self):
+        self._repo.writeSnapshot()
+        repo = datarepo.SqlDataRepository(self._repoPath)
+        self.assertTrue(repo.isSnapshotCurrent())
+        repo.open(datarepo.MODE_READ)
+        return repo
+
+    def testSameObjects(self):
+        repo = self.readSnapshotRepo()
+        self.assertEqual(
+            [dataset.toProtocolElement() for dataset in repo.getDatasets()],
+            [dataset.toProtocolElement()
+             for dataset in self._repo.getDatasets()])
+        self.assertEqual(
+            [referenceSet.toProtocolElement()
+             for referenceSet in repo.getReferenceSets()],
+            [referenceSet.toProtocolElement()
+             for referenceSet in self._repo.getReferenceSets()])
+        self.assertEqual(
+            [ontology.getId() for ontology in repo.getOntologys()],
+            [ontology.getId() for ontology in self._repo.getOntologys()])
+        for variantSet in self._repo.allVariantSets():
+            otherVariantSet = repo.getVariantSet(variantSet.getId())
+            self.assertEqual(
+                otherVariantSet.toProtocolElement(),
+                variantSet.toProtocolElement())
+            self.assertEqual(
+                [callSet.getId() for callSet in otherVariantSet.getCallSets()],
+                [callSet.getId() for callSet in variantSet.getCallSets()])
+
+    def testSharedObjects(self):
+        repo = self.readSnapshotRepo()
+        for featureSet in repo.allFeatureSets():
+            self.assertIs(
+                featureSet.getOntology(),
+                repo.getOntology(featureSet.getOntology().getId()))
+        for variantSet in repo.allVariantSets():
+            self.assertIs(
+                variantSet.getReferenceSet(),
+                repo.getReferenceSet(variantSet.getReferenceSet().getId()))
+
+    def testSearches(self):
+        repo = self.readSnapshotRepo()
+        variantSet = next(self._repo.allVariantSets())
+        otherVariantSet = repo.getVariantSet(variantSet.getId())
+        referenceName = variantSet.getReferenceToDataUrlIndexMap().keys()[0]
+        self.assertEqual(
+            [protocol.toJson(variant) for variant in
+             otherVariantSet.getVariants(referenceName, 0, 2**32)],
+            [protocol.toJson(variant) for variant in
+             variantSet.getVariants(referenceName, 0, 2**32)])
+        for associationSet in repo.allPhenotypeAssociationSets():
+            self.assertGreater(len(associationSet._rdfGraph), 0)
+
+    def testChangedRepo(self):
+        self._repo.writeSnapshot()
+        self.assertTrue(self._repo.isSnapshotCurrent())
+        stat = os.stat(self._repoPath)
+        os.utime(self._repoPath, (stat.st_atime, stat.st_mtime + 1))
+        self.assertFalse(self._repo.isSnapshotCurrent())
+
+    def testDamagedSnapshot(self):
+        with open(self._repo.getSnapshotPath(), "wb") as snapshotFile:
+            snapshotFile.write(b"This is not a snapshot")
+        self.assertFalse(self._repo.isSnapshotCurrent())
+        repo = datarepo.SqlDataRepository(self._repoPath)
+        repo.open(datarepo.MODE_READ)
+        self.assertEqual(
+            repo.getNumDatasets(), self._repo.getNumDatasets())
+
+
+class TestRepoReload(unittest.TestCase):
+    """
+    Tests that a repository is reloaded when it changes, reusing the
+    objects which have not changed
+    """
+    def setUp(self):
+        self._tempDir = makeTempDir()
+        self._repoPath = os.path.join(self._tempDir, "registry.db")
+        shutil.copy2(paths.testDataRepo, self._repoPath)
+        self._repo = datarepo.SqlDataRepository(self._repoPath)
+        self._repo.open(datarepo.MODE_READ)
+
+    def tearDown(self):
+        shutil.rmtree(self._tempDir)
+
+    def updateRepo(self, func):
+        repo = datarepo.SqlDataRepository(self._repoPath)
+        repo.open(datarepo.MODE_WRITE)
+        func(repo)
+        repo.commit()
+        repo.close()
+
+    def testUnchanged(self):
+        self.assertFalse(self._repo.hasChanged())
+
+    def testAddDataset(self):
+        self.updateRepo(lambda repo: repo.insertDataset(
+            datasets.Dataset("newDataset")))
+        self.assertTrue(self._repo.hasChanged())
+        repo = self._repo.reload()
+        self.assertFalse(repo.hasChanged())
+        self.assertEqual(
+            repo.getNumDatasets(), self._repo.getNumDatasets() + 1)
+        self.assertEqual(
+            repo.getDatasetByName("newDataset").getLocalId(), "newDataset")
+        with self.assertRaises(exceptions.DatasetNameNotFoundException):
+            self._repo.getDatasetByName("newDataset")
+        # Unchanged objects are reused, and containers are new.
+        for ontology in self._repo.getOntologys():
+            self.assertIs(repo.getOntology(ontology.getId()), ontology)
+        for dataset in self._repo.getDatasets():
+            otherDataset = repo.getDataset(dataset.getId())
+            self.assertIsNot(otherDataset, dataset)
+            for associationSet in dataset.getPhenotypeAssociationSets():
+                self.assertIs(
+                    otherDataset.getPhenotypeAssociationSet(
+                        associationSet.getId()),
+                    associationSet)
+        for variantSet in self._repo.allVariantSets():
+            otherVariantSet = repo.getVariantSet(variantSet.getId())
+            for callSet in variantSet.getCallSets():
+                self.assertIs(
+                    otherVariantSet.getCallSet(callSet.getId()), callSet)
+
+    def testRemoveVariantSet(self):
+        variantSet = next(self._repo.allVariantSets())
+        self.updateRepo(lambda repo: repo.removeVariantSet(variantSet))
+        repo = self._repo.reload()
+        dataset = repo.getDataset(variantSet.getParentContainer().getId())
+        with self.assertRaises(exceptions.VariantSetNotFoundException):
+            dataset.getVariantSet(variantSet.getId())
+        self.assertEqual(
+            dataset.getNumVariantSets(),
+            variantSet.getParentContainer().getNumVariantSets() - 1)
+
+    def testChangedRecord(self):
+        dataset = self._repo.getDatasetByIndex(0)
+
+        def updateDataset(repo):
+            query = datarepo.m.Dataset.update(
+                description="changed").where(
+                datarepo.m.Dataset.id == dataset.getId())
+            query.execute()
+        self.updateRepo(updateDataset)
+        repo = self._repo.reload()
+        otherDataset = repo.getDataset(dataset.getId())
+        self.assertEqual(otherDataset.getDescription(), "changed")
+        # The objects in the changed dataset are created afresh.
+        for associationSet in dataset.getPhenotypeAssociationSets():
+            self.assertIsNot(
+                otherDataset.getPhenotypeAssociationSet(
+                    associationSet.getId()),
+                associationSet)
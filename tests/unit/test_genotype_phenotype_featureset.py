@@ -0,0 +1,50 @@
+"""
+Tests the location index of phenotype association feature sets
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import unittest
+
+import ga4gh.server.datamodel.genotype_phenotype_featureset as \
+    genotype_phenotype_featureset
+
+
+class TestNestedContainmentList(unittest.TestCase):
+
+    def search(self, intervals, start, end):
+        intervals = sorted(intervals)
+        begins = [begin for begin, _ in intervals]
+        ends = [end_ for _, end_ in intervals]
+        nestedList = genotype_phenotype_featureset._buildNestedList(
+            begins, ends)
+        indexes = genotype_phenotype_featureset._searchNestedList(
+            nestedList, start, end)
+        self.assertEqual(len(indexes), len(set(indexes)))
+        return sorted(intervals[index] for index in indexes)
+
+    def testOverlaps(self):
+        intervals = [(0, 100), (10, 20), (10, 20), (15, 30), (50, 50)]
+        self.assertEqual(
+            self.search(intervals, 20, 50),
+            [(0, 100), (10, 20), (10, 20), (15, 30), (50, 50)])
+        self.assertEqual(self.search(intervals, 21, 49), [(0, 100), (15, 30)])
+        self.assertEqual(self.search(intervals, 50, 50), [(0, 100), (50, 50)])
+        self.assertEqual(self.search(intervals, 101, None), [])
+        self.assertEqual(self.search([], 0, None), [])
+
+    def testRandomIntervals(self):
+        rng = random.Random(1)
+        intervals = []
+        for _ in range(300):
+            begin = rng.randint(0, 1000)
+            intervals.append((begin, begin + rng.choice([0, 5, 50, 2000])))
+        for _ in range(100):
+            start = rng.randint(0, 1100)
+            end = rng.choice([None, start + rng.randint(0, 100)])
+            expected = sorted(
+                (begin, end_) for begin, end_ in intervals
+                if end_ >= start and (end is None or begin <= end))
+            self.assertEqual(self.search(intervals, start, end), expected)
@@ -165,13 +165,16 @@ class ImportGraphLayerChecker(object):
         ],
         'frontend': [
             'ga4gh/server/frontend.py',
+            'ga4gh/server/prefork.py',
             'ga4gh/server/repo_manager.py',
         ],
         'backend': [
             'ga4gh/server/backend.py',
+            'ga4gh/server/conversion_pool.py',
             'ga4gh/server/datarepo.py',
             'ga4gh/server/paging.py',
             'ga4gh/server/response_builder.py',
+            'ga4gh/server/response_cache.py',
         ],
         'exceptions': [
             'ga4gh/server/exceptions.py',
@@ -182,11 +185,14 @@ class ImportGraphLayerChecker(object):
             'ga4gh/server/datamodel/references.py',
             'ga4gh/server/datamodel/rna_quantification.py',
             'ga4gh/server/datamodel/variants.py',
+            'ga4gh/server/datamodel/annotation_index.py',
+            'ga4gh/server/datamodel/tabix_index.py',
             'ga4gh/server/datamodel/datasets.py',
             'ga4gh/server/datamodel/ontologies.py',
             'ga4gh/server/datamodel/obo_parser.py',
             'ga4gh/server/datamodel/sequence_annotations.py',
             'ga4gh/server/datamodel/genotype_phenotype.py',
+            'ga4gh/server/datamodel/g2p_snapshot.py',
             'ga4gh/server/datamodel/genotype_phenotype_featureset.py',
             'ga4gh/server/gff3.py',
             'ga4gh/server/sqlite_backend.py',
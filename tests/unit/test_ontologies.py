@@ -0,0 +1,51 @@
+"""
+Tests the is_a closure of ontologies
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import unittest
+
+import ga4gh.server.datamodel.ontologies as ontologies
+
+
+class TestAncestorMasks(unittest.TestCase):
+
+    def makeOntology(self, parentIdMap):
+        ontology = ontologies.Ontology("test")
+        ontology._parentIdMap = parentIdMap
+        return ontology
+
+    def getAncestors(self, parentIdMap, termId):
+        ancestors = set([termId])
+        for parentId in parentIdMap[termId]:
+            ancestors |= self.getAncestors(parentIdMap, parentId)
+        return ancestors
+
+    def assertClosure(self, parentIdMap):
+        ontology = self.makeOntology(parentIdMap)
+        for termId in parentIdMap:
+            self.assertEqual(
+                ontology.getAncestorMask(termId),
+                ontology.getTermMask(self.getAncestors(parentIdMap, termId)))
+
+    def testMultipleParents(self):
+        # T4 is pending on the stack when T3, through T1, reaches it.
+        self.assertClosure({
+            "T0": ["T4", "T1"], "T1": ["T3"], "T3": ["T4"], "T4": []})
+
+    def testRandomHierarchies(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            numTerms = rng.randint(1, 10)
+            termIds = ["T{}".format(index) for index in range(numTerms)]
+            order = list(termIds)
+            rng.shuffle(order)
+            # Parents come later in the order, so there are no cycles.
+            self.assertClosure(dict(
+                (termId, rng.sample(
+                    order[index + 1:], min(rng.randint(0, 3),
+                                           len(order) - index - 1)))
+                for index, termId in enumerate(order)))
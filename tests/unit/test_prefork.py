@@ -0,0 +1,136 @@
+"""
+Tests for the pre-forking server
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import os
+import signal
+import socket
+import tempfile
+import time
+import unittest
+
+import requests
+
+import ga4gh.server.prefork as prefork
+
+
+def _pidApp(environ, startResponse):
+    startResponse(b"200 OK", [(b"Content-Type", b"text/plain")])
+    return [str(os.getpid()).encode()]
+
+
+# The process IDs recorded by the worker start hook
+_startedPids = [0]
+
+
+def _startedApp(environ, startResponse):
+    startResponse(b"200 OK", [(b"Content-Type", b"text/plain")])
+    return [str(_startedPids[-1]).encode()]
+
+
+def _workerStart():
+    _startedPids.append(os.getpid())
+
+
+def _getFreePort():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class TestPreforkServer(unittest.TestCase):
+
+    def startServer(self, **kwargs):
+        self.port = _getFreePort()
+        self.masterPid = os.fork()
+        if self.masterPid == 0:
+            try:
+                logging.getLogger("werkzeug").setLevel(logging.WARNING)
+                app = kwargs.pop("app", _pidApp)
+                server = prefork.PreforkServer(
+                    app, port=self.port, gracefulTimeout=5, **kwargs)
+                server.serveForever()
+            finally:
+                os._exit(0)
+        deadline = time.time() + 10
+        while True:
+            try:
+                return self.getWorkerPid()
+            except requests.ConnectionError:
+                self.assertLess(time.time(), deadline)
+                time.sleep(0.1)
+
+    def stopServer(self):
+        if self.masterPid is not None:
+            os.kill(self.masterPid, signal.SIGTERM)
+            _, status = os.waitpid(self.masterPid, 0)
+            self.masterPid = None
+            return status
+
+    def setUp(self):
+        self.masterPid = None
+
+    def tearDown(self):
+        self.stopServer()
+
+    def getWorkerPid(self):
+        response = requests.get("http://127.0.0.1:{}/".format(self.port))
+        self.assertEqual(response.status_code, 200)
+        return int(response.text)
+
+    def testWorkers(self):
+        self.startServer(workers=2)
+        pids = set(self.getWorkerPid() for _ in range(10))
+        self.assertLessEqual(len(pids), 2)
+        self.assertNotIn(self.masterPid, pids)
+        self.assertNotIn(os.getpid(), pids)
+
+    def testMaxRequests(self):
+        pids = [self.startServer(workers=1, maxRequests=2)]
+        pids.extend(self.getWorkerPid() for _ in range(3))
+        self.assertEqual(pids[0], pids[1])
+        self.assertEqual(pids[2], pids[3])
+        self.assertNotEqual(pids[1], pids[2])
+
+    def testGracefulRestart(self):
+        self.startServer(workers=1)
+        oldPid = self.getWorkerPid()
+        os.kill(self.masterPid, signal.SIGHUP)
+        deadline = time.time() + 10
+        while self.getWorkerPid() == oldPid:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.1)
+
+    def testStop(self):
+        self.startServer(workers=2)
+        self.assertEqual(self.stopServer(), 0)
+        with self.assertRaises(requests.ConnectionError):
+            self.getWorkerPid()
+
+    def testWorkerHooks(self):
+        stopFile = tempfile.NamedTemporaryFile()
+
+        def workerStop():
+            with open(stopFile.name, "w") as stopped:
+                stopped.write(str(os.getpid()))
+        startedPid = self.startServer(
+            workers=1, app=_startedApp, workerStart=_workerStart,
+            workerStop=workerStop)
+        self.assertNotIn(startedPid, [0, self.masterPid])
+        self.stopServer()
+        with open(stopFile.name) as stopped:
+            self.assertEqual(int(stopped.read()), startedPid)
+
+    def testBadArguments(self):
+        with self.assertRaises(ValueError):
+            prefork.PreforkServer(_pidApp, workers=0)
+        with self.assertRaises(ValueError):
+            prefork.PreforkServer(_pidApp, threads=0)
+        with self.assertRaises(ValueError):
+            prefork.PreforkServer(_pidApp, maxRequests=-1)
@@ -0,0 +1,69 @@
+"""
+Tests the iterator which reads search results ahead in the background
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import threading
+import unittest
+
+import ga4gh.server.paging as paging
+
+
+class TestReadAheadIterator(unittest.TestCase):
+
+    def setUp(self):
+        self._numRead = 0
+
+    def _generateValues(self, numValues, failAt=None):
+        for value in range(numValues):
+            if value == failAt:
+                raise ValueError(value)
+            self._numRead += 1
+            yield value
+
+    def testWithoutReadingAhead(self):
+        iterator = paging.ReadAheadIterator(self._generateValues(5), 2)
+        self.assertEqual(list(iterator), range(5))
+        self.assertEqual(list(iterator), [])
+
+    def testReadAhead(self):
+        iterator = paging.ReadAheadIterator(self._generateValues(100), 10)
+        iterator.start()
+        self.assertEqual(list(iterator), range(100))
+        iterator.stop()
+        self.assertEqual(list(iterator), [])
+
+    def testStopAndResume(self):
+        iterator = paging.ReadAheadIterator(self._generateValues(100), 10)
+        iterator.start()
+        values = [next(iterator) for _ in range(5)]
+        iterator.stop()
+        # At most the queue and the value being put are read ahead.
+        self.assertLessEqual(self._numRead, 5 + 10 + 1)
+        values.extend(next(iterator) for _ in range(20))
+        iterator.start()
+        values.extend(iterator)
+        iterator.stop()
+        self.assertEqual(values, range(100))
+
+    def testError(self):
+        iterator = paging.ReadAheadIterator(
+            self._generateValues(10, failAt=5), 10)
+        iterator.start()
+        self.assertEqual([next(iterator) for _ in range(5)], range(5))
+        self.assertRaises(ValueError, next, iterator)
+        iterator.stop()
+        self.assertRaises(StopIteration, next, iterator)
+
+    def testBackgroundThread(self):
+        threads = []
+
+        def generateValues():
+            threads.append(threading.current_thread())
+            yield 0
+        iterator = paging.ReadAheadIterator(generateValues(), 1)
+        iterator.start()
+        self.assertEqual(list(iterator), [0])
+        self.assertIsNot(threads[0], threading.current_thread())
@@ -8,6 +8,7 @@ from __future__ import unicode_literals
 import os
 import glob
 import shutil
+import sqlite3
 import tempfile
 import unittest
 
@@ -15,6 +16,8 @@ import ga4gh.server.exceptions as exceptions
 import ga4gh.server.datarepo as datarepo
 import ga4gh.server.cli.repomanager as cli_repomanager
 import ga4gh.server.datamodel as datamodel
+import ga4gh.server.datamodel.g2p_snapshot as g2p_snapshot
+import ga4gh.server.datamodel.rna_quantification as rna_quantification
 import tests.paths as paths
 
 
@@ -259,6 +262,22 @@ class TestAddPhenotypeAssociationSet(AbstractRepoManagerTest):
         with self.assertRaises(exceptions.RepoManagerException):
             self.addPhenotypeAssociationSet()
 
+    def testWritesSnapshot(self):
+        self.addDataset()
+        tempDir = tempfile.mkdtemp(prefix="ga4gh_repoman_test")
+        try:
+            dataDir = os.path.join(tempDir, "cgd")
+            shutil.copytree(paths.phenotypeAssociationSetPath, dataDir)
+            snapshotPath = g2p_snapshot.getSnapshotPath(dataDir)
+            if os.path.exists(snapshotPath):
+                os.unlink(snapshotPath)
+            self.runCommand("add-phenotypeassociationset {} {} {}".format(
+                self._repoPath, self._datasetName, dataDir))
+            self.assertTrue(g2p_snapshot.isSnapshotCurrent(
+                dataDir, ["*.ttl"]))
+        finally:
+            shutil.rmtree(tempDir)
+
 
 class TestRemovePhenotypeAssociationSet(AbstractRepoManagerTest):
 
@@ -354,6 +373,8 @@ class TestAddOntology(AbstractRepoManagerTest):
         ontology = repo.getOntologyByName(name)
         self.assertEqual(ontology.getName(), name)
         self.assertEqual(ontology.getDataUrl(), os.path.abspath(ontologyFile))
+        self.assertTrue(os.path.exists(ontology.getCachePath()))
+        self.assertTrue(ontology._readCache())
 
     def testWithName(self):
         ontologyFile = paths.ontologyPath
@@ -505,6 +526,45 @@ class TestVerify(AbstractRepoManagerTest):
         self.runCommand(cmd)
 
 
+class TestBuildSnapshot(AbstractRepoManagerTest):
+
+    def setUp(self):
+        super(TestBuildSnapshot, self).setUp()
+        self.init()
+        self.addDataset()
+        self.addOntology()
+        self.addReferenceSet()
+        self.addVariantSet()
+        self._snapshotPath = self._repoPath + datarepo.SNAPSHOT_SUFFIX
+
+    def tearDown(self):
+        super(TestBuildSnapshot, self).tearDown()
+        if os.path.exists(self._snapshotPath):
+            os.unlink(self._snapshotPath)
+
+    def testBuildSnapshot(self):
+        self.runCommand("build-snapshot {}".format(self._repoPath))
+        self.assertTrue(os.path.exists(self._snapshotPath))
+        repo = self.readRepo()
+        self.assertTrue(repo.isSnapshotCurrent())
+        dataset = repo.getDatasetByName(self._datasetName)
+        self.assertEqual(
+            dataset.getVariantSetByName(self._variantSetName).getLocalId(),
+            self._variantSetName)
+
+    def testChangedRepo(self):
+        self.runCommand("build-snapshot {}".format(self._repoPath))
+        stat = os.stat(self._repoPath)
+        self.addDataset("another_dataset")
+        # The change is found even if the modification time is unchanged.
+        os.utime(self._repoPath, (stat.st_atime, stat.st_mtime))
+        repo = self.readRepo()
+        self.assertFalse(repo.isSnapshotCurrent())
+        self.assertEqual(
+            repo.getDatasetByName("another_dataset").getLocalId(),
+            "another_dataset")
+
+
 class TestRemoveOntology(AbstractRepoManagerTest):
 
     def setUp(self):
@@ -934,3 +994,135 @@ class TestInvalidReadGroupSetIndexFile(AbstractRepoManagerTest):
     def testWrongIndexFile(self):
         indexPath = paths.bamIndexPath2  # incorrect index
         self._testWithIndexPath(indexPath)
+
+
+class TestRnaQuantificationSetIndexes(AbstractRepoManagerTest):
+
+    def setUp(self):
+        super(TestRnaQuantificationSetIndexes, self).setUp()
+        self._tempDir = tempfile.mkdtemp(prefix="ga4gh_repoman_test")
+        self._rnaDbPath = os.path.join(self._tempDir, "rnaseq.db")
+
+    def tearDown(self):
+        shutil.rmtree(self._tempDir)
+        super(TestRnaQuantificationSetIndexes, self).tearDown()
+
+    def _getIndexNames(self):
+        dbConn = sqlite3.connect(self._rnaDbPath)
+        try:
+            rows = dbConn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' "
+                "AND tbl_name = 'Expression'").fetchall()
+        finally:
+            dbConn.close()
+        return set(row[0] for row in rows)
+
+    def testAddRnaQuantification(self):
+        self.init()
+        self.addDataset()
+        self.runCommand("init-rnaquantificationset {} {}".format(
+            self._repoPath, self._rnaDbPath))
+        self.assertEqual(self._getIndexNames(), set())
+        quantificationPath = os.path.join(
+            paths.rnaQuantDir, "rsem_test_data.tsv")
+        self.runCommand("add-rnaquantification {} {} rsem {} {}".format(
+            self._rnaDbPath, quantificationPath, self._repoPath,
+            self._datasetName))
+        self.assertEqual(len(self._getIndexNames()), 2)
+        dbConn = sqlite3.connect(self._rnaDbPath)
+        try:
+            ids = [row[0] for row in dbConn.execute(
+                "SELECT id FROM Expression").fetchall()]
+        finally:
+            dbConn.close()
+        self.assertEqual(sorted(ids), [1, 2])
+        matrix = rna_quantification.ExpressionMatrix.fromFile(
+            self._rnaDbPath + rna_quantification.EXPRESSION_MATRIX_SUFFIX)
+        self.assertEqual(len(matrix.getFeatureIds()), 2)
+
+    def _getNumExpressions(self):
+        dbConn = sqlite3.connect(self._rnaDbPath)
+        try:
+            return dbConn.execute(
+                "SELECT COUNT(*) FROM Expression").fetchone()[0]
+        finally:
+            dbConn.close()
+
+    def testFailedAddKeepsIndexes(self):
+        self.init()
+        self.addDataset()
+        self.runCommand("init-rnaquantificationset {} {}".format(
+            self._repoPath, self._rnaDbPath))
+        badPath = os.path.join(self._tempDir, "bad.tsv")
+        with open(badPath, "w") as badFile:
+            badFile.write("notAColumn\n1\n")
+        addBadCommand = "add-rnaquantification {} {} rsem {} {}".format(
+            self._rnaDbPath, badPath, self._repoPath, self._datasetName)
+        with self.assertRaises(Exception):
+            self.runCommand(addBadCommand)
+        self.assertEqual(len(self._getIndexNames()), 2)
+        self.assertEqual(self._getNumExpressions(), 0)
+        self.runCommand("add-rnaquantification {} {} rsem {} {}".format(
+            self._rnaDbPath,
+            os.path.join(paths.rnaQuantDir, "rsem_test_data.tsv"),
+            self._repoPath, self._datasetName))
+        with self.assertRaises(Exception):
+            self.runCommand(addBadCommand)
+        self.assertEqual(len(self._getIndexNames()), 2)
+        self.assertEqual(self._getNumExpressions(), 2)
+
+    def testAddManyRnaQuantifications(self):
+        self.init()
+        self.addDataset()
+        self.runCommand("init-rnaquantificationset {} {}".format(
+            self._repoPath, self._rnaDbPath))
+        quantificationPaths = []
+        for name in ["quant1", "quant2", "quant3"]:
+            quantificationPath = os.path.join(self._tempDir, name + ".tsv")
+            shutil.copy(
+                os.path.join(paths.rnaQuantDir, "rsem_test_data.tsv"),
+                quantificationPath)
+            quantificationPaths.append(quantificationPath)
+        with self.assertRaises(exceptions.RepoManagerException):
+            self.runCommand(
+                "add-rnaquantification {} {} rsem {} {} -n name".format(
+                    self._rnaDbPath, " ".join(quantificationPaths),
+                    self._repoPath, self._datasetName))
+        self.runCommand(
+            "add-rnaquantification {} {} rsem {} {} --workers 2".format(
+                self._rnaDbPath, " ".join(quantificationPaths),
+                self._repoPath, self._datasetName))
+        self.assertEqual(len(self._getIndexNames()), 2)
+        dbConn = sqlite3.connect(self._rnaDbPath)
+        try:
+            quantificationIds = [row[0] for row in dbConn.execute(
+                "SELECT id FROM RnaQuantification").fetchall()]
+            counts = dict(dbConn.execute(
+                "SELECT rna_quantification_id, COUNT(*) FROM Expression "
+                "GROUP BY rna_quantification_id").fetchall())
+        finally:
+            dbConn.close()
+        self.assertEqual(
+            sorted(quantificationIds), ["quant1", "quant2", "quant3"])
+        self.assertEqual(counts, {"quant1": 2, "quant2": 2, "quant3": 2})
+
+    def testIndexExistingRnaQuantificationSet(self):
+        self.init()
+        shutil.copy(paths.rnaQuantificationSetDbPath, self._rnaDbPath)
+        self.assertEqual(self._getIndexNames(), set())
+        cmd = "index-rnaquantificationset {} {}".format(
+            self._repoPath, self._rnaDbPath)
+        self.runCommand(cmd)
+        indexNames = self._getIndexNames()
+        self.assertEqual(len(indexNames), 2)
+        self.assertTrue(os.path.exists(
+            self._rnaDbPath + rna_quantification.EXPRESSION_MATRIX_SUFFIX))
+        # Indexing is idempotent
+        self.runCommand(cmd)
+        self.assertEqual(self._getIndexNames(), indexNames)
+
+    def testIndexMissingRnaQuantificationSet(self):
+        self.init()
+        with self.assertRaises(exceptions.RepoManagerException):
+            self.runCommand("index-rnaquantificationset {} {}".format(
+                self._repoPath, self._rnaDbPath))
@@ -0,0 +1,140 @@
+"""
+Tests for the response caches
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import ga4gh.server.response_cache as response_cache
+
+
+class TestMakeKey(unittest.TestCase):
+
+    def testKeys(self):
+        key = response_cache.makeKey("a", b"b")
+        self.assertEqual(key, response_cache.makeKey("a", "b"))
+        self.assertNotEqual(key, response_cache.makeKey("ab"))
+        self.assertNotEqual(key, response_cache.makeKey("a", "b", ""))
+        self.assertNotEqual(key, response_cache.makeKey("b", "a"))
+
+
+class ResponseCacheTest(object):
+    """
+    Tests common to all the response caches, which make them with
+    makeCache(maxBytes, timeToLive).
+    """
+    def testGetAndSet(self):
+        cache = self.makeCache(100)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", "\u00e9response")
+        self.assertEqual(cache.get("a"), "\u00e9response")
+        cache.set("a", "another")
+        self.assertEqual(cache.get("a"), "another")
+        statistics = cache.getStatistics()
+        self.assertEqual(statistics["hits"], 2)
+        self.assertEqual(statistics["misses"], 1)
+        self.assertAlmostEqual(statistics["hitRate"], 2 / 3)
+        self.assertEqual(statistics["size"], len("another"))
+
+    def testBudget(self):
+        cache = self.makeCache(10)
+        cache.set("big", "x" * 11)
+        self.assertIsNone(cache.get("big"))
+        cache.set("a", "x" * 6)
+        time.sleep(0.01)
+        cache.set("b", "y" * 6)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), "y" * 6)
+        self.assertLessEqual(cache.getSize(), 10)
+
+    def testEncodedSize(self):
+        cache = self.makeCache(10)
+        # Six characters, but twelve bytes in UTF-8.
+        cache.set("a", "\u00e9" * 6)
+        self.assertIsNone(cache.get("a"))
+        cache.set("b", "\u00e9" * 5)
+        self.assertEqual(cache.get("b"), "\u00e9" * 5)
+        self.assertEqual(cache.getSize(), 10)
+
+    def testTimeToLive(self):
+        cache = self.makeCache(100, timeToLive=0.05)
+        cache.set("a", "response")
+        self.assertEqual(cache.get("a"), "response")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+
+    def testClear(self):
+        cache = self.makeCache(100)
+        cache.set("a", "response")
+        cache.clear()
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.getSize(), 0)
+
+
+class TestMemoryResponseCache(ResponseCacheTest, unittest.TestCase):
+
+    def makeCache(self, maxBytes, timeToLive=300):
+        return response_cache.MemoryResponseCache(maxBytes, timeToLive)
+
+    def testLeastRecentlyUsed(self):
+        cache = self.makeCache(10)
+        cache.set("a", "x" * 5)
+        cache.set("b", "y" * 5)
+        cache.get("a")
+        cache.set("c", "z" * 5)
+        self.assertEqual(cache.get("a"), "x" * 5)
+        self.assertIsNone(cache.get("b"))
+
+
+class TestFileSystemResponseCache(ResponseCacheTest, unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def makeCache(self, maxBytes, timeToLive=300):
+        return response_cache.FileSystemResponseCache(
+            os.path.join(self._directory, "cache"), maxBytes, timeToLive)
+
+    def testShared(self):
+        cache = self.makeCache(100)
+        cache.set("a", "response")
+        self.assertEqual(self.makeCache(100).get("a"), "response")
+
+
+class TestTieredResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+        self._memoryCache = response_cache.MemoryResponseCache(100)
+        self._fileCache = response_cache.FileSystemResponseCache(
+            self._directory, 100)
+        self._cache = response_cache.TieredResponseCache(
+            [self._memoryCache, self._fileCache])
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def testPromotion(self):
+        self._fileCache.set("a", "response")
+        self.assertEqual(self._cache.get("a"), "response")
+        self.assertEqual(self._memoryCache.get("a"), "response")
+        statistics = self._cache.getStatistics()
+        self.assertEqual(statistics["hits"], 1)
+        self.assertEqual(statistics["tiers"][0]["misses"], 1)
+        self.assertEqual(statistics["tiers"][1]["hits"], 1)
+
+    def testSetAndClear(self):
+        self._cache.set("a", "response")
+        self.assertEqual(self._memoryCache.get("a"), "response")
+        self.assertEqual(self._fileCache.get("a"), "response")
+        self._cache.clear()
+        self.assertIsNone(self._cache.get("a"))
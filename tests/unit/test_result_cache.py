@@ -0,0 +1,106 @@
+"""
+Tests the search result and continuation caches used for paging
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+import ga4gh.server.paging as paging
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self._cache = paging.ResultCache(maxSize=2, timeToLive=300)
+        self._searches = []
+
+    def _getResults(self, key):
+        def searchMethod():
+            self._searches.append(key)
+            return [key]
+        return self._cache.getResults(key, searchMethod)
+
+    def testGetResults(self):
+        self.assertEqual(self._getResults("a"), ["a"])
+        self.assertIs(self._getResults("a"), self._getResults("a"))
+        self.assertEqual(self._searches, ["a"])
+
+    def testLeastRecentlyUsedEvicted(self):
+        self._getResults("a")
+        self._getResults("b")
+        self._getResults("a")
+        self._getResults("c")
+        self._getResults("a")
+        self.assertEqual(self._searches, ["a", "b", "c"])
+        self._getResults("b")
+        self.assertEqual(self._searches, ["a", "b", "c", "b"])
+
+    def testExpiredEvicted(self):
+        self._cache.setTimeToLive(-1)
+        self._getResults("a")
+        self._getResults("a")
+        self.assertEqual(self._searches, ["a", "a"])
+
+    def testUsedExpiredEvicted(self):
+        self._getResults("a")
+        self._getResults("b")
+        # Using "a" makes it the most recently used, but it still expires
+        # before "b".
+        self._getResults("a")
+        self._cache._timestamps["a"] -= 250
+        self._cache._timestamps["b"] -= 100
+        self._cache.setTimeToLive(200)
+        self._cache.setMaxSize(2)
+        self.assertEqual(list(self._cache._entries), ["b"])
+
+    def testDisabled(self):
+        self._cache.setMaxSize(0)
+        self._getResults("a")
+        self._getResults("a")
+        self.assertEqual(self._searches, ["a", "a"])
+        self.assertRaises(ValueError, self._cache.setMaxSize, -1)
+
+    def testClear(self):
+        self._getResults("a")
+        self._cache.clear()
+        self._getResults("a")
+        self.assertEqual(self._searches, ["a", "a"])
+
+
+class TestContinuationCache(unittest.TestCase):
+
+    def setUp(self):
+        self._cache = paging.ContinuationCache(maxSize=2, timeToLive=300)
+
+    def testTake(self):
+        self.assertTrue(self._cache.isEnabled())
+        self._cache.put("a", 1)
+        self.assertEqual(self._cache.take("a"), 1)
+        self.assertIsNone(self._cache.take("a"))
+
+    def testLeastRecentlyUsedEvicted(self):
+        self._cache.put("a", 1)
+        self._cache.put("b", 2)
+        self._cache.put("c", 3)
+        self.assertIsNone(self._cache.take("a"))
+        self.assertEqual(self._cache.take("b"), 2)
+        self.assertEqual(self._cache.take("c"), 3)
+
+    def testExpiredEvicted(self):
+        self._cache.setTimeToLive(-1)
+        self._cache.put("a", 1)
+        self.assertIsNone(self._cache.take("a"))
+
+    def testDisabled(self):
+        self._cache.setMaxSize(0)
+        self.assertFalse(self._cache.isEnabled())
+        self._cache.put("a", 1)
+        self.assertIsNone(self._cache.take("a"))
+        self.assertRaises(ValueError, self._cache.setMaxSize, -1)
+
+    def testClear(self):
+        self._cache.put("a", 1)
+        self._cache.clear()
+        self.assertIsNone(self._cache.take("a"))
@@ -589,6 +589,95 @@ class TestSimulatedStack(unittest.TestCase):
         # TODO: Add more useful test scenarios, including some covering
         # pagination behavior.
 
+    def testVariantsInRegions(self):
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self.variantSet.getId()
+        request.reference_name = '1'
+        request.end = 2 ** 5
+        expected = self.sendSearchRequest(
+            '/variants/search', request,
+            protocol.SearchVariantsResponse).variants
+        self.assertGreater(len(expected), 0)
+        path = '/variants/regions/search'
+        requestData = {
+            "variantSetId": self.variantSet.getId(),
+            "regions": ["1:16-32", "1\t0\t16"]}
+        response = self.sendJsonPostRequest(path, json.dumps(requestData))
+        self.assertEqual(200, response.status_code)
+        responseData = protocol.fromJson(
+            response.data, protocol.SearchVariantsResponse)
+        self.assertEqual(list(responseData.variants), list(expected))
+        requestData["regions"] = ["1:32-16"]
+        response = self.sendJsonPostRequest(path, json.dumps(requestData))
+        self.assertEqual(400, response.status_code)
+
+    def testBatchGetVariantsAndCallSets(self):
+        variants = list(self.variantSet.getVariants('1', 0, 2 ** 5))[::-1]
+        callSetIds = [
+            callSet.getId() for callSet in self.variantSet.getCallSets()]
+        self.assertGreater(len(variants), 0)
+        for path, ids, key in [
+                ('/variants/batchget', [variant.id for variant in variants],
+                 "variants"),
+                ('/callsets/batchget', callSetIds, "callSets")]:
+            response = self.sendJsonPostRequest(
+                path, json.dumps({"ids": ids + ["notAnId"]}))
+            self.assertEqual(200, response.status_code)
+            responseData = json.loads(response.data)
+            self.assertEqual([obj["id"] for obj in responseData[key]], ids)
+            self.assertEqual(
+                [(error["index"], error["id"])
+                 for error in responseData["errors"]],
+                [(len(ids), "notAnId")])
+
+    def testVariantSummaries(self):
+        request = protocol.SearchVariantsRequest()
+        request.reference_name = '1'
+        request.start = 0
+        request.end = 2 ** 5
+        request.variant_set_id = self.variantSet.getId()
+        request.call_set_ids.extend(
+            callSet.getId() for callSet in self.variantSet.getCallSets())
+        variants = []
+        while True:
+            variantsData = self.sendSearchRequest(
+                '/variants/search', request, protocol.SearchVariantsResponse)
+            variants.extend(variantsData.variants)
+            if variantsData.next_page_token == "":
+                break
+            request.page_token = variantsData.next_page_token
+        self.assertGreater(len(variants), 0)
+        request.ClearField("page_token")
+        path = '/variants/summary'
+        request.page_size = 2
+        summaries = []
+        while True:
+            response = self.sendJsonPostRequest(
+                path, protocol.toJson(request))
+            self.assertEqual(200, response.status_code)
+            responseData = json.loads(response.data)
+            self.assertLessEqual(len(responseData["variantSummaries"]), 2)
+            summaries.extend(responseData["variantSummaries"])
+            if responseData["nextPageToken"] == "":
+                break
+            request.page_token = responseData["nextPageToken"]
+        self.assertEqual(len(summaries), len(variants))
+        for variant, summary in zip(variants, summaries):
+            self.assertEqual(summary["variantId"], variant.id)
+            alleles = [
+                allele for call in variant.calls for allele in call.genotype]
+            self.assertEqual(summary["callCount"], len(variant.calls))
+            self.assertEqual(summary["alleleNumber"], len(alleles))
+            self.assertEqual(summary["alleleCounts"], [alleles.count(1)])
+            self.assertAlmostEqual(
+                summary["alleleFrequencies"][0],
+                alleles.count(1) / len(alleles))
+        request.ClearField("page_token")
+        request.ClearField("call_set_ids")
+        request.call_set_ids.append("notACallSet")
+        response = self.sendJsonPostRequest(path, protocol.toJson(request))
+        self.assertEqual(404, response.status_code)
+
     def testVariantAnnotationSetsSearch(self):
         self.assertIsNotNone(self.variantAnnotationSet)
 
@@ -755,6 +844,41 @@ class TestSimulatedStack(unittest.TestCase):
                                          SearchVariantAnnotationsResponse)
         self.assertGreater(len(responseData.variant_annotations), 0)
 
+        # Without an ontology only the requested effects themselves match
+        jsonDict = protocol.toJsonDict(request)
+        jsonDict["includeDescendants"] = True
+        response = self.sendJsonPostRequest(path, json.dumps(jsonDict))
+        self.assertEqual(200, response.status_code)
+        descendantsData = protocol.fromJson(
+            response.data, protocol.SearchVariantAnnotationsResponse)
+        self.assertEqual(
+            [annotation.id for annotation in
+             descendantsData.variant_annotations],
+            [annotation.id for annotation in responseData.variant_annotations])
+        jsonDict["includeDescendants"] = "yes"
+        response = self.sendJsonPostRequest(path, json.dumps(jsonDict))
+        self.assertEqual(400, response.status_code)
+
+        jsonDict = protocol.toJsonDict(request)
+        jsonDict["featureIds"] = ["E4TB33F"]
+        response = self.sendJsonPostRequest(path, json.dumps(jsonDict))
+        self.assertEqual(200, response.status_code)
+        featuresData = protocol.fromJson(
+            response.data, protocol.SearchVariantAnnotationsResponse)
+        self.assertEqual(
+            [annotation.id for annotation in
+             featuresData.variant_annotations],
+            [annotation.id for annotation in responseData.variant_annotations])
+        jsonDict["featureIds"] = ["NOT_A_FEATURE"]
+        response = self.sendJsonPostRequest(path, json.dumps(jsonDict))
+        self.assertEqual(200, response.status_code)
+        featuresData = protocol.fromJson(
+            response.data, protocol.SearchVariantAnnotationsResponse)
+        self.assertEqual(len(featuresData.variant_annotations), 0)
+        jsonDict["featureIds"] = "E4TB33F"
+        response = self.sendJsonPostRequest(path, json.dumps(jsonDict))
+        self.assertEqual(400, response.status_code)
+
     def testGetFeatureSet(self):
         path = "/featuresets"
         for dataset in self.dataRepo.getDatasets():
@@ -5,6 +5,8 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
+import struct
 import unittest
 import logging
 
@@ -520,6 +522,39 @@ class TestFrontend(unittest.TestCase):
             "rna_quantification_sets",
             self.rnaQuantificationSetId)
 
+    def testExpressionMatrix(self):
+        path = "/expressionlevels/matrix"
+        request = {"rnaQuantificationSetId": self.rnaQuantificationSetId}
+        headers = {'Content-type': 'application/json'}
+        response = self.app.post(
+            path, headers=headers, data=json.dumps(request))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(frontend.MIMETYPE, response.mimetype)
+        matrix = json.loads(response.data)
+        self.assertIn(
+            self.rnaQuantificationId, matrix["rnaQuantificationIds"])
+        self.assertEqual(
+            len(matrix["rnaQuantificationIds"]), len(matrix["values"]))
+        for row in matrix["values"]:
+            self.assertEqual(len(matrix["featureIds"]), len(row))
+        headers["Accept"] = frontend.BINARY_MIMETYPE
+        response = self.app.post(
+            path, headers=headers, data=json.dumps(request))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(frontend.BINARY_MIMETYPE, response.mimetype)
+        headerLength, = struct.unpack_from(b"<I", response.data)
+        header = json.loads(response.data[4:4 + headerLength])
+        self.assertEqual(
+            header["featureIds"], matrix["featureIds"])
+        self.assertEqual(
+            len(response.data),
+            4 + headerLength +
+            4 * len(matrix["values"]) * len(matrix["featureIds"]))
+        request["threshold"] = "high"
+        response = self.app.post(
+            path, headers=headers, data=json.dumps(request))
+        self.assertEqual(400, response.status_code)
+
     def testNoCallback(self):
         response = self.sendGetRequest("callback")
         self.assertEqual(